@@ -2,11 +2,45 @@
 import pandas as pd
 import numpy as np
 
+import diagnostics
+from covariance import CovarianceEngine
+from panel import valid_bounds
+from rolling import RollingMoments
+
+@diagnostics.timed("returns")
 def calculate_returns(prices_data: pd.DataFrame) -> pd.DataFrame:
-    return prices_data.pct_change().dropna()
+    # Ragged panels (see panel.py): NaN outside each ticker's history; a
+    # missing day inside it is NaN and the next return spans the gap
+    missing = prices_data.isna().to_numpy()
+    first, last = valid_bounds(prices_data)
+    if (missing.sum(axis=0) == len(prices_data) - np.maximum(last - first + 1, 0)).all():
+        # NaN only before / after each history: nothing to span
+        return prices_data.pct_change(fill_method=None).dropna(how="all")
+    returns = prices_data.ffill().pct_change(fill_method=None)
+    return returns.mask(missing).dropna(how="all")
 
+@diagnostics.timed("rolling_vol")
 def calculate_volatility(returns_data: pd.DataFrame, window: int = 5) -> pd.DataFrame:
     return returns_data.rolling(window=window).std()
 
+@diagnostics.timed("cumulative")
 def calculate_cumulative_return(returns_data: pd.DataFrame):
     return (returns_data + 1).cumprod()
+
+@diagnostics.timed("rolling_moments")
+def calculate_rolling_moments(returns_data: pd.DataFrame, windows=(5, 21, 63), ewma_lambda=None) -> RollingMoments:
+    """
+    Rolling std for several windows in one pass (see rolling.py). Use
+    .volatility(window) to switch windows without recomputing, and
+    .append()/.extend() to add new days without touching history.
+    """
+    return RollingMoments.from_returns(returns_data, windows=windows, ewma_lambda=ewma_lambda)
+
+@diagnostics.timed("covariance")
+def calculate_covariance(returns_data: pd.DataFrame, method: str = "sample", ewma_lambda: float = 0.94) -> CovarianceEngine:
+    """
+    Covariance engine over the panel (see covariance.py): "sample", "ewma" or
+    "ledoit_wolf". Use .covariance(columns)/.correlation(columns) for any
+    submatrix, and .extend()/.retire() to move the window by whole days.
+    """
+    return CovarianceEngine.from_returns(returns_data, method=method, ewma_lambda=ewma_lambda)
@@ -1,15 +1,41 @@
 # app.py
 from __future__ import annotations
-import numpy as np
+import json
+import uuid
+
 import pandas as pd
 import streamlit as st
-import statsmodels.api as sm
 
-from utils import closing_prices, ff3_factors
-from analysis import calculate_returns, calculate_volatility, calculate_cumulative_return
-from portfolios import calculate_equal_weighted_portfolio
+import client
+import diagnostics
+import metadata
+from analysis import calculate_volatility, calculate_cumulative_return
+# ANALYTICS_SERVER set: results come from the analytics service (server.py), same signatures,
+# and the local pipeline cache and warm-up are not loaded
+if client.SERVER_URL:
+    # The service answers only the requested columns, as compact mode computes only those
+    COMPACT = True
+    from client import (
+        cached_closing_prices, cached_prices_range, cached_returns,
+        cached_cumulative_return, cached_volatility, cached_ff3_factors, cached_summary_stats,
+        cached_factor_loadings, cached_portfolio_engine, cached_horizon_index, cached_walk_forward,
+        cached_risk_simulation, cached_walk_forward_simulation, cached_covariance,
+    )
+else:
+    import warmup
+    from cache import cache_stats, COMPACT
+    from cache import (
+        cached_closing_prices, cached_prices_range, cached_returns,
+        cached_cumulative_return, cached_volatility, cached_ff3_factors, cached_summary_stats,
+        cached_factor_loadings, cached_portfolio_engine, cached_horizon_index, cached_walk_forward,
+        cached_risk_simulation, cached_walk_forward_simulation, cached_covariance,
+    )
+from factor_regression import factor_loadings
+from horizons import TIME_RANGE_PRESETS
+from panel import valid_bounds
+from portfolios import risk_portfolios_static, universe, volatility_buckets
 from visuals import plot_profit, plot_volatility, plot_returns
-from profiles import build_summary_table  # company info removed
+from profiles import format_company_table, format_summary_table
 
 # ---------------- UI: title + dropdown width fix ----------------
 st.title("Equity Risk & Factor Explorer")
@@ -25,52 +51,38 @@ st.markdown(
 )
 
 # ---------------- Helpers: time-range & rolling-vol presets ----------------
-TIME_RANGE_PRESETS = ["YTD", "3M", "6M", "1Y", "3Y", "Max"]
 ROLLING_VOL_CHOICES = {
     "Weekly (5 trading days)": 5,
     "Monthly (21 trading days)": 21,
     "Quarterly (63 trading days)": 63,
 }  # Yearly removed
+WEIGHTING_CHOICES = {"Equal weight": "equal", "Inverse volatility": "inverse_vol"}
+REBALANCE_CHOICES = {"Daily": None, "Monthly": "M", "Quarterly": "Q"}
+RERANK_CHOICES = {"Monthly": "M", "Quarterly": "Q"}
+LOOKBACK_CHOICES = {"3 months (63 days)": 63, "6 months (126 days)": 126, "1 year (252 days)": 252}
+SIM_METHODS = {"Block bootstrap": "bootstrap", "Multivariate normal": "normal", "Student-t (5 df)": "student_t"}
+SIM_HORIZONS = {"1 day": 1, "1 week": 5, "1 month": 21, "1 quarter": 63}
+SIM_PATHS = 20_000
+COV_METHODS = {"Sample": "sample", "EWMA (λ = 0.94)": "ewma", "Ledoit-Wolf shrinkage": "ledoit_wolf"}
 
-def date_mask(index: pd.DatetimeIndex, preset: str) -> pd.Series:
-    """Return a boolean mask for the given time range preset."""
-    if index.empty:
-        return pd.Series([], dtype=bool)
-    end = index.max()
-    if preset == "Max":
-        start = index.min()
-    elif preset == "YTD":
-        start = pd.Timestamp(end.year, 1, 1)
-    elif preset == "3M":
-        start = end - pd.DateOffset(months=3)
-    elif preset == "6M":
-        start = end - pd.DateOffset(months=6)
-    elif preset == "1Y":
-        start = end - pd.DateOffset(years=1)
-    elif preset == "3Y":
-        start = end - pd.DateOffset(years=3)
-    else:
-        start = index.min()
-    return (index >= start) & (index <= end)
-
-#STATIC RISKPORTFOLIOS
-risk_portfolios_static = {
-    1: ["JNJ", "PG", "KO", "WMT", "PEP"],
-    2: ["VZ", "XOM", "CVX", "SO", "NEE"],
-    3: ["MRK", "ABT", "D", "DUK", "LLY"],
-    4: ["UNH", "HD", "MA", "V", "LOW"],
-    5: ["AAPL", "MSFT", "GOOG", "AMZN", "META"],
-    6: ["JPM", "BA", "CAT", "AXP", "IBM"],
-    7: ["QCOM", "INTC", "ORCL", "UPS", "CSCO"],
-    8: ["TSLA", "NVDA", "SHOP", "RBLX", "SQ"],
-    9: ["ARKK", "PLTR", "CRWD", "DOCU", "AFRM"],
-    10: ["COIN", "AMC", "GME", "FUBO", "BBBY"],
-}
-mag7 = ["AAPL", "MSFT", "TSLA", "GOOG", "AMZN", "META", "NVDA"]
-universe = sorted(set(sum(risk_portfolios_static.values(), []) + mag7 + ["SP500"]))
+# Hidden diagnostics: PIPELINE_DIAGNOSTICS=1 for every session, ?diagnostics=1 for this session only
+if st.query_params.get("diagnostics") == "1":
+    st.session_state["diagnostics"] = True
+diag_session = st.session_state.setdefault("diagnostics_session", uuid.uuid4().hex)
+diagnostics.begin_run("app", session=diag_session, force=st.session_state.get("diagnostics", False))
+
+# Precompute the preset x window x risk-score grid in the background (once per
+# data version); the analytics service warms its own cache. Streamlit runs this
+# script only when a session connects, so this is as early as the app can start
+# it: before the first session loads anything. Warm at server start with server.py.
+if not client.SERVER_URL:
+    warmup.ensure_started(
+        universe, defaults=(TIME_RANGE_PRESETS[5], ROLLING_VOL_CHOICES["Weekly (5 trading days)"], 5),
+        sim_args=dict(method="bootstrap", horizon=SIM_HORIZONS["1 month"], n_paths=SIM_PATHS, seed=0),
+    )
 
 #LOAD DATA
-prices_full = closing_prices(universe)
+prices_full = cached_closing_prices(universe)
 if prices_full.empty:
     st.error("No price data loaded (even after attempting downloads). Check tickers or internet connection.")
     st.stop()
@@ -79,65 +91,108 @@ missing_any = prices_full.attrs.get("missing", [])
 if missing_any:
     st.info("Some tickers could not be loaded and will be skipped: " + ", ".join(missing_any))
 
-tab_analysis, tab_profiles = st.tabs(["Analysis", "Stock Profiles"])
+tab_names = ["Analysis", "Stock Profiles"] + (["Diagnostics"] if diagnostics.enabled() else [])
+tab_analysis, tab_profiles, *tab_diagnostics = st.tabs(tab_names)
 
 #ANALYSIS TAB
 with tab_analysis:
     st.subheader("Time horizon & risk tolerance")
     col1, col2, col3 = st.columns([1, 1.8, 2])
     with col1:
-        time_range = st.selectbox("Time range", TIME_RANGE_PRESETS, index=5)
+        time_range = st.selectbox("Time range", TIME_RANGE_PRESETS + ["Custom"], index=5)
     with col2:
         vol_label = st.selectbox("Rolling volatility window", list(ROLLING_VOL_CHOICES.keys()), index=0)
         vol_window = ROLLING_VOL_CHOICES[vol_label]
     with col3:
         risk_score = st.slider("Risk score (1 = lowest risk, 10 = highest)", 1, 10, 5)
+    if time_range != "Custom" and not client.SERVER_URL:
+        warmup.record_use(time_range, vol_window, risk_score)
+    warm = {} if client.SERVER_URL else warmup.progress()
+    if warm.get("state") == "running":
+        st.caption(f"Warming up other views in the background: {warm['done'] + warm['skipped']}/{warm['total']}")
 
     mode = st.radio(
         "Portfolio mode",
-        ["Predefined (static)", "Data-driven (by volatility)"],
+        ["Predefined (static)", "Data-driven (by volatility)", "Walk-forward (out-of-sample)"],
         index=0,
         horizontal=True,
-        help="Static = fixed buckets in code; Data-driven = deciles by realized volatility over the selected time range.",
+        help="Static = fixed buckets in code; Data-driven = deciles by realized volatility over the selected time range; "
+             "Walk-forward = deciles re-ranked at each rebalance date on trailing volatility only.",
     )
+    col_w, col_r = st.columns(2)
+    with col_w:
+        weighting = WEIGHTING_CHOICES[st.selectbox("Portfolio weighting", list(WEIGHTING_CHOICES), index=0)]
+    with col_r:
+        rebalance = REBALANCE_CHOICES[st.selectbox(
+            "Rebalancing", list(REBALANCE_CHOICES), index=0,
+            help="Daily = back to target weights every day; otherwise weights drift with prices between rebalances.",
+        )]
 
-    mask = date_mask(prices_full.index, time_range)
-    prices = prices_full.loc[mask]
-    if prices.empty or prices.shape[0] < 2:
+    horizons = cached_horizon_index(universe)
+    if time_range == "Custom":
+        custom = st.date_input(
+            "Custom range", value=(prices_full.index[0].date(), prices_full.index[-1].date()),
+            min_value=prices_full.index[0].date(), max_value=prices_full.index[-1].date(),
+        )
+        # A 1-tuple while the user is still picking the end date
+        custom_start, custom_end = (list(custom) + [None])[:2]
+        lo, hi = horizons.bounds(start=custom_start, end=custom_end)
+    else:
+        lo, hi = horizons.bounds(time_range)
+    if hi - lo < 2:
         st.warning("Not enough data in the selected time range.")
         st.stop()
 
+    # Cached across reruns and sessions; treat these frames as read-only
+    range_start, range_end = horizons.index[lo], horizons.index[hi - 1]
+    prices = cached_prices_range(universe, range_start, range_end)
     tickers_all = prices.columns.tolist()
-    returns = calculate_returns(prices)
-    profit = calculate_cumulative_return(returns)
-    volatility = calculate_volatility(returns, window=vol_window)
+    returns = cached_returns(universe, range_start, range_end)
+    # The panel is ragged: every ticker is a column, but some have no returns in this range
+    in_range = set(returns.columns[valid_bounds(returns)[1] >= 0])
 
     # PORTFOLIO/TICKERS SELECTION
     if mode == "Predefined (static)":
         selected_tickers = list(risk_portfolios_static[risk_score])
-        missing = [t for t in selected_tickers if t not in returns.columns]
-        if missing:
-            st.warning(f"Missing data for: {', '.join(missing)} — they will be skipped.")
-        selected_tickers = [t for t in selected_tickers if t in returns.columns]
+        missing = [t for t in selected_tickers if t not in in_range]
+        selected_tickers = [t for t in selected_tickers if t in in_range]
         if not selected_tickers:
             st.error("None of the tickers in this risk portfolio have data for the selected time range.")
             st.stop()
+        if missing:
+            st.warning(f"Missing data for: {', '.join(missing)} — they will be skipped.")
+    elif mode == "Walk-forward (out-of-sample)":
+        col_k, col_l = st.columns(2)
+        with col_k:
+            rerank = RERANK_CHOICES[st.selectbox("Re-rank every", list(RERANK_CHOICES), index=0)]
+        with col_l:
+            lookback = LOOKBACK_CHOICES[st.selectbox("Ranking lookback", list(LOOKBACK_CHOICES), index=2)]
+        # Ranked on the full loaded history so the first rebalance in the range has its lookback
+        wf_returns, membership = cached_walk_forward(
+            universe, lookback=lookback, rerank=rerank, scheme=weighting, rebalance=rebalance,
+        )
+        held = membership.loc[:range_end]
+        selected_tickers = held.columns[held.iloc[-1] == risk_score].tolist() if len(held) else []
+        if not selected_tickers or wf_returns[risk_score].reindex(returns.index).isna().all():
+            st.error("Not enough history before this time range to rank the universe. Try a shorter lookback.")
+            st.stop()
+
+        st.caption(
+            "Portfolio mode: Walk-forward deciles, re-ranked on trailing volatility at each rebalance date "
+            "and held out-of-sample. Tickers shown are the current holdings."
+        )
     else:
 
-        universe_driven = [t for t in returns.columns if t != "SP500"]
+        universe_driven = [t for t in returns.columns if t != "SP500" and t in in_range]
         if len(universe_driven) < 2:
             st.error("Need at least 2 tickers (ex-SP500) to form data-driven buckets.")
             st.stop()
 
-        vol_metric = returns[universe_driven].std(skipna=True) * np.sqrt(252)
-        vol_metric = vol_metric.dropna().sort_values()
-
-        if vol_metric.empty:
+        buckets = volatility_buckets(returns)
+        if not buckets:
             st.error("No valid volatility data to build data-driven buckets.")
             st.stop()
 
-        groups = np.array_split(vol_metric.index.to_numpy(), 10)
-        buckets = {i + 1: list(groups[i]) for i in range(10)}
         selected_tickers = buckets.get(risk_score, [])
         if not selected_tickers:
             st.error("Selected risk bucket is empty. Try a different time range.")
@@ -146,46 +201,115 @@ with tab_analysis:
         st.caption("Portfolio mode: Data-driven deciles by annualized realized volatility over the selected time range.")
 
     #PORTFOLIO SERIES
-    returns["RiskPortfolio"] = calculate_equal_weighted_portfolio(returns, selected_tickers)
-    volatility["RiskPortfolio"] = calculate_volatility(returns[["RiskPortfolio"]], window=vol_window)
-    profit["RiskPortfolio"] = calculate_cumulative_return(returns["RiskPortfolio"])
+    if mode == "Walk-forward (out-of-sample)":
+        portfolio_returns = wf_returns[risk_score].reindex(returns.index)
+    else:
+        engine = cached_portfolio_engine(universe, range_start, range_end)
+        portfolio_returns = engine.portfolio_returns(
+            {"RiskPortfolio": selected_tickers}, scheme=weighting, rebalance=rebalance,
+        )["RiskPortfolio"]
 
     selectable = tickers_all + ["RiskPortfolio"]
     chosen = st.multiselect("Display portfolio/stocks:", selectable, default=["RiskPortfolio"])
+    interactive = st.checkbox("Interactive charts", value=False, help="Zoomable charts instead of static images.")
 
     extras = [s for s in chosen if s != "RiskPortfolio"]
+    # Chart frames hold only the displayed columns; in compact mode the derived
+    # series are also computed only for those, and a service client only fetches those
+    lazy = extras if COMPACT else None
+    profit = cached_cumulative_return(universe, range_start, range_end, columns=lazy)[extras].assign(
+        RiskPortfolio=calculate_cumulative_return(portfolio_returns))
+    volatility = cached_volatility(universe, range_start, range_end, window=vol_window, columns=lazy)[extras].assign(
+        RiskPortfolio=calculate_volatility(portfolio_returns, window=vol_window))
+    shown_returns = returns[extras].assign(RiskPortfolio=portfolio_returns)
     base_str = ", ".join(selected_tickers) if selected_tickers else "(none)"
     title_text = f"{base_str} + {', '.join(extras)}" if extras else base_str
     st.markdown(f"### Portfolio/Stock(s) for Risk Score {risk_score} — {title_text}")
 
     st.subheader(f"Cumulative Return — {time_range}")
-    plot_profit(profit, chosen, title=f"Cumulative Return ({time_range})")
+    plot_profit(profit, chosen, title=f"Cumulative Return ({time_range})", interactive=interactive)
 
     st.subheader(f"Rolling Volatility — {vol_label}")
-    plot_volatility(volatility, chosen, title=f"Rolling Volatility ({vol_label})")
+    plot_volatility(volatility, chosen, title=f"Rolling Volatility ({vol_label})", interactive=interactive)
 
     st.subheader(f"Daily Returns — {time_range}")
-    plot_returns(returns, chosen, title=f"Daily Returns ({time_range})")
+    plot_returns(shown_returns, chosen, title=f"Daily Returns ({time_range})", interactive=interactive)
 
     #FAMA-FRENCH REGRESSION
     st.subheader(f"Fama-French 3-Factor Regression — {time_range}")
-    ff3 = ff3_factors()
-    ff3 = ff3.loc[returns.index.min():returns.index.max()]
-    if ff3.empty or returns.shape[0] < 30:
-        st.warning("Not enough overlapping data for regression in this time range.")
-    else:
-        returns_ff3 = returns.copy()
-        returns_ff3["RiskPortfolio"] = calculate_equal_weighted_portfolio(returns_ff3, selected_tickers)
-        combined = pd.concat([returns_ff3["RiskPortfolio"], ff3], axis=1, join="inner").dropna()
-        if combined.empty:
-            st.warning("Not enough overlapping data for regression.")
+    try:
+        ff3 = cached_ff3_factors()
+    except (OSError, ValueError, RuntimeError) as e:
+        # No local copy, no bundled snapshot and the download failed (or the
+        # analytics server could not load them): skip the section, keep the page
+        ff3 = None
+        st.warning(f"Fama-French factors could not be loaded: {e}")
+    if ff3 is not None:
+        ff3 = ff3.loc[returns.index.min():returns.index.max()]
+        if ff3.empty or returns.shape[0] < 30:
+            st.warning("Not enough overlapping data for regression in this time range.")
+        elif mode == "Walk-forward (out-of-sample)":
+            row = factor_loadings(portfolio_returns.to_frame("RiskPortfolio"), ff3)
+            if pd.isna(row.loc["RiskPortfolio", "Alpha"]):
+                st.warning("Not enough overlapping data for regression.")
+            else:
+                st.dataframe(row.style.format({"N": "{:.0f}", "R2": "{:.3f}"}, precision=4), use_container_width=True)
+        else:
+            # One batched solve for every ticker and bucket; the selected portfolio is one row
+            loadings = cached_factor_loadings(universe, range_start, range_end, scheme=weighting, rebalance=rebalance)
+            bucket_row = f"Static {risk_score}" if mode == "Predefined (static)" else f"Decile {risk_score}"
+            if bucket_row not in loadings.index or pd.isna(loadings.loc[bucket_row, "Alpha"]):
+                st.warning("Not enough overlapping data for regression.")
+            else:
+                row = loadings.loc[[bucket_row]].rename(index={bucket_row: "RiskPortfolio"})
+                st.dataframe(row.style.format({"N": "{:.0f}", "R2": "{:.3f}"}, precision=4), use_container_width=True)
+                with st.expander("Factor loadings — all tickers and buckets"):
+                    st.dataframe(loadings.style.format({"N": "{:.0f}", "R2": "{:.3f}"}, precision=4),
+                                 use_container_width=True)
+
+    #FORWARD RISK (SIMULATION)
+    st.subheader(f"Simulated Forward Risk — {time_range} history")
+    col_m, col_h = st.columns(2)
+    with col_m:
+        sim_method = SIM_METHODS[st.selectbox("Simulation model", list(SIM_METHODS), index=0)]
+    with col_h:
+        sim_label = st.selectbox("Risk horizon", list(SIM_HORIZONS), index=2)
+    sim_args = dict(method=sim_method, horizon=SIM_HORIZONS[sim_label], n_paths=SIM_PATHS, seed=0)
+    try:
+        if mode == "Walk-forward (out-of-sample)":
+            risk, _ = cached_walk_forward_simulation(universe, range_start, range_end, lookback=lookback,
+                                                     rerank=rerank, scheme=weighting, rebalance=rebalance, **sim_args)
         else:
-            combined = combined.rename(columns={"RiskPortfolio": "Portfolio"})
-            combined["Excess"] = combined["Portfolio"] - combined["RF"]
-            X = sm.add_constant(combined[["Mkt-RF", "SMB", "HML"]])
-            y = combined["Excess"]
-            model = sm.OLS(y, X).fit()
-            st.code(model.summary().as_text(), language="text")
+            sim_buckets = None if mode == "Predefined (static)" else buckets
+            risk, _ = cached_risk_simulation(universe, range_start, range_end, buckets=sim_buckets,
+                                             scheme=weighting, **sim_args)
+    except ValueError:
+        st.warning("Not enough data in this time range to simulate.")
+    else:
+        st.caption(f"{SIM_PATHS:,} seeded paths over {sim_label.lower()}, resampled from the selected time range. "
+                   "VaR/CVaR are losses; the selected risk score is in bold. "
+                   "N/A: the bucket has no returns in this range.")
+        st.dataframe(
+            risk.style.format("{:.2%}", na_rep="N/A").apply(
+                lambda row: ["font-weight: bold" if row.name == risk_score else ""] * len(row), axis=1),
+            use_container_width=True,
+        )
+
+    #CORRELATION
+    st.subheader(f"Correlation — {time_range}")
+    cov_method = COV_METHODS[st.selectbox("Covariance estimator", list(COV_METHODS), index=0)]
+    corr_cols = [c for c in dict.fromkeys(selected_tickers + extras) if c in in_range]
+    if len(corr_cols) < 2:
+        st.info("Select at least two tickers with data in this time range (portfolio holdings plus displayed "
+                "stocks) to see correlations.")
+    else:
+        # One engine per (range, estimator) for the whole universe; the table is a submatrix of it
+        cov_engine = cached_covariance(universe, range_start, range_end, method=cov_method)
+        corr = cov_engine.correlation(corr_cols)
+        if cov_method == "ledoit_wolf":
+            st.caption(f"Shrinkage intensity {cov_engine.shrinkage()[0]:.2f} towards a scaled identity.")
+        st.dataframe(corr.style.background_gradient(cmap="RdBu_r", vmin=-1, vmax=1).format("{:.2f}"),
+                     use_container_width=True)
 
 #STOCK PROFILES TAB
 with tab_profiles:
@@ -197,8 +321,76 @@ with tab_profiles:
     with col2:
         st.caption("Table uses the selected time range for Return, Annualized Volatility, and Max Drawdown.")
 
-    mask_h = date_mask(prices_full.index, horizon)
-    prices_h = prices_full.loc[mask_h]
-
-    table = build_summary_table(prices_h, horizon=horizon)
+    # Each ticker's stats use the horizon ending at its own last date, so the
+    # full panel gives the same table as the date-masked one
+    table = format_summary_table(cached_summary_stats(universe, horizon=horizon))
+    # Company info is read from the local metadata store; missing/stale tickers
+    # are fetched in the background and show up on a later rerun
+    info = metadata.store().get(table.index, fields=["name", "sector", "industry", "marketCap", "beta"])
+    table = format_company_table(info).join(table)
     st.dataframe(table, use_container_width=True)
+    meta = metadata.store().progress()
+    if meta["pending"]:
+        st.caption(f"Loading company info in the background ({meta['pending']} of {len(table)} tickers to go); "
+                   "rerun to update.")
+
+diagnostics.end_run(session=diag_session)
+
+#DIAGNOSTICS TAB (hidden unless enabled)
+if tab_diagnostics:
+    with tab_diagnostics[0]:
+        st.subheader("Pipeline diagnostics")
+        st.caption("Last reruns by stage (ms, top-level stages; 'Other' is the rest of the script). "
+                   "Nested stages and RSS changes are in the JSON export.")
+        recent = diagnostics.runs()
+        rows = []
+        for r in reversed(recent):
+            row = {"Started": pd.Timestamp(r["started"], unit="s"), "Complete": r["completed"],
+                   "Total": (r["seconds"] or 0.0) * 1000}
+            for s in r["stages"]:
+                if s["depth"] == 0:
+                    row[s["stage"]] = row.get(s["stage"], 0.0) + s["seconds"] * 1000
+            row["Other"] = row["Total"] - sum(v for k, v in row.items() if k not in ("Started", "Complete", "Total"))
+            rows.append(row)
+        if rows:
+            st.dataframe(pd.DataFrame(rows).set_index("Started").fillna(0.0).style.format(precision=1),
+                         use_container_width=True)
+
+        snap = diagnostics.snapshot()
+        counters = pd.DataFrame(snap["cache"]).T
+        if not counters.empty:
+            counters["Hit rate"] = counters["hits"] / (counters["hits"] + counters["misses"])
+            st.markdown("**Cache hits / misses by stage**")
+            st.dataframe(counters.style.format({"Hit rate": "{:.0%}"}), use_container_width=True)
+        if client.SERVER_URL:
+            # The pipeline cache and warm-up live in the analytics service; this process only keeps answers
+            api = client.client()
+            local = api.stats()
+            st.caption(f"Client: {local['entries']} kept answers, {local['mb']:.1f} MB, {local['hits']} hits, "
+                       f"{local['misses']} misses (data version {local['version']}).")
+            try:
+                remote = api.json("stats")
+            except (OSError, ValueError, RuntimeError) as e:
+                st.warning(f"Analytics service stats unavailable: {e}")
+            else:
+                st.markdown("**Cache warm-up (service)**")
+                st.json(remote.get("warmup", {}), expanded=False)
+                stats = remote["cache"]
+                st.caption(f"Service cache: {stats['entries']} entries, {stats['bytes'] / 2**20:.1f} of "
+                           f"{stats['max_bytes'] / 2**20:.0f} MB, {stats['evictions']} evictions; "
+                           f"{remote['api']['calls']} requests computed, {remote['api']['coalesced']} shared.")
+                snap["service"] = remote
+        else:
+            st.markdown("**Cache warm-up**")
+            st.json(warmup.progress(), expanded=False)
+            stats = cache_stats()
+            st.caption(f"Cache: {stats['entries']} entries, {stats['bytes'] / 2**20:.1f} of "
+                       f"{stats['max_bytes'] / 2**20:.0f} MB, {stats['evictions']} evictions.")
+
+        col_j, col_p = st.columns(2)
+        with col_j:
+            st.download_button("Download JSON", json.dumps(snap, indent=2, default=str),
+                               file_name="diagnostics.json", mime="application/json")
+        with col_p:
+            st.download_button("Download Prometheus text", diagnostics.prometheus_text(snap),
+                               file_name="diagnostics.prom", mime="text/plain")
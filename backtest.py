@@ -0,0 +1,139 @@
+# backtest.py
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+
+import diagnostics
+from portfolio_engine import _period_ids
+
+# Walk-forward volatility buckets.
+#
+# At every rebalance date the universe is re-ranked by realized volatility
+# over the previous `lookback` rows only (the rebalance day's own return is
+# not part of the window), split into n_buckets like
+# portfolios.volatility_buckets, and held until the next rebalance date. So
+# each bucket's returns are out-of-sample.
+#
+# No loop over dates. Window sums at the rebalance rows come from one
+# np.add.reduceat over the rebalance/window-start breakpoints. Ranking is
+# one argsort over (rebalances x tickers). Per-day bucket returns are one
+# np.bincount over (day, bucket) ids. Work is done in column chunks, so
+# peak memory stays at a few (days x chunk) arrays however wide the
+# universe is.
+
+SCHEMES = ("equal", "inverse_vol")
+
+
+def _window_vol(x: np.ndarray, rows: np.ndarray, lookback: int, min_periods: int) -> np.ndarray:
+    """Sample std of x[r - lookback:r] for each r in rows (NaN if < min_periods values)."""
+    n_rows, n = x.shape
+    lo = np.maximum(rows - lookback, 0)
+    # Cumulative sums are only needed at the window edges: block sums between
+    # consecutive edges, cumsummed, give them at every edge
+    edges = np.unique(np.r_[0, lo, rows])
+    edges = edges[edges < n_rows]
+    pos = np.r_[edges, n_rows]
+    first = np.argmax(~np.isnan(x), axis=0)
+    shift = np.nan_to_num(x[first, np.arange(n)])  # conditioning only; variance is shift-invariant
+    bad = np.isnan(x)
+    z = np.where(bad, 0.0, x - shift)
+
+    def at_edges(a: np.ndarray) -> np.ndarray:
+        return np.vstack([np.zeros((1, n)), np.cumsum(np.add.reduceat(a, edges, axis=0), axis=0)])
+
+    c1 = at_edges(z)
+    c2 = at_edges(z * z)
+    cn = at_edges((~bad).astype(np.float64))
+    i_hi = np.searchsorted(pos, rows)
+    i_lo = np.searchsorted(pos, lo)
+    s1 = c1[i_hi] - c1[i_lo]
+    s2 = c2[i_hi] - c2[i_lo]
+    cnt = cn[i_hi] - cn[i_lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = (s2 - s1 * s1 / cnt) / (cnt - 1)
+    vol = np.sqrt(np.maximum(var, 0.0))
+    vol[cnt < max(min_periods, 2)] = np.nan
+    return vol
+
+
+def _assign_buckets(vol: np.ndarray, n_buckets: int) -> np.ndarray:
+    """Bucket 0..n_buckets-1 per (rebalance, ticker) by vol rank, -1 if unranked; sizes as np.array_split."""
+    valid = ~np.isnan(vol)
+    n_valid = valid.sum(axis=1, keepdims=True)
+    order = np.argsort(np.where(valid, vol, np.inf), axis=1, kind="stable")
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.broadcast_to(np.arange(vol.shape[1]), vol.shape), axis=1)
+    # array_split: the first (n % k) buckets get one extra member
+    q, r = np.divmod(n_valid, n_buckets)
+    big = r * (q + 1)
+    bucket = np.where(rank < big, rank // (q + 1), r + (rank - big) // np.maximum(q, 1))
+    bucket[~valid] = -1
+    return bucket
+
+
+@diagnostics.timed("walk_forward")
+def walk_forward(returns: pd.DataFrame, n_buckets: int = 10, lookback: int = 252, rerank="M",
+                 scheme: str = "equal", rebalance=None, exclude=("SP500",), min_periods: int | None = None,
+                 chunk: int = 1024) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Out-of-sample returns of volatility buckets re-formed on a schedule.
+    rerank: "M"/"Q"/"Y" (first trading day of each period) or an int (every
+    n rows): the universe is re-ranked there on the previous `lookback`
+    rows (at least min_periods non-NaN, default lookback).
+    scheme: "equal" or "inverse_vol" (1/lookback vol) within each bucket.
+    rebalance: None resets to target weights daily; "M"/"Q"/"Y"/int lets
+    weights drift with prices and resets them at those dates and at every
+    re-rank (as PortfolioEngine.run).
+    Returns (bucket returns: dates x 1..n_buckets, NaN while a bucket is
+    empty; membership: rebalance dates x tickers, bucket number or 0).
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown weighting scheme {scheme!r}; choose from {SCHEMES}.")
+    min_periods = lookback if min_periods is None else min_periods
+    columns = [c for c in returns.columns if c not in exclude]
+    x = returns[columns].to_numpy(dtype=np.float64)
+    n_rows, n = x.shape
+    k = n_buckets
+
+    pid = _period_ids(returns.index, rerank)
+    starts = np.flatnonzero(np.r_[True, pid[1:] != pid[:-1]])
+    n_periods = len(starts)
+    vol = np.empty((n_periods, n))
+    for c in range(0, n, chunk):
+        vol[:, c:c + chunk] = _window_vol(x[:, c:c + chunk], starts, lookback, min_periods)
+
+    bucket = _assign_buckets(vol, k)
+    held = bucket >= 0
+    raw = np.where(held, 1.0 if scheme == "equal" else 1.0 / np.where(vol > 0, vol, np.nan), 0.0)
+    held &= np.isfinite(raw)
+    raw[~held] = 0.0
+    slot = np.arange(n_periods)[:, None] * k + np.where(held, bucket, 0)
+    totals = np.bincount(slot[held], weights=raw[held], minlength=n_periods * k)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weights = np.where(held, raw / totals[slot], 0.0)
+    empty = (totals.reshape(n_periods, k) == 0)[pid]            # days x buckets
+
+    if rebalance is not None:
+        reset = pd.factorize(pd.MultiIndex.from_arrays([pid, _period_ids(returns.index, rebalance)]))[0]
+    day_slot = np.arange(n_rows)[:, None] * k
+    acc = np.zeros(n_rows * k)
+    for c in range(0, n, chunk):
+        b = bucket[pid, c:c + chunk]
+        mask = b >= 0
+        r = np.nan_to_num(x[:, c:c + chunk])  # missing returns count as flat days for holders
+        if rebalance is not None:
+            r = pd.DataFrame(1.0 + r).groupby(reset).cumprod().to_numpy()
+        vals = weights[pid, c:c + chunk] * r
+        acc += np.bincount((day_slot + b)[mask], weights=vals[mask], minlength=n_rows * k)
+    out = acc.reshape(n_rows, k)
+    if rebalance is not None:
+        first = np.r_[True, reset[1:] != reset[:-1]]
+        prev = np.vstack([np.ones((1, k)), out[:-1]])
+        prev[first] = 1.0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = out / prev - 1.0
+    out[empty] = np.nan
+
+    bucket_returns = pd.DataFrame(out, index=returns.index, columns=range(1, k + 1))
+    membership = pd.DataFrame((bucket + 1).astype(np.int16), index=returns.index[starts], columns=columns)
+    return bucket_returns, membership
@@ -0,0 +1,56 @@
+# benchmarks/bench_csv_loader.py
+# Compare the original pandas-inference CSV reader with loaders.read_close
+# over every CSV in fixed_stock_data (or a folder given on the command line).
+#   python benchmarks/bench_csv_loader.py [DIR] [--repeat N]
+from __future__ import annotations
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import loaders  # noqa: E402
+from utils import DATA_DIR  # noqa: E402
+
+
+def legacy_read_close(csv_path: Path) -> pd.Series:
+    # utils._read_close_series before loaders.py: all columns, regex "$" strip,
+    # date format inferred per file
+    df = pd.read_csv(csv_path)
+    df["Date"] = pd.to_datetime(df["Date"])
+    df = df.set_index("Date").sort_index()
+    col = "Close/Last" if "Close/Last" in df.columns else "Close"
+    return pd.to_numeric(df[col].replace({r"\$": ""}, regex=True), errors="coerce").dropna()
+
+
+def best_of(fn, files, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for f in files:
+            fn(f)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("folder", nargs="?", type=Path, default=DATA_DIR)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    files = sorted(args.folder.glob("*.csv"))
+    legacy = best_of(legacy_read_close, files, args.repeat)
+    fast = best_of(loaders.read_close, files, args.repeat)
+    ohlcv = best_of(loaders.read_ohlcv, files, args.repeat)
+    print(f"{len(files)} files, best of {args.repeat}")
+    print(f"  legacy read_close : {legacy * 1000:8.1f} ms")
+    print(f"  loaders.read_close: {fast * 1000:8.1f} ms  ({legacy / fast:.1f}x)")
+    print(f"  loaders.read_ohlcv: {ohlcv * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
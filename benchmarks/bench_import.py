@@ -0,0 +1,111 @@
+# benchmarks/bench_import.py
+# Cold-start import cost of the app, from `python -X importtime` in a fresh
+# interpreter. app.py itself can't be imported outside Streamlit (it runs the
+# page), so the modules it imports are read from its import statements and
+# imported instead. Streamlit/pandas/numpy are paid by any Streamlit app and
+# are measured separately. What the app adds on top is checked against
+# TARGET_MS, and none of DEFERRED may be imported at startup (they are loaded
+# by the section that needs them).
+#   python benchmarks/bench_import.py                 # check the target
+#   python benchmarks/bench_import.py --top 30        # longer breakdown
+#   python benchmarks/bench_import.py --budget-ms 80  # tighter target
+# Exit status 1 if over target or a deferred module is imported eagerly.
+from __future__ import annotations
+import argparse
+import ast
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+APP = ROOT / "app.py"
+
+BASE_MODULES = ["streamlit", "pandas", "numpy"]
+# Heavy optional imports that must only load on first use
+DEFERRED = ["yfinance", "matplotlib", "scipy", "statsmodels", "requests"]
+# Import time the app's own modules may add on top of BASE_MODULES
+TARGET_MS = 150.0
+
+
+def app_imports(path: Path = APP) -> list[str]:
+    """Top-level modules imported by app.py (its own and third-party)."""
+    names = []
+    for node in ast.parse(path.read_text(encoding="utf-8")).body:
+        if isinstance(node, ast.Import):
+            names += [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module != "__future__":
+            names.append(node.module)
+    return list(dict.fromkeys(names))
+
+
+def import_times(modules: list[str]) -> dict[str, tuple[int, int]]:
+    """{module: (self us, cumulative us)} for importing modules in a fresh interpreter."""
+    code = "; ".join(f"import {m}" for m in modules)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+    out = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            out[parts[2].strip()] = (int(parts[0]), int(parts[1]))
+        except (IndexError, ValueError):
+            pass  # header line
+    return out
+
+
+def measure(repeat: int) -> dict:
+    """Median over `repeat` runs of the base and app import costs, plus the last run's breakdown."""
+    modules = app_imports()
+    base_ms, app_ms = [], []
+    for _ in range(repeat):
+        base = import_times(BASE_MODULES)
+        full = import_times(BASE_MODULES + modules)
+        extra = {k: v for k, v in full.items() if k not in base}
+        base_ms.append(sum(s for s, _ in base.values()) / 1000)
+        app_ms.append(sum(s for s, _ in extra.values()) / 1000)
+    top = sorted(extra.items(), key=lambda kv: -kv[1][1])
+    eager = sorted({m.split(".")[0] for m in full} & set(DEFERRED))
+    return {
+        "modules": modules,
+        "base_ms": round(statistics.median(base_ms), 1),
+        "app_ms": round(statistics.median(app_ms), 1),
+        "top": [{"module": k, "self_ms": s / 1000, "cumulative_ms": c / 1000} for k, (s, c) in top],
+        "eager_deferred": eager,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15, help="modules to list, by cumulative time")
+    ap.add_argument("--budget-ms", type=float, default=TARGET_MS)
+    ap.add_argument("--json", type=Path, help="also write the results here")
+    args = ap.parse_args(argv)
+
+    r = measure(args.repeat)
+    print(f"{' + '.join(BASE_MODULES)}: {r['base_ms']:.1f} ms")
+    print(f"app modules on top:  {r['app_ms']:.1f} ms (target {args.budget_ms:.0f} ms)")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for row in r["top"][:args.top]:
+        print(f"{row['cumulative_ms']:14.1f} {row['self_ms']:9.1f}  {row['module']}")
+    if args.json:
+        args.json.write_text(json.dumps(r, indent=2), encoding="utf-8")
+
+    failures = []
+    if r["app_ms"] > args.budget_ms:
+        failures.append(f"app import time {r['app_ms']:.1f} ms over target {args.budget_ms:.0f} ms")
+    if r["eager_deferred"]:
+        failures.append(f"imported at startup, should load on first use: {', '.join(r['eager_deferred'])}")
+    for f in failures:
+        print("REGRESSION", f)
+    if not failures:
+        print("OK: startup import cost within target.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+# benchmarks/bench_pipeline.py
+# Stage-by-stage timings and peak memory of the analysis pipeline on
+# synthetic universes (see synthetic.py), checked against baseline.json.
+# Runs offline: CSVs and factors are generated locally and downloads are off.
+#   python benchmarks/bench_pipeline.py                      # default scenarios, check baseline
+#   python benchmarks/bench_pipeline.py --scenario 10kx30y   # one scenario
+#   python benchmarks/bench_pipeline.py --update-baseline    # record new baseline numbers
+# Exit status 1 if any stage is slower / bigger than the baseline allows.
+from __future__ import annotations
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import price_store  # noqa: E402
+import utils  # noqa: E402
+from analysis import calculate_returns, calculate_volatility  # noqa: E402
+from factor_regression import factor_loadings  # noqa: E402
+from portfolios import calculate_equal_weighted_portfolio, volatility_buckets  # noqa: E402
+from profiles import build_summary_table  # noqa: E402
+from synthetic import generate_universe, synthetic_factors  # noqa: E402
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+# name: (tickers, years)
+SCENARIOS = {
+    "100x5y": (100, 5),
+    "1kx10y": (1000, 10),
+    "1kx30y": (1000, 30),
+    "10kx30y": (10000, 30),
+}
+DEFAULT_SCENARIOS = ["100x5y", "1kx10y"]
+
+STAGES = ["load", "align", "returns", "rolling_vol", "portfolio", "summary", "ff3"]
+
+
+def _stage_fns(data_dir: Path, store_dir: Path, tickers: list[str]):
+    def load(s):
+        # Cold build from the CSVs: drop the compiled store and the in-process copy and scan record,
+        # else sync() answers from memory and nothing is measured
+        shutil.rmtree(store_dir, ignore_errors=True)
+        with price_store._lock:
+            price_store._loaded.clear()
+            price_store._scanned.clear()
+        s["store"] = utils.price_store_snapshot()
+
+    def align(s):
+        s["prices"] = utils.closing_prices(tickers + ["SP500"], start_date=s["store"].dates[0])
+
+    def returns(s):
+        s["returns"] = calculate_returns(s["prices"])
+
+    def rolling_vol(s):
+        s["volatility"] = calculate_volatility(s["returns"], window=21)
+
+    def portfolio(s):
+        buckets = volatility_buckets(s["returns"])
+        s["portfolios"] = {k: calculate_equal_weighted_portfolio(s["returns"], v) for k, v in buckets.items()}
+
+    def summary(s):
+        s["summary"] = build_summary_table(s["prices"], "1Y")
+
+    def ff3(s):
+        s["ff3"] = factor_loadings(s["returns"], synthetic_factors(s["returns"].index))
+
+    return [("load", load), ("align", align), ("returns", returns), ("rolling_vol", rolling_vol),
+            ("portfolio", portfolio), ("summary", summary), ("ff3", ff3)]
+
+
+def run_scenario(name: str, work_dir: Path, repeat: int) -> dict:
+    n_tickers, years = SCENARIOS[name]
+    data_dir = work_dir / name / "csv"
+    store_dir = work_dir / name / "store"
+    t0 = time.perf_counter()
+    tickers = generate_universe(data_dir, n_tickers, years)
+    print(f"[{name}] {n_tickers} tickers x {years}y in {data_dir} ({time.perf_counter() - t0:.1f}s to prepare)")
+
+    utils.DATA_DIR, utils.STORE_DIR, utils.DOWNLOADS = data_dir, store_dir, False
+    stages = _stage_fns(data_dir, store_dir, tickers)
+
+    seconds = {stage: float("inf") for stage in STAGES}
+    for _ in range(repeat):
+        state: dict = {}
+        for stage, fn in stages:
+            t = time.perf_counter()
+            fn(state)
+            seconds[stage] = min(seconds[stage], time.perf_counter() - t)
+
+    # Separate pass for memory: tracemalloc slows allocation-heavy code down
+    peak = {}
+    state = {}
+    tracemalloc.start()
+    try:
+        for stage, fn in stages:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn(state)
+            peak[stage] = (tracemalloc.get_traced_memory()[1] - base) / 2**20
+    finally:
+        tracemalloc.stop()
+
+    shape = state["prices"].shape
+    result = {stage: {"seconds": round(seconds[stage], 4), "peak_mb": round(peak[stage], 2)} for stage in STAGES}
+    for stage in STAGES:
+        print(f"  {stage:12s} {seconds[stage] * 1000:10.1f} ms  {peak[stage]:9.1f} MB")
+    print(f"  panel {shape[0]} x {shape[1]}")
+    return result
+
+
+def compare(results: dict, baseline: dict, time_tol: float, mem_tol: float,
+            min_seconds: float = 0.05, min_mb: float = 1.0) -> list[str]:
+    """Regressions as messages; small absolute differences are ignored as noise."""
+    failures = []
+    for name, stages in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            print(f"[{name}] no baseline, not checked")
+            continue
+        for stage, cur in stages.items():
+            ref = base.get(stage)
+            if ref is None:
+                continue
+            if cur["seconds"] > ref["seconds"] * time_tol and cur["seconds"] - ref["seconds"] > min_seconds:
+                failures.append(f"{name}/{stage}: {cur['seconds']:.3f}s vs baseline {ref['seconds']:.3f}s")
+            if cur["peak_mb"] > ref["peak_mb"] * mem_tol and cur["peak_mb"] - ref["peak_mb"] > min_mb:
+                failures.append(f"{name}/{stage}: {cur['peak_mb']:.1f}MB vs baseline {ref['peak_mb']:.1f}MB")
+    return failures
+
+
+def _environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(terse=True),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenario", nargs="+", choices=sorted(SCENARIOS), default=DEFAULT_SCENARIOS)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--work-dir", type=Path, default=Path(tempfile.gettempdir()) / "pipeline-bench")
+    ap.add_argument("--baseline", type=Path, default=BASELINE)
+    ap.add_argument("--time-tol", type=float, default=1.5, help="allowed slowdown factor per stage")
+    ap.add_argument("--mem-tol", type=float, default=1.25, help="allowed peak-memory growth factor per stage")
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--json", type=Path, help="also write this run's results here")
+    args = ap.parse_args(argv)
+
+    results = {name: run_scenario(name, args.work_dir, args.repeat) for name in args.scenario}
+    run = {"environment": _environment(), "scenarios": results}
+    if args.json:
+        args.json.write_text(json.dumps(run, indent=2), encoding="utf-8")
+
+    try:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        baseline = {"scenarios": {}}
+
+    if args.update_baseline:
+        baseline["environment"] = run["environment"]
+        baseline.setdefault("scenarios", {}).update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if baseline.get("environment") and baseline["environment"] != run["environment"]:
+        print(f"Note: baseline recorded on {baseline['environment']}; timings may not be comparable.")
+    failures = compare(results, baseline, args.time_tol, args.mem_tol)
+    for f in failures:
+        print("REGRESSION", f)
+    if not failures:
+        print("OK: no stage regressed against the baseline.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+# benchmarks/bench_server.py
+# Load test of the analytics service (server.py) on one machine. Starts the
+# server as a subprocess on the repo's price data (downloads off, no warm-up)
+# unless --url points at a running one, then:
+#   1. coalescing: --bursts times, every client sends the same not-yet-cached
+#      request at once; the server should compute each burst once
+#   2. load: for each --clients level, that many threads send requests drawn
+#      from the app's views (returns, rolling vol, bucket portfolios, summary
+#      table, FF3 loadings over the time presets) through client.py
+# Reports throughput, latency percentiles, response size and the server's
+# resident memory after each level (Linux, spawned server only): memory
+# should stay flat as clients are added, since they all share one panel.
+#   python benchmarks/bench_server.py                        # 1 4 16 64 clients
+#   python benchmarks/bench_server.py --clients 8 32 --requests 100
+#   python benchmarks/bench_server.py --format json          # without Arrow
+#   python benchmarks/bench_server.py --url http://127.0.0.1:8765
+# Exit status 1 if a burst was computed more than once, a request failed, or
+# p95 latency is over --budget-p95-ms (when given).
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from client import AnalyticsClient  # noqa: E402
+from horizons import TIME_RANGE_PRESETS, HorizonIndex  # noqa: E402
+
+WINDOWS = (5, 21, 63)
+SCHEMES = ("equal", "inverse_vol")
+REBALANCE = (None, "M")
+
+
+def start_server(timeout: float = 120.0) -> tuple[subprocess.Popen, str]:
+    env = dict(os.environ, PRICE_DOWNLOADS="0", METADATA_OFFLINE="1", PIPELINE_WARMUP="0")
+    proc = subprocess.Popen([sys.executable, str(ROOT / "server.py"), "--port", "0", "--no-warmup"], cwd=ROOT,
+                            env=env, stdout=subprocess.PIPE, text=True)
+    deadline = time.monotonic() + timeout
+    for line in proc.stdout:
+        if line.startswith("Serving"):
+            return proc, line.split()[-1]
+        if time.monotonic() > deadline:
+            break
+    proc.kill()
+    raise RuntimeError("analytics server did not start")
+
+
+def rss_mb(pid: int | None) -> float | None:
+    if pid is None:
+        return None
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def request_mix(index) -> list[tuple[str, dict]]:
+    """(endpoint, params) for the app's views over every time preset."""
+    horizons = HorizonIndex(index)
+    mix = []
+    for preset in TIME_RANGE_PRESETS:
+        lo, hi = horizons.bounds(preset)
+        if hi - lo < 30:
+            continue
+        span = dict(start=horizons.index[lo], end=horizons.index[hi - 1])
+        mix.append(("returns", span))
+        mix += [("volatility", dict(span, window=w)) for w in WINDOWS]
+        for scheme in SCHEMES:
+            for rebalance in REBALANCE:
+                mix.append(("portfolios", dict(span, buckets="all", scheme=scheme, rebalance=rebalance)))
+                mix.append(("ff3_loadings", dict(span, scheme=scheme, rebalance=rebalance)))
+        mix.append(("summary", dict(horizon=preset)))
+    return mix
+
+
+def _fire(api: AnalyticsClient, jobs: list[tuple[str, dict]], out: list, errors: list, barrier=None) -> None:
+    if barrier is not None:
+        barrier.wait()
+    for endpoint, params in jobs:
+        t = time.perf_counter()
+        try:
+            df = api.frame(endpoint, **params)
+        except Exception as e:
+            errors.append(f"{endpoint}: {e}")
+            continue
+        out.append((time.perf_counter() - t, int(df.memory_usage(index=True).sum())))
+
+
+def run_threads(api: AnalyticsClient, per_thread: list[list], barrier: bool = False) -> tuple[list, list, float]:
+    out, errors = [], []
+    gate = threading.Barrier(len(per_thread)) if barrier else None
+    threads = [threading.Thread(target=_fire, args=(api, jobs, out, errors, gate)) for jobs in per_thread]
+    t = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return out, errors, time.perf_counter() - t
+
+
+def bursts(api: AnalyticsClient, index, n_bursts: int, clients: int, rng) -> dict:
+    """Same cold request from every client at once; server computations per burst."""
+    before = api.json("stats")["api"]
+    errors = []
+    for start in rng.choice(len(index) // 2, size=n_bursts, replace=False):
+        # A start date no preset uses, so the request is not cached yet
+        job = ("ff3_loadings", dict(start=index[int(start)], end=index[-1], scheme="inverse_vol", rebalance="M"))
+        errors += run_threads(api, [[job]] * clients, barrier=True)[1]
+    after = api.json("stats")["api"]
+    return {"bursts": n_bursts, "clients": clients, "computed": after["calls"] - before["calls"],
+            "coalesced": after["coalesced"] - before["coalesced"], "errors": errors}
+
+
+def load(api: AnalyticsClient, mix: list, clients: int, requests: int, rng, pid) -> dict:
+    picks = rng.integers(len(mix), size=(clients, requests))
+    out, errors, seconds = run_threads(api, [[mix[i] for i in row] for row in picks])
+    ms = np.array([s for s, _ in out]) * 1000
+    pct = (lambda q: round(float(np.percentile(ms, q)), 1)) if len(ms) else (lambda q: float("nan"))
+    return {
+        "clients": clients, "requests": len(out), "errors": errors, "seconds": round(seconds, 3),
+        "req_per_s": round(len(out) / seconds, 1) if seconds else 0.0,
+        "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99),
+        "frame_kb": round(statistics.mean(b for _, b in out) / 1024, 1) if out else 0.0,
+        "server_rss_mb": rss_mb(pid),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", help="use a running server instead of starting one")
+    ap.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16, 64])
+    ap.add_argument("--requests", type=int, default=40, help="requests per client and level")
+    ap.add_argument("--bursts", type=int, default=5)
+    ap.add_argument("--format", choices=["arrow", "json"], default="arrow")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--budget-p95-ms", type=float, help="fail if any level's p95 latency is over this")
+    ap.add_argument("--json", type=Path, help="also write the results here")
+    args = ap.parse_args(argv)
+
+    proc, url = (None, args.url) if args.url else start_server()
+    pid = None if proc is None else proc.pid
+    try:
+        # Client-side frame cache off: every request should reach the server
+        api = AnalyticsClient(url, arrow=args.format == "arrow", cache_mb=0)
+        rng = np.random.default_rng(args.seed)
+        index = api.frame("prices", columns=[]).index
+        mix = request_mix(index)
+        print(f"server {url}, {len(index)} days, {len(mix)} distinct requests, {args.format} responses")
+        print(f"server RSS after loading the panel: {rss_mb(pid) or float('nan'):.0f} MB")
+
+        burst = bursts(api, index, args.bursts, max(args.clients), rng)
+        print(f"coalescing: {burst['bursts']} bursts x {burst['clients']} identical requests -> "
+              f"{burst['computed']} computed, {burst['coalesced']} shared")
+
+        levels = []
+        print(f"{'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'frame KB':>9} {'RSS MB':>7}")
+        for clients in args.clients:
+            r = load(api, mix, clients, args.requests, rng, pid)
+            levels.append(r)
+            rss = "n/a" if r["server_rss_mb"] is None else f"{r['server_rss_mb']:.0f}"
+            print(f"{clients:7d} {r['req_per_s']:8.1f} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['p99_ms']:8.1f} "
+                  f"{r['frame_kb']:9.1f} {rss:>7}")
+        stats = api.json("stats")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    if args.json:
+        args.json.write_text(json.dumps({"url": url, "format": args.format, "bursts": burst, "levels": levels,
+                                         "server": stats}, indent=2, default=str), encoding="utf-8")
+
+    failures = []
+    if burst["computed"] > burst["bursts"]:
+        failures.append(f"{burst['computed']} computations for {burst['bursts']} bursts of identical requests")
+    for r in [burst] + levels:
+        failures += [f"request failed: {e}" for e in r["errors"][:3]]
+    if args.budget_p95_ms is not None:
+        failures += [f"{r['clients']} clients: p95 {r['p95_ms']:.1f} ms over {args.budget_p95_ms:.0f} ms"
+                     for r in levels if r["p95_ms"] > args.budget_p95_ms]
+    for f in failures:
+        print("REGRESSION", f)
+    if not failures:
+        print("OK: identical requests coalesced, no failed requests.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
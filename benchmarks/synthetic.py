@@ -0,0 +1,105 @@
+# benchmarks/synthetic.py
+# Synthetic price universes for the benchmarks: per-ticker CSVs in the same
+# two layouts as fixed_stock_data (see loaders.py), alternating by ticker,
+# plus matching daily factor returns. Deterministic for a given seed.
+from __future__ import annotations
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+NASDAQ_HEADER = "Date,Close/Last,Volume,Open,High,Low"
+YAHOO_HEADER = "Date,Close,High,Low,Open,Volume"
+
+
+def trading_days(years: int, end="2025-05-30") -> pd.DatetimeIndex:
+    return pd.bdate_range(end=pd.Timestamp(end), periods=int(years * 252), name="Date")
+
+
+def _ohlcv(rng: np.random.Generator, n: int) -> dict[str, np.ndarray]:
+    vol = rng.uniform(0.1, 0.8) / np.sqrt(252)
+    close = rng.uniform(5, 500) * np.exp(np.cumsum(rng.normal(0.0002, vol, n)))
+    open_ = np.r_[close[0], close[:-1]] * (1 + rng.normal(0, vol / 4, n))
+    spread = np.abs(rng.normal(0, vol / 2, n))
+    return {
+        "Open": open_,
+        "High": np.maximum(open_, close) * (1 + spread),
+        "Low": np.minimum(open_, close) * (1 - spread),
+        "Close": close,
+        "Volume": rng.integers(10_000, 50_000_000, n),
+    }
+
+
+def _text(a: np.ndarray, prefix: str = "") -> np.ndarray:
+    s = a.round(4).astype(str) if a.dtype.kind == "f" else a.astype(str)
+    return np.char.add(prefix, s) if prefix else s
+
+
+def write_nasdaq(path: Path, dates: pd.DatetimeIndex, bars: dict, dollar: bool = True) -> None:
+    """Nasdaq export: MM/DD/YYYY, newest first, "$"-prefixed prices."""
+    p = "$" if dollar else ""
+    cols = [dates.strftime("%m/%d/%Y").to_numpy(dtype=str), _text(bars["Close"], p), _text(bars["Volume"]),
+            _text(bars["Open"], p), _text(bars["High"], p), _text(bars["Low"], p)]
+    rows = [",".join(r) for r in zip(*(c[::-1] for c in cols))]
+    path.write_text(NASDAQ_HEADER + "\n" + "\n".join(rows) + "\n", encoding="utf-8")
+
+
+def write_yahoo(path: Path, dates: pd.DatetimeIndex, bars: dict, ticker: str) -> None:
+    """yfinance export: ISO dates, oldest first, ticker row under the header."""
+    cols = [dates.strftime("%Y-%m-%d").to_numpy(dtype=str), _text(bars["Close"]), _text(bars["High"]),
+            _text(bars["Low"]), _text(bars["Open"]), _text(bars["Volume"])]
+    rows = [",".join(r) for r in zip(*cols)]
+    path.write_text(YAHOO_HEADER + "\n," + ",".join([ticker] * 5) + "\n" + "\n".join(rows) + "\n",
+                    encoding="utf-8")
+
+
+def generate_universe(folder: Path, n_tickers: int, years: int, seed: int = 0,
+                      late_share: float = 0.1) -> list[str]:
+    """
+    Write n_tickers CSVs (plus SP500) covering `years` of trading days into
+    folder, half in each layout. A late_share of tickers starts up to a third
+    of the way in (late listings). Reuses the folder if it already holds the
+    same universe. Returns the tickers.
+    """
+    folder = Path(folder)
+    spec = {"n_tickers": n_tickers, "years": years, "seed": seed, "late_share": late_share}
+    marker = folder / "universe.json"
+    tickers = [f"T{i:05d}" for i in range(n_tickers)]
+    try:
+        if json.loads(marker.read_text(encoding="utf-8")) == spec:
+            return tickers
+    except (OSError, ValueError):
+        pass
+
+    folder.mkdir(parents=True, exist_ok=True)
+    for old in folder.glob("*.csv"):
+        old.unlink()
+    dates = trading_days(years)
+    rng = np.random.default_rng(seed)
+    write_nasdaq(folder / "SP500.csv", dates, _ohlcv(rng, len(dates)), dollar=False)
+    for i, t in enumerate(tickers):
+        start = int(rng.integers(1, len(dates) // 3)) if rng.random() < late_share else 0
+        d = dates[start:]
+        bars = _ohlcv(rng, len(d))
+        if i % 2:
+            write_yahoo(folder / f"{t}.csv", d, bars, t)
+        else:
+            write_nasdaq(folder / f"{t}.csv", d, bars)
+    marker.write_text(json.dumps(spec), encoding="utf-8")
+    return tickers
+
+
+def synthetic_factors(index: pd.DatetimeIndex, seed: int = 0) -> pd.DataFrame:
+    """Daily Mkt-RF, SMB, HML and RF (decimals) on index, in the layout of utils.ff3_factors."""
+    rng = np.random.default_rng(seed)
+    n = len(index)
+    return pd.DataFrame(
+        {
+            "Mkt-RF": rng.normal(0.0003, 0.011, n),
+            "SMB": rng.normal(0.0, 0.005, n),
+            "HML": rng.normal(0.0, 0.006, n),
+            "RF": np.full(n, 0.0001),
+        },
+        index=pd.DatetimeIndex(index, name="Date"),
+    )
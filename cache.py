@@ -0,0 +1,486 @@
+# cache.py
+from __future__ import annotations
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import numpy as np
+import pandas as pd
+
+import diagnostics
+import factors
+from utils import closing_prices, ff3_factors, price_store_snapshot
+from analysis import (
+    calculate_returns, calculate_volatility, calculate_cumulative_return, calculate_rolling_moments,
+    calculate_covariance,
+)
+from backtest import walk_forward
+from factor_regression import factor_loadings
+from horizons import VOL_WINDOWS, HorizonIndex
+from portfolio_engine import PortfolioEngine
+from portfolios import all_buckets, risk_portfolios_static
+from profiles import SUMMARY_COLUMNS, summary_stats
+from risk_sim import simulate_returns
+
+# Process-wide cache for the load -> returns -> volatility pipeline.
+# Streamlit runs every session as a thread of one server process, so a module
+# level cache is shared by all sessions. Entries are keyed on
+# (stage, tickers, date range, window, data version); the data version comes
+# from the price store manifest entries of those tickers, so editing one of
+# their CSVs invalidates everything derived from them, while adding or
+# changing other tickers does not. Values are returned as-is (no copy):
+# callers must treat them as read-only.
+
+CACHE_MAX_MB = float(os.environ.get("PIPELINE_CACHE_MAX_MB", "512"))
+
+# Compact mode (PIPELINE_COMPACT=1), for large universes and many sessions:
+#   - return panels (and what is derived from them) are kept as float32;
+#   - cumulative returns / rolling vol are computed only for the columns the
+#     caller asks for (the app passes the displayed tickers), not the panel;
+#   - when over budget, derived entries are evicted before base price panels.
+# Math on float32 inputs is done in float64 and the result rounded once.
+# Drift vs float64, measured on fixed_stock_data (2020-2025, 49 tickers):
+#   daily returns       rel. <= 6e-8 (one rounding to float32)
+#   rolling vol (5-63d) rel. <= 2e-7
+#   cumulative return   rel. <= 2e-7 over the full range
+#   portfolio returns   abs. <= 2e-8/day rebalanced daily, <= 3e-7/day with
+#                       monthly drift (float32 growth); growth rel. <= 2e-6
+#   FF3 alpha / betas   abs. <= 1e-10 / 2e-8, R2 <= 1e-9
+# Display-level differences only (tables show 4 decimals, charts pixels).
+COMPACT = os.environ.get("PIPELINE_COMPACT", "") not in ("", "0")
+PANEL_DTYPE = np.float32 if COMPACT else np.float64
+
+
+def _nbytes(value: Any) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True))
+    if isinstance(value, np.ndarray) or hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, tuple):
+        return sum(_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Thread-safe LRU keyed on hashables, bounded by total bytes of the values.
+    Entries put with base=True (source panels everything else is derived
+    from) are only evicted once no derived entry is left.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self._data: OrderedDict[Hashable, tuple[Any, int, float | None, bool]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (item[2] is not None and item[2] < time.monotonic()):
+                if item is not None:
+                    self._drop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any, ttl: float | None = None, base: bool = False) -> None:
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, size, expires, base)
+            self._bytes += size
+            self._shrink()
+
+    def resize(self, key: Hashable) -> None:
+        """Re-measure an entry whose value grew in place (memoised results); evicts if now over budget."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return
+            size = _nbytes(item[0])
+            self._bytes += size - item[1]
+            self._data[key] = (item[0], size, item[2], item[3])
+            self._shrink()
+
+    def _shrink(self) -> None:
+        while self._bytes > self.max_bytes and self._data:
+            self._drop(self._victim())
+            self.evictions += 1
+
+    def _victim(self) -> Hashable:
+        """Least recently used derived entry, else the least recently used one."""
+        for key, item in self._data.items():
+            if not item[3]:
+                return key
+        return next(iter(self._data))
+
+    def _drop(self, key: Hashable) -> None:
+        size = self._data.pop(key)[1]
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_cache = LRUCache(int(CACHE_MAX_MB * 2**20))
+_inflight: dict[Hashable, threading.Lock] = {}
+_inflight_lock = threading.Lock()
+
+
+def cached(key: Hashable, compute: Callable[[], Any], ttl: float | None = None, base: bool = False) -> Any:
+    """Return the cached value for key, computing it once even under concurrent reruns."""
+    missing = object()
+    value = _cache.get(key, missing)
+    stage = key[0] if isinstance(key, tuple) and key else str(key)
+    if value is not missing:
+        diagnostics.count_cache(stage, hit=True)
+        return value
+    diagnostics.count_cache(stage, hit=False)
+    with _inflight_lock:
+        lock = _inflight.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            value = _cache.get(key, missing)
+            if value is missing:
+                value = compute()
+                _cache.put(key, value, ttl=ttl, base=base)
+    finally:
+        # Also when compute() raised, else every failing key would keep its lock forever
+        with _inflight_lock:
+            _inflight.pop(key, None)
+    return value
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
+
+
+diagnostics.register_gauges("cache", cache_stats)
+
+
+def clear_cache() -> None:
+    _cache.clear()
+
+
+def data_version(tickers=None) -> int:
+    """
+    Version of the compiled price store; bumps whenever a source CSV changes.
+    With tickers, only changes when one of theirs does (panels are ragged, so
+    other tickers' CSVs cannot affect them).
+    """
+    store = price_store_snapshot()
+    return store.version if tickers is None else store.version_of(tickers)
+
+
+def _range_key(start, end) -> tuple:
+    return (None if start is None else pd.Timestamp(start), None if end is None else pd.Timestamp(end))
+
+
+def cached_closing_prices(tickers, start_date="2020-01-01") -> pd.DataFrame:
+    tickers = tuple(tickers)
+    key = ("prices", tickers, str(start_date), data_version(tickers))
+    return cached(key, lambda: closing_prices(list(tickers), start_date=start_date), base=True)
+
+
+def cached_horizon_index(tickers, start_date="2020-01-01") -> HorizonIndex:
+    """Preset -> row bounds over the loaded panel's dates; presets are resolved once per data version."""
+    tickers = tuple(tickers)
+    key = ("horizons", tickers, str(start_date), data_version(tickers))
+    return cached(key, lambda: HorizonIndex(cached_closing_prices(tickers, start_date).index), base=True)
+
+
+def cached_prices_range(tickers, start=None, end=None, start_date="2020-01-01") -> pd.DataFrame:
+    tickers = tuple(tickers)
+    key = ("prices_range", tickers, _range_key(start, end), str(start_date), data_version(tickers))
+    return cached(key, lambda: cached_horizon_index(tickers, start_date).slice(
+        cached_closing_prices(tickers, start_date), start=start, end=end))
+
+
+def _compact(df):
+    """Store-side dtype: float32 in compact mode (no copy otherwise)."""
+    return df.astype(PANEL_DTYPE, copy=False) if COMPACT else df
+
+
+def _wide(df):
+    """Float64 view/copy for computing on possibly-float32 inputs."""
+    return df.astype(np.float64, copy=False)
+
+
+def _columns_key(columns) -> tuple | None:
+    return None if columns is None else tuple(columns)
+
+
+def cached_returns(tickers, start=None, end=None, start_date="2020-01-01") -> pd.DataFrame:
+    tickers = tuple(tickers)
+    key = ("returns", tickers, _range_key(start, end), str(start_date), data_version(tickers))
+    return cached(key, lambda: _compact(calculate_returns(cached_prices_range(tickers, start, end, start_date))))
+
+
+def cached_cumulative_return(tickers, start=None, end=None, start_date="2020-01-01", columns=None) -> pd.DataFrame:
+    """Growth of 1 per ticker; with `columns`, only those columns are computed (and cached)."""
+    tickers, cols = tuple(tickers), _columns_key(columns)
+    key = ("cumulative", tickers, _range_key(start, end), cols, str(start_date), data_version(tickers))
+
+    def build():
+        returns = cached_returns(tickers, start, end, start_date)
+        return _compact(calculate_cumulative_return(_wide(returns if cols is None else returns[list(cols)])))
+
+    return cached(key, build)
+
+
+# Latest (returns, rolling engine) per range start, kept as an LRU entry
+# ("latest_moments", ...) so it counts against the byte budget and can be
+# evicted (its objects are shared with the returns/moments entries, so the
+# count errs high). A longer range over the same tickers whose earlier rows
+# are unchanged reuses it and only appends the new days; the same days over
+# another ticker set keep its unchanged columns and only build the others.
+
+
+def _unchanged_columns(prev: pd.DataFrame, returns: pd.DataFrame) -> list:
+    """Columns of both panels (same index) whose values are identical."""
+    common = prev.columns.intersection(returns.columns)
+    if common.empty:
+        return []
+    a, b = prev[common].to_numpy(), returns[common].to_numpy()
+    return common[((a == b) | (np.isnan(a) & np.isnan(b))).all(axis=0)].tolist()
+
+
+def _build_moments(tickers: tuple, start, end, start_date) -> Any:
+    returns = cached_returns(tickers, start, end, start_date)
+    base = ("latest_moments", _range_key(start, None)[0], str(start_date))
+    prev = _cache.get(base)
+    if prev is not None and not returns.columns.equals(prev[0].columns):
+        prev_returns, prev_engine = prev
+        reuse = _unchanged_columns(prev_returns, returns) if returns.index.equals(prev_returns.index) else []
+        if reuse:
+            engine = prev_engine.with_columns(returns, reuse)
+            _cache.put(base, (returns, engine))
+            return engine
+    elif prev is not None:
+        prev_returns, prev_engine = prev
+        n = len(prev_returns)
+        if (
+            0 < n < len(returns)
+            and returns.index[:n].equals(prev_returns.index)
+            and np.array_equal(returns.to_numpy()[:n], prev_returns.to_numpy(), equal_nan=True)
+        ):
+            engine = prev_engine.copy()
+            engine.extend(returns.iloc[n:])
+            _cache.put(base, (returns, engine))
+            return engine
+    engine = calculate_rolling_moments(returns, windows=VOL_WINDOWS)
+    if prev is None or len(returns) >= len(prev[0]):
+        _cache.put(base, (returns, engine))
+    return engine
+
+
+def cached_rolling_moments(tickers, start=None, end=None, start_date="2020-01-01"):
+    tickers = tuple(tickers)
+    key = ("moments", tickers, _range_key(start, end), str(start_date), data_version(tickers))
+    return cached(key, lambda: _build_moments(tickers, start, end, start_date))
+
+
+def cached_volatility(tickers, start=None, end=None, window: int = 5, start_date="2020-01-01",
+                      columns=None) -> pd.DataFrame:
+    """
+    Rolling std per ticker. The full panel comes from the shared multi-window
+    engine; with `columns`, only those columns are computed (and cached).
+    """
+    if columns is None and int(window) in VOL_WINDOWS:
+        return cached_rolling_moments(tickers, start, end, start_date).volatility(int(window))
+    tickers, cols = tuple(tickers), _columns_key(columns)
+    key = ("volatility", tickers, _range_key(start, end), int(window), cols, str(start_date), data_version(tickers))
+
+    def build():
+        returns = cached_returns(tickers, start, end, start_date)
+        return _compact(calculate_volatility(_wide(returns if cols is None else returns[list(cols)]), window=window))
+
+    return cached(key, build)
+
+
+# Latest (returns, covariance engine) per method, an LRU entry like
+# "latest_moments". An overlapping range over the same tickers reuses it,
+# retiring the days that left the window and adding the new ones, when that
+# touches fewer days than a rebuild; the same days over another ticker set
+# keep the block of its unchanged columns and only compute the others.
+
+
+def _build_covariance(tickers: tuple, start, end, start_date, method: str) -> Any:
+    returns = cached_returns(tickers, start, end, start_date)
+    base = ("latest_covariance", str(start_date), method)
+    prev = _cache.get(base)
+    if prev is not None and not returns.columns.equals(prev[0].columns):
+        reuse = _unchanged_columns(prev[0], returns) if returns.index.equals(prev[0].index) else []
+        if reuse:
+            engine = prev[1].with_columns(_wide(returns), reuse)
+            _cache.put(base, (returns, engine))
+            return engine
+    elif prev is not None and len(returns) and len(prev[0]):
+        prev_returns, prev_engine = prev
+        old, cur = prev_returns.index, returns.index
+        if old[0] <= cur[0] <= old[-1] <= cur[-1] and returns.columns.equals(prev_returns.columns):
+            kept = prev_returns.loc[cur[0]:]
+            n_gone, n_new = len(prev_returns) - len(kept), len(returns) - len(kept)
+            if (
+                n_gone + n_new < len(returns)
+                and cur[:len(kept)].equals(kept.index)
+                and np.array_equal(returns.to_numpy()[:len(kept)], kept.to_numpy(), equal_nan=True)
+            ):
+                engine = prev_engine.copy()
+                engine.retire(_wide(prev_returns.iloc[:n_gone]))
+                engine.extend(_wide(returns.iloc[len(kept):]))
+                _cache.put(base, (returns, engine))
+                return engine
+    engine = calculate_covariance(_wide(returns), method=method)
+    _cache.put(base, (returns, engine))
+    return engine
+
+
+def cached_covariance(tickers, start=None, end=None, start_date="2020-01-01", method: str = "sample"):
+    """
+    Covariance engine (covariance.py) over the cached returns of start..end;
+    pull submatrices with .covariance(columns) / .correlation(columns).
+    """
+    tickers = tuple(tickers)
+    key = ("covariance", tickers, _range_key(start, end), method, str(start_date), data_version(tickers))
+    return cached(key, lambda: _build_covariance(tickers, start, end, start_date, method))
+
+
+def cached_summary_stats(tickers, horizon: str = "1Y", start_date="2020-01-01") -> pd.DataFrame:
+    # Raw numbers only; format with profiles.format_summary_table after sorting/filtering
+    tickers = tuple(tickers)
+    key = ("summary", tickers, horizon, str(start_date), data_version(tickers))
+    return cached(key, lambda: _build_summary(tickers, horizon, start_date))
+
+
+def _build_summary(tickers: tuple, horizon: str, start_date) -> pd.DataFrame:
+    # A row depends only on its own ticker's prices, so rows are also cached per
+    # ticker ("summary_row") and another ticker set only computes its new ones
+    prices = cached_closing_prices(tickers, start_date)
+    names = list(prices.columns)
+    keys = {t: ("summary_row", t, horizon, str(start_date), data_version((t,))) for t in names}
+    rows = {t: _cache.get(k) for t, k in keys.items()}
+    todo = [t for t in names if rows[t] is None]
+    if len(todo) == len(names):
+        table = summary_stats(prices, horizon)
+        for t, row in zip(names, table.itertuples(index=False, name=None)):
+            _cache.put(keys[t], row)
+        return table
+    if todo:
+        for t, row in zip(todo, summary_stats(prices[todo], horizon).itertuples(index=False, name=None)):
+            rows[t] = row
+            _cache.put(keys[t], row)
+    table = pd.DataFrame.from_records([rows[t] for t in names], columns=SUMMARY_COLUMNS,
+                                      index=pd.Index(names, name="Ticker"))
+    table["As of"] = pd.to_datetime(table["As of"]).astype(prices.index.dtype)
+    return table
+
+
+def cached_ff3_factors(start_date="2020-01-01") -> pd.DataFrame:
+    # Independent of the price CSVs; follows the on-disk factor store instead
+    key = ("ff3", str(start_date), factors.version("ff3"))
+    return cached(key, lambda: ff3_factors(start_date=start_date))
+
+
+def cached_portfolio_engine(tickers, start=None, end=None, start_date="2020-01-01") -> PortfolioEngine:
+    """Portfolio engine over the cached returns; its own results are cached by weight-matrix hash."""
+    tickers = tuple(tickers)
+    key = ("portfolio_engine", tickers, _range_key(start, end), str(start_date), data_version(tickers))
+
+    def build():
+        engine = PortfolioEngine(cached_returns(tickers, start, end, start_date))
+        # Its memo of results grows after the put; keep the byte count honest
+        engine.on_resize = lambda: _cache.resize(key)
+        return engine
+
+    return cached(key, build)
+
+
+def _build_factor_loadings(tickers: tuple, start, end, start_date, scheme, rebalance) -> pd.DataFrame:
+    engine = cached_portfolio_engine(tickers, start, end, start_date)
+    ff3 = cached_ff3_factors(start_date).loc[start:end]
+    buckets = engine.portfolio_returns(all_buckets(engine.returns), scheme=scheme, rebalance=rebalance)
+    panel = pd.concat([engine.returns, buckets], axis=1)
+    return factor_loadings(panel, ff3)
+
+
+def cached_factor_loadings(tickers, start=None, end=None, start_date="2020-01-01",
+                           scheme: str = "equal", rebalance=None) -> pd.DataFrame:
+    """FF3 alpha/betas/t-stats/R2 for every ticker, static bucket and volatility decile."""
+    tickers = tuple(tickers)
+    key = ("ff3_loadings", tickers, _range_key(start, end), str(start_date), scheme, rebalance,
+           data_version(tickers), factors.version("ff3"))
+    return cached(key, lambda: _build_factor_loadings(tickers, start, end, start_date, scheme, rebalance))
+
+
+def cached_walk_forward(tickers, lookback: int = 252, rerank="M", scheme: str = "equal", rebalance=None,
+                        start_date="2020-01-01") -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Walk-forward volatility deciles over the whole loaded history; slice the result to the display range."""
+    tickers = tuple(tickers)
+    key = ("walk_forward", tickers, int(lookback), rerank, scheme, rebalance, str(start_date), data_version(tickers))
+    return cached(key, lambda: walk_forward(cached_returns(tickers, start_date=start_date), lookback=int(lookback),
+                                            rerank=rerank, scheme=scheme, rebalance=rebalance))
+
+
+def _buckets_key(buckets: dict | None) -> tuple | None:
+    return None if buckets is None else tuple((k, tuple(v)) for k, v in buckets.items())
+
+
+def cached_risk_simulation(tickers, start=None, end=None, start_date="2020-01-01", buckets: dict | None = None,
+                           scheme: str = "equal", method: str = "bootstrap", horizon: int = 21,
+                           n_paths: int = 20_000, seed: int = 0) -> tuple[pd.DataFrame, dict]:
+    """Simulated horizon VaR/CVaR/drawdowns for every bucket (default: the static risk portfolios)."""
+    tickers = tuple(tickers)
+    key = ("risk_sim", tickers, _range_key(start, end), str(start_date), _buckets_key(buckets), scheme,
+           method, int(horizon), int(n_paths), seed, data_version(tickers))
+
+    def build():
+        engine = cached_portfolio_engine(tickers, start, end, start_date)
+        history = engine.portfolio_returns(risk_portfolios_static if buckets is None else buckets, scheme=scheme)
+        return simulate_returns(history, horizon=horizon, n_paths=n_paths, method=method, seed=seed)
+
+    return cached(key, build)
+
+
+def cached_walk_forward_simulation(tickers, start=None, end=None, lookback: int = 252, rerank="M",
+                                   scheme: str = "equal", rebalance=None, method: str = "bootstrap",
+                                   horizon: int = 21, n_paths: int = 20_000, seed: int = 0,
+                                   start_date="2020-01-01") -> tuple[pd.DataFrame, dict]:
+    """As cached_risk_simulation, resampling the out-of-sample walk-forward decile returns within start..end."""
+    tickers = tuple(tickers)
+    key = ("risk_sim_wf", tickers, _range_key(start, end), int(lookback), rerank, scheme, rebalance,
+           method, int(horizon), int(n_paths), seed, str(start_date), data_version(tickers))
+
+    def build():
+        history = cached_walk_forward(tickers, lookback, rerank, scheme, rebalance, start_date)[0].loc[start:end]
+        return simulate_returns(history, horizon=horizon, n_paths=n_paths, method=method, seed=seed)
+
+    return cached(key, build)
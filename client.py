@@ -0,0 +1,294 @@
+# client.py
+from __future__ import annotations
+import functools
+import importlib.util
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from horizons import HorizonIndex
+
+# Thin client of the analytics service (server.py). The cached_* functions
+# have the signatures of their cache.py namesakes, so the app switches to the
+# service by importing them from here (ANALYTICS_SERVER set) instead of from
+# cache.py; nothing is loaded or computed in the client process. Engines come
+# back as small proxies that make one request per call:
+#   cached_portfolio_engine -> .portfolio_returns(portfolios, scheme, rebalance)
+#   cached_covariance       -> .correlation(columns), .shrinkage()
+# Simulations return (table, None): the per-path draws are not sent.
+# Responses are Arrow IPC when pyarrow is installed here, JSON otherwise.
+# Decoded frames are kept per (endpoint, params, server data version), so a
+# Streamlit rerun asking for the same views downloads nothing; the version
+# (server.py's /version, also sent as X-Data-Version on every answer) is
+# re-checked at most every ANALYTICS_VERSION_SECONDS, and a new one drops the
+# kept frames. As with cache.py, callers must treat the frames as read-only.
+#   ANALYTICS_SERVER=http://127.0.0.1:8765   service base URL ("" = use cache.py)
+#   ANALYTICS_TIMEOUT=s                      per-request timeout (default 120)
+#   ANALYTICS_CLIENT_CACHE_MB=n              bound on the kept frames (default 128, 0 = off)
+#   ANALYTICS_VERSION_SECONDS=s              data version re-check interval (default 2)
+
+SERVER_URL = os.environ.get("ANALYTICS_SERVER", "").rstrip("/")
+TIMEOUT = float(os.environ.get("ANALYTICS_TIMEOUT", "120"))
+CACHE_MB = float(os.environ.get("ANALYTICS_CLIENT_CACHE_MB", "128"))
+VERSION_SECONDS = float(os.environ.get("ANALYTICS_VERSION_SECONDS", "2"))
+VERSION_HEADER = "X-Data-Version"
+ARROW = "application/vnd.apache.arrow.stream"
+
+
+@functools.cache
+def _have_pyarrow() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def decode_arrow(body: bytes) -> pd.DataFrame:
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(body).read_all().to_pandas()
+
+
+def decode_json(body: bytes) -> pd.DataFrame:
+    d = json.loads(body)
+    # ISO strings parse to microseconds; restore the nanosecond unit cache.py and Arrow answers have
+    index = pd.DatetimeIndex(d["index"]).as_unit("ns") if d["dates"] else pd.Index(d["index"])
+    index.name = d["index_name"]
+    df = pd.DataFrame(dict(enumerate(d["data"])), index=index)
+    for j in d["date_columns"]:
+        df[j] = pd.to_datetime(df[j]).dt.as_unit("ns")
+    df.columns = pd.Index(d["columns"])
+    df.attrs.update(d["attrs"])
+    return df
+
+
+def _param(value) -> str:
+    if isinstance(value, (list, tuple, pd.Index)):
+        return ",".join(str(v) for v in value)
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return str(value)
+
+
+class AnalyticsClient:
+    def __init__(self, url: str = SERVER_URL, timeout: float = TIMEOUT, arrow: bool | None = None,
+                 cache_mb: float = CACHE_MB, version_seconds: float = VERSION_SECONDS):
+        if not url:
+            raise ValueError("No analytics server URL (set ANALYTICS_SERVER).")
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.arrow = _have_pyarrow() if arrow is None else arrow
+        self.max_bytes = int(cache_mb * 1024 * 1024)
+        self.version_seconds = version_seconds
+        self._lock = threading.Lock()
+        self._frames: OrderedDict = OrderedDict()  # (endpoint, query, accept) -> (frame, nbytes)
+        self._bytes = 0
+        self._version: str | None = None
+        self._checked = float("-inf")
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, endpoint: str, query: str, accept: str) -> tuple[bytes, str, str | None]:
+        from urllib.error import HTTPError
+        from urllib.request import Request, urlopen
+
+        req = Request(f"{self.url}/{endpoint}" + (f"?{query}" if query else ""), headers={"Accept": accept})
+        try:
+            with urlopen(req, timeout=self.timeout) as resp:
+                return resp.read(), resp.headers.get("Content-Type", ""), resp.headers.get(VERSION_HEADER)
+        except HTTPError as e:
+            try:
+                message = json.loads(e.read())["error"]
+            except (ValueError, KeyError, TypeError):
+                message = str(e)
+            if e.code in (400, 404):
+                raise ValueError(message) from None
+            raise RuntimeError(f"analytics server: {message}") from None
+
+    def _set_version(self, version: str | None) -> None:
+        # Caller holds self._lock; frames kept under another version are stale
+        self._checked = time.monotonic()
+        if version != self._version:
+            self._version = version
+            self._frames.clear()
+            self._bytes = 0
+
+    def version(self) -> str | None:
+        """Server data version, asked for at most every version_seconds."""
+        with self._lock:
+            if time.monotonic() - self._checked < self.version_seconds:
+                return self._version
+        version = json.loads(self._get("version", "", "application/json")[0])["version"]
+        with self._lock:
+            self._set_version(version)
+        return version
+
+    def frame(self, endpoint: str, **params) -> pd.DataFrame:
+        """One endpoint's DataFrame (shared, read-only); None params are left out (server default)."""
+        from urllib.parse import urlencode
+
+        query = urlencode({k: _param(v) for k, v in params.items() if v is not None})
+        accept = ARROW if self.arrow else "application/json"
+        key = (endpoint, query, accept)
+        if self.max_bytes > 0:
+            version = self.version()
+            with self._lock:
+                hit = self._frames.get(key) if version == self._version else None
+                if hit is not None:
+                    self._frames.move_to_end(key)
+                    self.hits += 1
+                    return hit[0]
+                self.misses += 1
+        body, content_type, version = self._get(endpoint, query, accept)
+        df = decode_arrow(body) if content_type.startswith(ARROW) else decode_json(body)
+        if self.max_bytes > 0 and version is not None:
+            nbytes = int(df.memory_usage(index=True, deep=False).sum())
+            with self._lock:
+                self._set_version(version)
+                if nbytes <= self.max_bytes:
+                    old = self._frames.pop(key, None)
+                    if old is not None:
+                        self._bytes -= old[1]
+                    self._frames[key] = (df, nbytes)
+                    self._bytes += nbytes
+                    while self._bytes > self.max_bytes:
+                        self._bytes -= self._frames.popitem(last=False)[1][1]
+        return df
+
+    def json(self, endpoint: str) -> dict:
+        return json.loads(self._get(endpoint, "", "application/json")[0])
+
+    def stats(self) -> dict:
+        """Counters of the kept-frame cache."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._frames),
+                    "mb": round(self._bytes / 1024 / 1024, 1), "version": self._version}
+
+
+_client: AnalyticsClient | None = None
+_client_lock = threading.Lock()
+
+
+def client() -> AnalyticsClient:
+    """Process-wide client for SERVER_URL."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AnalyticsClient()
+        return _client
+
+
+def _range(tickers, start, end, start_date) -> dict:
+    return dict(tickers=list(tickers), start=None if start is None else pd.Timestamp(start),
+                end=None if end is None else pd.Timestamp(end), start_date=start_date)
+
+
+def _baskets(portfolios: dict) -> str:
+    # Pairs rather than an object, so integer bucket names stay integers
+    return json.dumps([[name, list(members)] for name, members in portfolios.items()])
+
+
+class RemotePortfolioEngine:
+    def __init__(self, api: AnalyticsClient, args: dict):
+        self._api = api
+        self._args = args
+
+    def portfolio_returns(self, portfolios: dict, scheme: str = "equal", rebalance=None) -> pd.DataFrame:
+        return self._api.frame("portfolios", **self._args, baskets=_baskets(portfolios), scheme=scheme,
+                               rebalance=rebalance)
+
+
+class RemoteCovariance:
+    def __init__(self, api: AnalyticsClient, args: dict, method: str):
+        self._api = api
+        self._args = args
+        self.method = method
+
+    def correlation(self, columns=None) -> pd.DataFrame:
+        return self._api.frame("correlation", **self._args, method=self.method,
+                               columns=None if columns is None else list(columns))
+
+    def shrinkage(self) -> tuple[float, float]:
+        if self.method != "ledoit_wolf":
+            raise ValueError("Shrinkage applies to the ledoit_wolf method only.")
+        row = self._api.frame("shrinkage", **self._args).iloc[0]
+        return float(row["intensity"]), float(row["mu"])
+
+
+def cached_closing_prices(tickers, start_date="2020-01-01") -> pd.DataFrame:
+    return client().frame("prices", tickers=list(tickers), start_date=start_date)
+
+
+def cached_horizon_index(tickers, start_date="2020-01-01") -> HorizonIndex:
+    # Only the dates are needed: ask for no columns
+    return HorizonIndex(client().frame("prices", tickers=list(tickers), start_date=start_date, columns=[]).index)
+
+
+def cached_prices_range(tickers, start=None, end=None, start_date="2020-01-01") -> pd.DataFrame:
+    return client().frame("prices", **_range(tickers, start, end, start_date))
+
+
+def cached_returns(tickers, start=None, end=None, start_date="2020-01-01") -> pd.DataFrame:
+    return client().frame("returns", **_range(tickers, start, end, start_date))
+
+
+def cached_cumulative_return(tickers, start=None, end=None, start_date="2020-01-01", columns=None) -> pd.DataFrame:
+    return client().frame("cumulative", **_range(tickers, start, end, start_date),
+                          columns=None if columns is None else list(columns))
+
+
+def cached_volatility(tickers, start=None, end=None, window: int = 5, start_date="2020-01-01",
+                      columns=None) -> pd.DataFrame:
+    return client().frame("volatility", **_range(tickers, start, end, start_date), window=int(window),
+                          columns=None if columns is None else list(columns))
+
+
+def cached_summary_stats(tickers, horizon: str = "1Y", start_date="2020-01-01") -> pd.DataFrame:
+    return client().frame("summary", tickers=list(tickers), horizon=horizon, start_date=start_date)
+
+
+def cached_ff3_factors(start_date="2020-01-01") -> pd.DataFrame:
+    return client().frame("ff3", start_date=start_date)
+
+
+def cached_portfolio_engine(tickers, start=None, end=None, start_date="2020-01-01") -> RemotePortfolioEngine:
+    return RemotePortfolioEngine(client(), _range(tickers, start, end, start_date))
+
+
+def cached_factor_loadings(tickers, start=None, end=None, start_date="2020-01-01",
+                           scheme: str = "equal", rebalance=None) -> pd.DataFrame:
+    return client().frame("ff3_loadings", **_range(tickers, start, end, start_date), scheme=scheme,
+                          rebalance=rebalance)
+
+
+def cached_walk_forward(tickers, lookback: int = 252, rerank="M", scheme: str = "equal", rebalance=None,
+                        start_date="2020-01-01") -> tuple[pd.DataFrame, pd.DataFrame]:
+    args = dict(tickers=list(tickers), lookback=int(lookback), rerank=rerank, scheme=scheme, rebalance=rebalance,
+                start_date=start_date)
+    api = client()
+    return api.frame("walk_forward", **args, part="returns"), api.frame("walk_forward", **args, part="membership")
+
+
+def cached_covariance(tickers, start=None, end=None, start_date="2020-01-01",
+                      method: str = "sample") -> RemoteCovariance:
+    return RemoteCovariance(client(), _range(tickers, start, end, start_date), method)
+
+
+def cached_risk_simulation(tickers, start=None, end=None, start_date="2020-01-01", buckets: dict | None = None,
+                           scheme: str = "equal", method: str = "bootstrap", horizon: int = 21,
+                           n_paths: int = 20_000, seed: int = 0) -> tuple[pd.DataFrame, None]:
+    table = client().frame("risk", **_range(tickers, start, end, start_date),
+                           baskets=None if buckets is None else _baskets(buckets), scheme=scheme, method=method,
+                           horizon=int(horizon), n_paths=int(n_paths), seed=seed)
+    return table, None
+
+
+def cached_walk_forward_simulation(tickers, start=None, end=None, lookback: int = 252, rerank="M",
+                                   scheme: str = "equal", rebalance=None, method: str = "bootstrap",
+                                   horizon: int = 21, n_paths: int = 20_000, seed: int = 0,
+                                   start_date="2020-01-01") -> tuple[pd.DataFrame, None]:
+    table = client().frame("risk_walk_forward", **_range(tickers, start, end, start_date), lookback=int(lookback),
+                           rerank=rerank, scheme=scheme, rebalance=rebalance, method=method, horizon=int(horizon),
+                           n_paths=int(n_paths), seed=seed)
+    return table, None
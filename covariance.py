@@ -0,0 +1,342 @@
+# covariance.py
+from __future__ import annotations
+import copy
+
+import numpy as np
+import pandas as pd
+
+# Universe-wide covariance / correlation from a return panel.
+#
+# The engine keeps sufficient statistics rather than the returns: weighted
+# sums of x and of x x^T over the rows in its window (values shifted by a
+# per-column constant first, as in rolling.py, to avoid cancellation). Any
+# N x N covariance, or any submatrix of one, is then O(k^2) to read off, and
+# new days are added (extend) or the oldest days removed (retire) at O(N^2)
+# per row without touching the rest of the window; with_columns() adds or
+# drops columns over the same days at O(days x N) per added column. Rows are
+# consumed in chunks of `chunk` days and the N x N products are done in column
+# blocks of `block`, so temporaries stay at chunk x N / N x block however
+# large N is.
+#
+# Methods:
+#   "sample"       unbiased sample covariance (ddof=1), like DataFrame.cov()
+#   "ewma"         RiskMetrics style, zero mean, weights lam^age normalised to 1
+#   "ledoit_wolf"  Ledoit-Wolf (2004) shrinkage of the (ddof=0) sample
+#                  covariance towards mu * I; the intensity is exact, from the
+#                  same running sums plus three fourth-moment terms
+# Missing values (ragged histories) switch the engine to pairwise statistics:
+# each (i, j) uses the days where both i and j have a return, as
+# DataFrame.cov() does. That keeps two more N x N matrices. The Ledoit-Wolf
+# intensity is then taken from that pairwise covariance, with each day's
+# returns centred on their column's own mean (a missing return counts as the
+# mean). Every term is independent of the shift, so an engine moved with
+# retire/extend agrees with one built fresh on the same days.
+
+METHODS = ("sample", "ewma", "ledoit_wolf")
+
+
+class CovarianceEngine:
+    def __init__(self, columns, method: str = "sample", ewma_lambda: float = 0.94, chunk: int = 256,
+                 block: int = 1024):
+        if method not in METHODS:
+            raise ValueError(f"Unknown covariance method {method!r}; choose from {METHODS}.")
+        if method == "ewma" and not 0.0 < ewma_lambda < 1.0:
+            raise ValueError("ewma_lambda must be in (0, 1).")
+        self.columns = pd.Index(columns)
+        self.method = method
+        self.decay = ewma_lambda if method == "ewma" else 1.0
+        self.chunk = max(1, int(chunk))
+        self.block = max(1, int(block))
+        self.index = pd.DatetimeIndex([])
+
+        n = len(self.columns)
+        self._pos = {c: i for i, c in enumerate(self.columns)}
+        self._shift = np.zeros(n)
+        self._w = 0.0                      # sum of row weights
+        self._s = np.zeros(n)              # sum of w * z
+        self._p = np.zeros((n, n))         # sum of w * z z^T (missing as 0)
+        self._wm: np.ndarray | None = None  # pairwise: sum of w over rows where i and j are valid
+        self._sm: np.ndarray | None = None  # pairwise: sum of w * z_i over rows where i and j are valid
+        # Ledoit-Wolf: a = |z|^2 per row; sums of a, a^2 and a * z
+        self._a1 = 0.0
+        self._a2 = 0.0
+        self._q = np.zeros(n)
+        self._qm: np.ndarray | None = None  # pairwise: sum of a over rows where i is valid
+        self._lw: tuple[float, float] | None = None
+
+    # ---- building -----------------------------------------------------------
+
+    @classmethod
+    def from_returns(cls, returns: pd.DataFrame, method: str = "sample", ewma_lambda: float = 0.94,
+                     chunk: int = 256, block: int = 1024) -> "CovarianceEngine":
+        eng = cls(returns.columns, method, ewma_lambda, chunk, block)
+        eng.extend(returns)
+        return eng
+
+    def _values(self, returns: pd.DataFrame) -> np.ndarray:
+        return returns.reindex(columns=self.columns).to_numpy(dtype=np.float64)
+
+    def extend(self, returns: pd.DataFrame) -> None:
+        """Add the days of `returns` (all later than the engine's last day)."""
+        if returns.empty:
+            return
+        if len(self.index) and returns.index[0] <= self.index[-1]:
+            raise ValueError("extend() needs days after the engine's last day.")
+        x = self._values(returns)
+        if not len(self.index) and self.method != "ewma":
+            first = np.argmax(~np.isnan(x), axis=0)
+            self._shift = np.nan_to_num(x[first, np.arange(x.shape[1])])
+        for lo in range(0, len(x), self.chunk):
+            z = x[lo:lo + self.chunk] - self._shift
+            k = len(z)
+            if self.decay != 1.0:
+                self._scale(self.decay ** k)
+            self._accumulate(z, self.decay ** np.arange(k - 1, -1, -1, dtype=np.float64))
+        self.index = self.index.append(pd.DatetimeIndex(returns.index))
+        self._lw = None
+
+    def retire(self, returns: pd.DataFrame) -> None:
+        """Remove the engine's oldest days; `returns` must be exactly those rows."""
+        if returns.empty:
+            return
+        k = len(returns)
+        if not returns.index.equals(self.index[:k]):
+            raise ValueError("retire() needs the engine's first days, in order.")
+        x = self._values(returns)
+        n_rows = len(self.index)
+        for lo in range(0, k, self.chunk):
+            z = x[lo:lo + self.chunk] - self._shift
+            ages = n_rows - 1 - np.arange(lo, lo + len(z), dtype=np.float64)
+            self._accumulate(z, -(self.decay ** ages))
+        self.index = self.index[k:]
+        self._lw = None
+
+    def _scale(self, f: float) -> None:
+        self._w *= f
+        self._s *= f
+        self._p *= f
+        if self._wm is not None:
+            self._wm *= f
+            self._sm *= f
+
+    def _pairwise(self) -> None:
+        """Switch to per-pair statistics (first missing value seen); so far every row was complete."""
+        n = len(self.columns)
+        self._wm = np.full((n, n), self._w)
+        self._sm = np.repeat(self._s[:, None], n, axis=1)
+        if self.method == "ledoit_wolf":
+            self._qm = np.full(n, self._a1)
+
+    def _accumulate(self, z: np.ndarray, w: np.ndarray) -> None:
+        bad = np.isnan(z)
+        missing = bad.any()
+        if missing and self._wm is None:
+            self._pairwise()
+        zf = np.where(bad, 0.0, z)
+        zw = zf * w[:, None]
+        self._w += float(w.sum())
+        self._s += zw.sum(axis=0)
+        if self._wm is not None:
+            m = (~bad).astype(np.float64)
+            mw = m * w[:, None]
+        for c in range(0, len(self.columns), self.block):
+            cols = slice(c, c + self.block)
+            self._p[:, cols] += zw.T @ zf[:, cols]
+            if self._wm is not None:
+                self._wm[:, cols] += mw.T @ m[:, cols]
+                self._sm[:, cols] += zw.T @ m[:, cols]
+        if self.method == "ledoit_wolf":
+            a = np.einsum("ij,ij->i", zf, zf)
+            self._a1 += float(w @ a)
+            self._a2 += float(w @ (a * a))
+            self._q += zw.T @ a
+            if self._qm is not None:
+                self._qm += mw.T @ a
+
+    def with_columns(self, returns: pd.DataFrame, reuse) -> "CovarianceEngine":
+        """
+        Engine over the same days for returns.columns. Statistics between
+        columns in `reuse` (columns of this engine whose returns are unchanged)
+        are copied; every other column is computed from `returns` against all
+        columns, O(days x N) per column rather than O(days x N^2) for a rebuild.
+        """
+        if not returns.index.equals(self.index):
+            raise ValueError("with_columns() needs returns over the engine's days.")
+        new = CovarianceEngine(returns.columns, self.method, self.decay if self.method == "ewma" else 0.94,
+                               self.chunk, self.block)
+        reuse = set(reuse).intersection(self._pos)
+        keep = np.array([i for i, c in enumerate(new.columns) if c in reuse], dtype=np.int64)
+        add = np.array([i for i, c in enumerate(new.columns) if c not in reuse], dtype=np.int64)
+        old = self._positions(new.columns[keep])
+        x = new._values(returns)
+        new._shift[keep] = self._shift[old]
+        if len(add) and len(x) and self.method != "ewma":
+            first = np.argmax(~np.isnan(x[:, add]), axis=0)
+            new._shift[add] = np.nan_to_num(x[first, add])
+        new.index = self.index
+        new._w = self._w
+        ko, kn = np.ix_(old, old), np.ix_(keep, keep)
+        new._p[kn] = self._p[ko]
+        new._s[keep] = self._s[old]
+        pairwise = self._wm is not None or bool(np.isnan(x[:, add]).any())
+        if pairwise:
+            n = len(new.columns)
+            new._wm, new._sm = np.zeros((n, n)), np.zeros((n, n))
+            new._wm[kn] = self._w if self._wm is None else self._wm[ko]
+            new._sm[kn] = self._s[old][:, None] if self._wm is None else self._sm[ko]
+            if self.method == "ledoit_wolf":
+                new._qm = np.zeros(n)
+
+        n_rows = len(x)
+        for lo in range(0, n_rows, self.chunk):
+            z = x[lo:lo + self.chunk] - new._shift
+            bad = np.isnan(z)
+            zf = np.where(bad, 0.0, z)
+            # Same row weights as extend/retire left in the sums: decay ** age
+            w = self.decay ** (n_rows - 1 - np.arange(lo, lo + len(z), dtype=np.float64))
+            zw = zf * w[:, None]
+            new._s[add] += zw[:, add].sum(axis=0)
+            if pairwise:
+                m = (~bad).astype(np.float64)
+                mw = m * w[:, None]
+            for c in range(0, len(add), self.block):
+                cols = add[c:c + self.block]
+                new._p[:, cols] += zw.T @ zf[:, cols]
+                if pairwise:
+                    new._wm[:, cols] += mw.T @ m[:, cols]
+                    new._sm[:, cols] += zw.T @ m[:, cols]
+                    # Rows of the added columns against the reused ones (added x added is done above)
+                    new._sm[np.ix_(cols, keep)] += zw[:, cols].T @ m[:, keep]
+            if self.method == "ledoit_wolf":
+                # |z|^2 per day spans every column, so these sums are redone for the new set
+                a = np.einsum("ij,ij->i", zf, zf)
+                new._a1 += float(w @ a)
+                new._a2 += float(w @ (a * a))
+                new._q += zw.T @ a
+                if pairwise:
+                    new._qm += mw.T @ a
+        # Symmetric: the added columns' rows mirror their columns
+        new._p[np.ix_(add, keep)] = new._p[np.ix_(keep, add)].T
+        if pairwise:
+            new._wm[np.ix_(add, keep)] = new._wm[np.ix_(keep, add)].T
+        return new
+
+    # ---- results ------------------------------------------------------------
+
+    def _positions(self, columns) -> np.ndarray:
+        if columns is None:
+            return np.arange(len(self.columns))
+        try:
+            return np.array([self._pos[c] for c in columns], dtype=np.int64)
+        except KeyError as e:
+            raise KeyError(f"{e.args[0]!r} is not a column of this covariance engine.") from None
+
+    def shrinkage(self) -> tuple[float, float]:
+        """(intensity, mu) of the Ledoit-Wolf estimate: (1 - intensity) * S + intensity * mu * I."""
+        if self.method != "ledoit_wolf":
+            raise ValueError("Shrinkage applies to the ledoit_wolf method only.")
+        if self._lw is None:
+            self._lw = self._ledoit_wolf()
+        return self._lw
+
+    def _ledoit_wolf(self) -> tuple[float, float]:
+        t, n = self._w, len(self.columns)
+        if t < 1 or n == 0:
+            return 0.0, float("nan")
+        if self._wm is None:
+            mean = self._s / t
+            trace, frob = 0.0, 0.0  # of S = centred cross products / t
+            for c in range(0, n, self.block):
+                cols = slice(c, c + self.block)
+                s_blk = (self._p[:, cols] - t * np.outer(mean, mean[cols])) / t
+                frob += float(np.sum(s_blk * s_blk))
+                trace += float(np.trace(s_blk[cols]))
+            # sum over days of |z - mean|^4, expanded in the running sums
+            c2 = float(mean @ mean)
+            fourth = (self._a2 + 4.0 * float(mean @ self._p @ mean) + t * c2 * c2 - 4.0 * float(self._q @ mean)
+                      + 2.0 * c2 * self._a1 - 4.0 * c2 * float(self._s @ mean))
+            # sum over days of |y y^T - S|^2 = fourth - 2 <S, Y^T Y> + t |S|^2, and Y^T Y = t S
+            spread = fourth - t * frob
+        else:
+            trace, frob, spread = self._ledoit_wolf_pairwise()
+        mu = trace / n
+        beta = spread / (n * t * t)
+        delta = (frob - 2.0 * mu * trace + n * mu * mu) / n
+        beta = min(beta, delta)
+        intensity = 0.0 if beta <= 0 or delta <= 0 else beta / delta
+        return intensity, mu
+
+    def _ledoit_wolf_pairwise(self) -> tuple[float, float, float]:
+        """
+        trace(S), |S|^2 and the sum over days of |y y^T - S|^2 for the pairwise
+        covariance S, where y is a day's returns minus each column's own mean
+        (0 where missing), all expanded in the running sums.
+        """
+        t, n = self._w, len(self.columns)
+        valid = np.diagonal(self._wm)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(valid > 0, np.diagonal(self._sm) / valid, 0.0)
+        mean2 = mean * mean
+        trace, frob, inner = 0.0, 0.0, 0.0  # inner = <S, Y^T Y>
+        for c in range(0, n, self.block):
+            cols = slice(c, c + self.block)
+            p, wm = self._p[:, cols], self._wm[:, cols]
+            si, sj = self._sm[:, cols], self._sm[cols, :].T
+            with np.errstate(invalid="ignore", divide="ignore"):
+                s_blk = np.where(wm > 0, (p - si * sj / wm) / wm, 0.0)
+            yy_blk = p - si * mean[cols] - sj * mean[:, None] + np.outer(mean, mean[cols]) * wm
+            frob += float(np.sum(s_blk * s_blk))
+            trace += float(np.trace(s_blk[cols]))
+            inner += float(np.sum(s_blk * yy_blk))
+        # |y|^2 = a - 2 z.mean + m.mean^2 per day (z, m: shifted returns and valid mask)
+        fourth = (self._a2 + 4.0 * float(mean @ self._p @ mean) + float(mean2 @ self._wm @ mean2)
+                  - 4.0 * float(self._q @ mean) + 2.0 * float(self._qm @ mean2) - 4.0 * float(mean @ self._sm @ mean2))
+        return trace, frob, fourth - 2.0 * inner + t * frob
+
+    def _block(self, r: np.ndarray, c: np.ndarray) -> np.ndarray:
+        p = self._p[np.ix_(r, c)]
+        w = self._w if self._wm is None else self._wm[np.ix_(r, c)]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if self.method == "ewma":
+                return np.where(w > 0, p / w, np.nan)
+            if self._wm is None:
+                si, sj = self._s[r][:, None], self._s[c][None, :]
+            else:
+                si, sj = self._sm[np.ix_(r, c)], self._sm[np.ix_(c, r)].T
+            cross = p - si * sj / w
+            if self.method == "sample":
+                return np.where(w > 1, cross / (w - 1), np.nan)
+            intensity, mu = self.shrinkage()
+            out = np.where(w > 0, (1.0 - intensity) * cross / w, np.nan)
+        out[r[:, None] == c[None, :]] += intensity * mu
+        return out
+
+    def covariance(self, columns=None) -> pd.DataFrame:
+        """Covariance matrix of `columns` (default: all), as a DataFrame."""
+        pos = self._positions(columns)
+        out = np.empty((len(pos), len(pos)))
+        for c in range(0, len(pos), self.block):
+            out[:, c:c + self.block] = self._block(pos, pos[c:c + self.block])
+        names = self.columns[pos]
+        return pd.DataFrame(out, index=names, columns=names)
+
+    def correlation(self, columns=None) -> pd.DataFrame:
+        cov = self.covariance(columns)
+        values = cov.to_numpy()
+        sd = np.sqrt(np.diag(values))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = np.clip(values / np.outer(sd, sd), -1.0, 1.0)
+        np.fill_diagonal(corr, np.where(sd > 0, 1.0, np.nan))
+        return pd.DataFrame(corr, index=cov.index, columns=cov.columns)
+
+    @property
+    def nbytes(self) -> int:
+        parts = [self._p, self._s, self._q, self._shift] + [a for a in (self._wm, self._sm, self._qm) if a is not None]
+        return int(sum(a.nbytes for a in parts))
+
+    def copy(self) -> "CovarianceEngine":
+        new = copy.copy(self)
+        for name in ("_shift", "_s", "_p", "_wm", "_sm", "_q", "_qm"):
+            value = getattr(self, name)
+            setattr(new, name, None if value is None else value.copy())
+        return new
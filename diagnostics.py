@@ -0,0 +1,286 @@
+# diagnostics.py
+from __future__ import annotations
+import contextlib
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable
+
+# Per-stage timing / memory instrumentation for the pipeline.
+#
+# Off by default. Turn on for the whole process with PIPELINE_DIAGNOSTICS=1
+# (or enable()), or for one thread's run with begin_run(force=True): the app
+# does that for sessions opened with ?diagnostics=1, so one visitor's flag
+# does not switch it on for everyone. While off, stage() hands back one shared
+# no-op context and @timed functions cost two flag checks, so the
+# instrumentation can stay in place permanently.
+#
+# While on, each stage records wall time and the change in process RSS. Stages
+# run between begin_run()/end_run() (one app rerun) are grouped into a Run, and
+# the last MAX_RUNS runs are kept. Totals per stage and per-stage cache
+# hit/miss counts are kept for the whole process. With PIPELINE_DIAGNOSTICS_DIR
+# set, every finished run rewrites diagnostics.json and diagnostics.prom
+# (Prometheus text format) there, for scraping.
+
+MAX_RUNS = int(os.environ.get("PIPELINE_DIAGNOSTICS_RUNS", "20"))
+# Unfinished runs kept (sessions that stopped mid-run and never came back)
+MAX_OPEN = 64
+EXPORT_DIR = os.environ.get("PIPELINE_DIAGNOSTICS_DIR", "")
+
+_enabled = os.environ.get("PIPELINE_DIAGNOSTICS", "") not in ("", "0")
+_lock = threading.Lock()
+_local = threading.local()
+_runs: deque = deque(maxlen=MAX_RUNS)
+_open: dict = {}                      # session -> Run not finished yet (e.g. after st.stop())
+_totals: dict[str, list] = {}         # stage -> [calls, seconds]
+_cache: dict[str, list] = {}          # stage -> [hits, misses]
+_gauges: dict[str, Callable[[], dict]] = {}
+_NULL = contextlib.nullcontext()
+
+
+def enabled() -> bool:
+    """True if collecting on this thread (process-wide, or forced for the current run)."""
+    return _enabled or getattr(_local, "forced", False)
+
+
+def enable(flag: bool = True) -> None:
+    global _enabled
+    _enabled = bool(flag)
+
+
+def _rss() -> int:
+    """Current resident set size in bytes (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except Exception:
+            return 0
+
+
+class Run:
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.seconds: float | None = None
+        self.completed = False
+        self.stages: list[dict] = []
+        self.cache: dict[str, list] = {}
+
+    def finish(self, completed: bool) -> None:
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self._t0
+        self.completed = completed
+
+    def as_dict(self) -> dict:
+        return {
+            "label": self.label,
+            "started": self.started,
+            "seconds": self.seconds,
+            "completed": self.completed,
+            "stages": self.stages,
+            "cache": {k: {"hits": h, "misses": m} for k, (h, m) in self.cache.items()},
+        }
+
+
+@contextlib.contextmanager
+def _stage(name: str):
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    depth = len(stack)
+    stack.append(name)
+    rss0 = _rss()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        rss_delta = _rss() - rss0
+        stack.pop()
+        with _lock:
+            total = _totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+        run = getattr(_local, "run", None)
+        if run is not None:
+            run.stages.append({"stage": name, "depth": depth, "seconds": seconds, "rss_delta": rss_delta})
+
+
+def stage(name: str):
+    """Context manager timing one pipeline stage (no-op while diagnostics are off)."""
+    if not (_enabled or getattr(_local, "forced", False)):
+        return _NULL
+    return _stage(name)
+
+
+def timed(name: str):
+    """Decorator form of stage()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not (_enabled or getattr(_local, "forced", False)):
+                return fn(*args, **kwargs)
+            with _stage(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def count_cache(name: str, hit: bool) -> None:
+    """Record a cache hit or miss for stage `name` (called by cache.cached)."""
+    if not (_enabled or getattr(_local, "forced", False)):
+        return
+    i = 0 if hit else 1
+    with _lock:
+        _cache.setdefault(name, [0, 0])[i] += 1
+    run = getattr(_local, "run", None)
+    if run is not None:
+        run.cache.setdefault(name, [0, 0])[i] += 1
+
+
+def register_gauges(name: str, fn: Callable[[], dict]) -> None:
+    """fn() -> {metric: number}, sampled into every export as pipeline_<name>_<metric>."""
+    _gauges[name] = fn
+
+
+def begin_run(label: str = "rerun", session=None, force: bool = False) -> None:
+    """
+    Start collecting stages on this thread as one run; force=True collects
+    even while diagnostics are off process-wide (until the next begin_run on
+    this thread). A run of the same session that never reached end_run()
+    (st.stop(), an exception) is closed and kept as incomplete, as are the
+    oldest unfinished runs beyond MAX_OPEN.
+    """
+    _local.forced = bool(force)
+    if not enabled():
+        _local.run = None
+        return
+    with _lock:
+        stale = [_open.pop(session, None)]
+        while len(_open) >= MAX_OPEN:
+            stale.append(_open.pop(next(iter(_open))))
+        for run in stale:
+            if run is not None:
+                run.finish(completed=False)
+                _runs.append(run)
+        run = Run(label)
+        _open[session] = run
+    _local.run = run
+
+
+def end_run(session=None) -> None:
+    if not enabled():
+        return
+    _local.run = None
+    with _lock:
+        run = _open.pop(session, None)
+        if run is None:
+            return
+        run.finish(completed=True)
+        _runs.append(run)
+    if EXPORT_DIR:
+        # Exports are best effort: a full disk or a removed folder must not break the page run
+        with contextlib.suppress(OSError):
+            write_exports(EXPORT_DIR)
+
+
+def runs() -> list[dict]:
+    """Recent runs, oldest first."""
+    with _lock:
+        return [r.as_dict() for r in _runs]
+
+
+def snapshot() -> dict:
+    with _lock:
+        out = {
+            "enabled": _enabled,
+            "runs": [r.as_dict() for r in _runs],
+            "stages": {k: {"calls": c, "seconds": s} for k, (c, s) in _totals.items()},
+            "cache": {k: {"hits": h, "misses": m} for k, (h, m) in _cache.items()},
+        }
+    out["gauges"] = {name: fn() for name, fn in list(_gauges.items())}
+    return out
+
+
+def reset() -> None:
+    with _lock:
+        _runs.clear()
+        _open.clear()
+        _totals.clear()
+        _cache.clear()
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(snap: dict | None = None) -> str:
+    snap = snapshot() if snap is None else snap
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lab = ",".join(f'{k}="{_label(str(v))}"' for k, v in labels.items())
+            lines.append(f"{name}{{{lab}}} {value}" if lab else f"{name} {value}")
+
+    stages = snap["stages"]
+    metric("pipeline_stage_calls_total", "counter", "Times each pipeline stage ran.",
+           [({"stage": k}, v["calls"]) for k, v in sorted(stages.items())])
+    metric("pipeline_stage_seconds_total", "counter", "Wall seconds spent in each pipeline stage.",
+           [({"stage": k}, f"{v['seconds']:.6f}") for k, v in sorted(stages.items())])
+    cache = snap["cache"]
+    metric("pipeline_cache_hits_total", "counter", "Cache hits per stage.",
+           [({"stage": k}, v["hits"]) for k, v in sorted(cache.items())])
+    metric("pipeline_cache_misses_total", "counter", "Cache misses per stage.",
+           [({"stage": k}, v["misses"]) for k, v in sorted(cache.items())])
+    done = [r for r in snap["runs"] if r["seconds"] is not None]
+    if done:
+        last = done[-1]
+        metric("pipeline_last_run_seconds", "gauge", "Wall seconds of the most recent run.",
+               [({"label": last["label"]}, f"{last['seconds']:.6f}")])
+        per_stage: dict[str, float] = {}
+        for s in last["stages"]:
+            per_stage[s["stage"]] = per_stage.get(s["stage"], 0.0) + s["seconds"]
+        metric("pipeline_last_run_stage_seconds", "gauge", "Wall seconds per stage in the most recent run.",
+               [({"stage": k}, f"{v:.6f}") for k, v in sorted(per_stage.items())])
+    for group, values in sorted(snap.get("gauges", {}).items()):
+        for k, v in sorted(values.items()):
+            if isinstance(v, (int, float)):
+                metric(f"pipeline_{group}_{k}", "gauge", f"{group} {k}.", [({}, v)])
+    return "\n".join(lines) + "\n"
+
+
+def _atomic_write_text(path: Path, text: str) -> None:
+    # A temp file of its own per call: sessions finishing together export concurrently
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+def write_exports(folder) -> tuple[Path, Path]:
+    """Write diagnostics.json and diagnostics.prom into folder; returns both paths."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    snap = snapshot()
+    json_path, prom_path = folder / "diagnostics.json", folder / "diagnostics.prom"
+    _atomic_write_text(json_path, json.dumps(snap, indent=2, default=str))
+    _atomic_write_text(prom_path, prometheus_text(snap))
+    return json_path, prom_path
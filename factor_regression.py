@@ -0,0 +1,122 @@
+# factor_regression.py
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+
+import diagnostics
+
+# Factor regressions for many return series at once.
+#
+# Every column of Y is regressed on the same design matrix [1, factors], so a
+# single QR factorization of X serves all of them: B = R^-1 Q' Y. Columns with
+# missing values are grouped by their NaN pattern and each group is solved
+# the same way on its own rows. Standard errors are the classic OLS ones
+# (what sm.OLS(y, X).fit() reports by default).
+
+FF3 = ["Mkt-RF", "SMB", "HML"]
+
+
+def _solve_block(X: np.ndarray, Y: np.ndarray) -> dict[str, np.ndarray]:
+    n, p = X.shape
+    q, r = np.linalg.qr(X)
+    coef = np.linalg.solve(r, q.T @ Y)                       # p x k
+    resid = Y - X @ coef
+    sse = np.einsum("ij,ij->j", resid, resid)
+    dof = n - p
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma2 = sse / dof
+        r_inv = np.linalg.inv(r)
+        xtx_inv_diag = np.einsum("ij,ij->i", r_inv, r_inv)    # diag((X'X)^-1)
+        se = np.sqrt(np.outer(xtx_inv_diag, sigma2))
+        t = coef / se
+        centered = Y - Y.mean(axis=0)
+        sst = np.einsum("ij,ij->j", centered, centered)
+        r2 = 1.0 - sse / sst
+    return {"coef": coef, "t": t, "r2": r2, "n": np.full(Y.shape[1], n)}
+
+
+@diagnostics.timed("ols")
+def batch_ols(Y: pd.DataFrame, X: pd.DataFrame, add_constant: bool = True) -> pd.DataFrame:
+    """
+    Regress every column of Y on X in one solve per NaN pattern.
+    Returns one row per column of Y: coefficients, their t-stats ("t(...)"),
+    R2 and the number of observations.
+    """
+    Y, X = Y.align(X, join="inner", axis=0)
+    X = X.dropna()
+    Y = Y.loc[X.index]
+    names = (["Alpha"] if add_constant else []) + list(X.columns)
+    xv = X.to_numpy(dtype=np.float64)
+    if add_constant:
+        xv = np.column_stack([np.ones(len(xv)), xv])
+    yv = Y.to_numpy(dtype=np.float64)
+    p = xv.shape[1]
+
+    coef = np.full((p, yv.shape[1]), np.nan)
+    tstat = np.full((p, yv.shape[1]), np.nan)
+    r2 = np.full(yv.shape[1], np.nan)
+    nobs = np.zeros(yv.shape[1], dtype=np.int64)
+
+    valid = ~np.isnan(yv)
+    patterns, group = np.unique(valid.T, axis=0, return_inverse=True)
+    for g, rows in enumerate(patterns):
+        cols = np.flatnonzero(group.ravel() == g)
+        if rows.sum() <= p:
+            continue
+        res = _solve_block(xv[rows], yv[rows][:, cols])
+        coef[:, cols] = res["coef"]
+        tstat[:, cols] = res["t"]
+        r2[cols] = res["r2"]
+        nobs[cols] = res["n"]
+
+    out = pd.DataFrame(coef.T, index=Y.columns, columns=names)
+    for i, name in enumerate(names):
+        out[f"t({name})"] = tstat[i]
+    out["R2"] = r2
+    out["N"] = nobs
+    return out
+
+
+def factor_loadings(returns: pd.DataFrame, factors: pd.DataFrame, factor_cols=FF3) -> pd.DataFrame:
+    """Alpha, betas, t-stats and R2 of excess returns (returns - RF) on factor_cols, per column."""
+    returns, factors = returns.align(factors, join="inner", axis=0)
+    excess = returns.sub(factors["RF"], axis=0)
+    return batch_ols(excess, factors[list(factor_cols)])
+
+
+@diagnostics.timed("rolling_betas")
+def rolling_betas(returns: pd.DataFrame, factors: pd.DataFrame, window: int = 63,
+                  factor_cols=FF3, chunk: int = 256) -> dict[str, pd.DataFrame]:
+    """
+    Rolling-window OLS of excess returns on factor_cols for every column.
+    Returns {"Alpha": df, "<factor>": df, ...}, each dates x tickers; NaN
+    until a full window of complete rows is available. Uses rolling sums of
+    X'X and X'y, solved for all windows and a chunk of columns at a time.
+    """
+    returns, factors = returns.align(factors, join="inner", axis=0)
+    factors = factors[list(factor_cols) + ["RF"]].dropna()
+    returns = returns.loc[factors.index]
+    excess = returns.sub(factors["RF"], axis=0).to_numpy(dtype=np.float64)
+    x = np.column_stack([np.ones(len(factors)), factors[list(factor_cols)].to_numpy(dtype=np.float64)])
+    n, p = x.shape
+    names = ["Alpha"] + list(factor_cols)
+    out = {name: np.full(excess.shape, np.nan) for name in names}
+    if n < window:
+        return {name: pd.DataFrame(v, index=returns.index, columns=returns.columns) for name, v in out.items()}
+
+    def windowed(a: np.ndarray) -> np.ndarray:
+        c = np.cumsum(a, axis=0)
+        return np.concatenate([c[window - 1:window], c[window:] - c[:-window]], axis=0)
+
+    xx = windowed(np.einsum("ti,tj->tij", x, x))             # (n-w+1) x p x p
+    for start in range(0, excess.shape[1], chunk):
+        y = excess[:, start:start + chunk]
+        bad = np.isnan(y)
+        yz = np.where(bad, 0.0, y)
+        xy = windowed(np.einsum("ti,tk->tik", x, yz))        # (n-w+1) x p x k
+        nbad = windowed(bad.astype(np.int64))
+        coef = np.linalg.solve(xx, xy)                        # (n-w+1) x p x k
+        coef[np.broadcast_to((nbad > 0)[:, None, :], coef.shape)] = np.nan
+        for i, name in enumerate(names):
+            out[name][window - 1:, start:start + chunk] = coef[:, i, :]
+    return {name: pd.DataFrame(v, index=returns.index, columns=returns.columns) for name, v in out.items()}
@@ -0,0 +1,231 @@
+# factors.py
+from __future__ import annotations
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import diagnostics
+
+# Local store for Ken French's daily factor datasets.
+#
+# Each dataset is kept parsed and typed (dates + float64 values in an .npz,
+# plus a small .json with ETag/Last-Modified and fetch time), so loading it is
+# a file read instead of a download + unzip + CSV parse. Lookup order:
+#   1. FACTOR_DIR (refreshed copy, written after each successful download)
+#   2. SNAPSHOT_DIR (snapshot for offline hosts; not shipped, generate it with
+#      `python factors.py ff3 ff5 mom` on a host that can reach the library
+#      and copy or commit factor_snapshots/ along with the app)
+#   3. a blocking download, only when neither exists
+# When the local copy is older than REFRESH_SECONDS a background thread asks
+# the server for a new version (conditional GET) while the old one is served.
+# A failed blocking download is not retried for RETRY_SECONDS, and connecting
+# gives up after CONNECT_TIMEOUT, so a host that cannot reach the library
+# fails fast on every rerun instead of waiting out the read timeout each time.
+
+ROOT = Path(__file__).resolve().parent
+FACTOR_DIR = ROOT / ".factor_store"
+SNAPSHOT_DIR = ROOT / "factor_snapshots"
+BASE_URL = "https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/"
+REFRESH_SECONDS = float(os.environ.get("FACTOR_REFRESH_SECONDS", 24 * 3600))
+RETRY_SECONDS = float(os.environ.get("FACTOR_RETRY_SECONDS", 300))
+CONNECT_TIMEOUT = float(os.environ.get("FACTOR_CONNECT_TIMEOUT", 5))
+OFFLINE = os.environ.get("FACTORS_OFFLINE", "") not in ("", "0")
+
+DATASETS = {
+    "ff3": "F-F_Research_Data_Factors_daily_CSV.zip",
+    "ff5": "F-F_Research_Data_5_Factors_2x3_daily_CSV.zip",
+    "mom": "F-F_Momentum_Factor_daily_CSV.zip",
+}
+
+_refreshing: set[str] = set()
+_refresh_lock = threading.Lock()
+_failed_at: dict[str, float] = {}  # dataset -> time of the last failed blocking download
+
+
+def parse_french_csv(text: str) -> pd.DataFrame:
+    """
+    Parse the first daily table of a French data-library CSV.
+    The table starts at the first header line with an empty first field
+    (",Mkt-RF,SMB,..." or "     ,Mom") and ends at the first line whose date
+    field is not YYYYMMDD.
+    """
+    lines = text.splitlines()
+    start = next(
+        (i for i, line in enumerate(lines) if "," in line and not line.split(",")[0].strip()),
+        None,
+    )
+    if start is None:
+        raise ValueError("No factor table found.")
+    columns = [c.strip() for c in lines[start].split(",")[1:]]
+
+    dates, rows = [], []
+    for line in lines[start + 1:]:
+        parts = line.split(",")
+        day = parts[0].strip()
+        if len(day) != 8 or not day.isdigit():
+            break
+        dates.append(day)
+        rows.append([float(p) for p in parts[1:len(columns) + 1]])
+
+    values = np.asarray(rows, dtype=np.float64).reshape(len(rows), len(columns))
+    # -99.99 / -999 are the library's missing-value markers
+    values[(values <= -99.99)] = np.nan
+    index = pd.DatetimeIndex(pd.to_datetime(dates, format="%Y%m%d"), name="Date")
+    return pd.DataFrame(values / 100.0, index=index, columns=columns)
+
+
+def _paths(name: str, folder: Path) -> tuple[Path, Path]:
+    return folder / f"{name}.npz", folder / f"{name}.json"
+
+
+def _read(name: str, folder: Path) -> tuple[pd.DataFrame, dict] | None:
+    data_path, meta_path = _paths(name, folder)
+    try:
+        with np.load(data_path, allow_pickle=False) as z:
+            index = pd.DatetimeIndex(z["dates"].astype("datetime64[ns]"), name="Date")
+            df = pd.DataFrame(z["values"], index=index, columns=[str(c) for c in z["columns"]])
+    except (OSError, ValueError, KeyError):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+    return df, meta
+
+
+def _write(name: str, folder: Path, df: pd.DataFrame, meta: dict) -> None:
+    folder.mkdir(parents=True, exist_ok=True)
+    data_path, meta_path = _paths(name, folder)
+    tmp = data_path.with_name(data_path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            dates=df.index.as_unit("ns").asi8,
+            values=df.to_numpy(dtype=np.float64),
+            columns=np.asarray(df.columns, dtype=str),
+        )
+    os.replace(tmp, data_path)
+    _write_meta(meta_path, meta)
+
+
+def _write_meta(meta_path: Path, meta: dict) -> None:
+    tmp = meta_path.with_name(meta_path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+
+@diagnostics.timed("factor_fetch")
+def fetch(name: str, meta: dict | None = None, folder: Path = FACTOR_DIR, timeout: float = 60) -> bool:
+    """
+    Download dataset `name` into folder. Sends If-None-Match/If-Modified-Since
+    from meta, so an unchanged file costs one 304 round trip.
+    Returns True if new data was written.
+    """
+    meta = dict(meta or {})
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    import requests  # only needed when a download actually happens
+
+    r = requests.get(BASE_URL + DATASETS[name], headers=headers, timeout=(min(CONNECT_TIMEOUT, timeout), timeout))
+    if r.status_code == 304:
+        meta["fetched_at"] = time.time()
+        _write_meta(_paths(name, folder)[1], meta)
+        return False
+    r.raise_for_status()
+
+    with zipfile.ZipFile(io.BytesIO(r.content)) as z:
+        with z.open(z.namelist()[0]) as f:
+            df = parse_french_csv(f.read().decode("latin-1"))
+    _write(name, folder, df, {
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "fetched_at": time.time(),
+    })
+    return True
+
+
+def _refresh_worker(name: str, meta: dict) -> None:
+    try:
+        fetch(name, meta)
+    except Exception:
+        pass  # keep serving the copy we have; retried on the next stale load
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(name)
+
+
+def refresh_in_background(name: str, meta: dict | None = None) -> None:
+    if OFFLINE:
+        return
+    with _refresh_lock:
+        if name in _refreshing:
+            return
+        _refreshing.add(name)
+    threading.Thread(target=_refresh_worker, args=(name, meta or {}), daemon=True).start()
+
+
+def version(name: str) -> int:
+    """Changes whenever the local copy of dataset `name` is rewritten."""
+    for folder in (FACTOR_DIR, SNAPSHOT_DIR):
+        try:
+            return os.stat(_paths(name, folder)[0]).st_mtime_ns
+        except OSError:
+            continue
+    return 0
+
+
+@diagnostics.timed("factors")
+def load_factors(name: str = "ff3", start_date="2020-01-01") -> pd.DataFrame:
+    """
+    Daily factors for dataset `name` ("ff3", "ff5" or "mom") from start_date on,
+    as decimals. Served from disk; stale copies are refreshed in the background.
+    """
+    if name not in DATASETS:
+        raise ValueError(f"Unknown factor dataset {name!r}; choose from {sorted(DATASETS)}.")
+
+    local = _read(name, FACTOR_DIR)
+    if local is None:
+        local = _read(name, SNAPSHOT_DIR)
+        if local is not None:
+            # No refreshed copy yet: the next fetch must be unconditional so
+            # FACTOR_DIR actually gets data rather than a 304
+            local = (local[0], {"fetched_at": local[1].get("fetched_at", 0)})
+    if local is None:
+        if OFFLINE:
+            raise FileNotFoundError(f"No local copy of factor dataset {name!r} and FACTORS_OFFLINE is set.")
+        if time.time() - _failed_at.get(name, -RETRY_SECONDS) < RETRY_SECONDS:
+            raise FileNotFoundError(f"No local copy of factor dataset {name!r}; the last download failed.")
+        try:
+            fetch(name)
+        except Exception:
+            _failed_at[name] = time.time()
+            raise
+        _failed_at.pop(name, None)
+        local = _read(name, FACTOR_DIR)
+
+    df, meta = local
+    if time.time() - meta.get("fetched_at", 0) > REFRESH_SECONDS:
+        refresh_in_background(name, meta)
+    return df.loc[df.index >= pd.to_datetime(start_date)]
+
+
+if __name__ == "__main__":
+    # Write the offline snapshot (SNAPSHOT_DIR): python factors.py [ff3 ff5 mom]
+    import sys
+
+    for ds in sys.argv[1:] or list(DATASETS):
+        fetch(ds, folder=SNAPSHOT_DIR)
+        print(f"{ds}: written to {SNAPSHOT_DIR}")
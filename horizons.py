@@ -0,0 +1,86 @@
+# horizons.py
+from __future__ import annotations
+import pandas as pd
+
+# Time-range presets resolved to integer row bounds on a sorted DatetimeIndex.
+# Bounds come from a binary search (searchsorted) instead of a boolean mask
+# over the whole index, and consumers slice with .iloc[lo:hi], which does not
+# copy the panel the way .loc[mask] does.
+
+TIME_RANGE_PRESETS = ["YTD", "3M", "6M", "1Y", "3Y", "Max"]
+# Rolling-vol windows offered in the UI; the cache computes them together so switching is free
+VOL_WINDOWS = (5, 21, 63)
+
+
+def preset_start(end: pd.Timestamp, preset: str) -> pd.Timestamp | None:
+    """First date of preset ending at end; None means from the first row ("Max"/unknown)."""
+    if preset == "YTD":
+        return pd.Timestamp(end.year, 1, 1)
+    if preset == "3M":
+        return end - pd.DateOffset(months=3)
+    if preset == "6M":
+        return end - pd.DateOffset(months=6)
+    if preset == "1Y":
+        return end - pd.DateOffset(years=1)
+    if preset == "3Y":
+        return end - pd.DateOffset(years=3)
+    return None
+
+
+class HorizonIndex:
+    """
+    Row bounds for presets and custom ranges over one sorted DatetimeIndex.
+    calendar: optional business-day offset (e.g. pd.offsets.BDay() or a
+    CustomBusinessDay with holidays); custom start/end dates are rolled onto
+    it (start forward, end back) before the lookup.
+    """
+
+    def __init__(self, index: pd.DatetimeIndex, calendar: pd.offsets.BaseOffset | None = None):
+        if not index.is_monotonic_increasing:
+            raise ValueError("HorizonIndex needs a sorted index.")
+        self.index = index
+        self.calendar = calendar
+        self._presets: dict[str, tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def bounds(self, preset: str | None = None, start=None, end=None) -> tuple[int, int]:
+        """
+        Half-open [lo, hi) rows for a preset (relative to the last date) or for
+        start/end dates (inclusive; None = open-ended).
+        """
+        if len(self.index) == 0:
+            return 0, 0
+        if preset is not None and start is None and end is None:
+            if preset not in self._presets:
+                first = preset_start(self.index[-1], preset)
+                lo = 0 if first is None else int(self.index.searchsorted(first, side="left"))
+                self._presets[preset] = (lo, len(self.index))
+            return self._presets[preset]
+
+        if start is not None:
+            start = pd.Timestamp(start)
+            if self.calendar is not None:
+                start = self.calendar.rollforward(start)
+        if end is not None:
+            end = pd.Timestamp(end)
+            if self.calendar is not None:
+                end = self.calendar.rollback(end)
+        if preset is not None and start is None:
+            start = preset_start(end if end is not None else self.index[-1], preset)
+        lo = 0 if start is None else int(self.index.searchsorted(start, side="left"))
+        hi = len(self.index) if end is None else int(self.index.searchsorted(end, side="right"))
+        return lo, max(lo, hi)
+
+    def dates(self, preset: str | None = None, start=None, end=None) -> tuple[pd.Timestamp, pd.Timestamp] | None:
+        """First and last index date inside the range, or None if it is empty."""
+        lo, hi = self.bounds(preset, start, end)
+        if hi <= lo:
+            return None
+        return self.index[lo], self.index[hi - 1]
+
+    def slice(self, obj, preset: str | None = None, start=None, end=None):
+        """obj (indexed like self.index) restricted to the range, via .iloc (no copy)."""
+        lo, hi = self.bounds(preset, start, end)
+        return obj.iloc[lo:hi]
@@ -0,0 +1,316 @@
+# ingest.py
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from loaders import read_ohlcv
+from utils import DATA_DIR, YAHOO_ALIAS
+
+# Bulk price ingestion into DATA_DIR (the folder the app and price store read).
+#
+# Tickers are fetched in multi-symbol batches on a bounded thread pool, with
+# retry + exponential backoff per batch. Existing CSVs are only topped up with
+# rows newer than their last date. The request starts at that last date, so a
+# good answer always holds at least the stored row: an answer with nothing
+# after it is "unchanged", while an empty answer (unknown symbol, network
+# trouble) is retried and then reported as failed. Rows are written in the
+# file's own layout
+# (Nasdaq: newest first, MM/DD/YYYY, optional "$"; Yahoo: oldest first,
+# YYYY-MM-DD), and every write goes through a temp file + os.replace so the
+# app never sees a half-written CSV. A manifest of what happened is written
+# next to the data.
+
+MANIFEST_NAME = "ingest_manifest.json"
+FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+YAHOO_HEADER = ["Date", "Close", "High", "Low", "Open", "Volume"]
+
+
+class YahooSource:
+    """Batched yfinance downloads. fetch() returns {ticker: OHLCV DataFrame}."""
+
+    def __init__(self, alias: dict | None = None):
+        self.alias = YAHOO_ALIAS if alias is None else alias
+
+    def fetch(self, tickers: list[str], start: str | None) -> dict[str, pd.DataFrame]:
+        import yfinance as yf
+
+        symbols = {self.alias.get(t, t): t for t in tickers}
+        data = yf.download(
+            list(symbols), start=start, group_by="ticker", auto_adjust=True,
+            progress=False, threads=False,
+        )
+        out = {}
+        if data is None or data.empty:
+            return out
+        for symbol, ticker in symbols.items():
+            if isinstance(data.columns, pd.MultiIndex):
+                if symbol not in data.columns.get_level_values(0):
+                    continue
+                df = data[symbol]
+            else:
+                df = data
+            df = df[[c for c in FIELDS if c in df.columns]].dropna(how="all")
+            if not df.empty:
+                out[ticker] = df
+        return out
+
+
+class LocalSource:
+    """
+    Stand-in for Yahoo that serves OHLCV from CSVs in a local folder, for
+    tests and offline runs. Tickers in `fail` raise, to exercise retries.
+    """
+
+    def __init__(self, folder: Path, fail: set[str] | None = None):
+        self.folder = Path(folder)
+        self.fail = set(fail or ())
+        self.calls: list[list[str]] = []
+
+    def fetch(self, tickers: list[str], start: str | None) -> dict[str, pd.DataFrame]:
+        self.calls.append(list(tickers))
+        bad = self.fail.intersection(tickers)
+        if bad:
+            raise RuntimeError(f"stub failure for {sorted(bad)}")
+        out = {}
+        for t in tickers:
+            path = self.folder / f"{t}.csv"
+            if not path.exists():
+                continue
+            df = read_ohlcv(path)
+            if start is not None:
+                df = df.loc[df.index >= pd.Timestamp(start)]
+            if not df.empty:
+                out[t] = df
+        return out
+
+
+def _read_layout(path: Path) -> tuple[list[str], list[str], bool]:
+    """(header, data lines, is_nasdaq) of an existing CSV."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    header = lines[0].split(",")
+    body = [line for line in lines[1:] if line.strip()]
+    return header, body, "Close/Last" in header
+
+
+def _last_date(path: Path) -> pd.Timestamp | None:
+    try:
+        df = pd.read_csv(path, usecols=["Date"], dtype=str)
+    except (OSError, ValueError):
+        return None
+    dates = pd.to_datetime(df["Date"], errors="coerce").dropna()
+    return None if dates.empty else dates.max()
+
+
+def _format_rows(df: pd.DataFrame, header: list[str], nasdaq: bool, dollar: bool) -> list[str]:
+    fields = {"Close/Last": "Close"}
+    rows = []
+    for date, rec in df.iterrows():
+        parts = []
+        for col in header:
+            if col == "Date":
+                parts.append(date.strftime("%m/%d/%Y" if nasdaq else "%Y-%m-%d"))
+                continue
+            value = rec.get(fields.get(col, col))
+            if pd.isna(value):
+                parts.append("")
+            elif col == "Volume":
+                parts.append(str(int(value)))
+            else:
+                parts.append(f"${value:.4f}".rstrip("0").rstrip(".") if dollar else repr(float(value)))
+        rows.append(",".join(parts))
+    return rows
+
+
+def _atomic_write(path: Path, lines: list[str]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+def write_prices(path: Path, df: pd.DataFrame, replace: bool = False) -> int:
+    """
+    Merge OHLCV rows newer than the CSV's last date into path (or rewrite it
+    from df with replace=True). Returns rows written.
+    """
+    df = df.sort_index()
+    if replace or not path.exists():
+        _atomic_write(path, [",".join(YAHOO_HEADER)] + _format_rows(df, YAHOO_HEADER, False, False))
+        return len(df)
+
+    last = _last_date(path)
+    if last is not None:
+        df = df.loc[df.index > last]
+    if df.empty:
+        return 0
+
+    header, body, nasdaq = _read_layout(path)
+    if nasdaq:
+        first = next((line for line in body if line), "")
+        dollar = "$" in first.split(",")[1] if "," in first else False
+        new = _format_rows(df.iloc[::-1], header, True, dollar)
+        lines = [",".join(header)] + new + body
+    else:
+        new = _format_rows(df, header, False, False)
+        lines = [",".join(header)] + body + new
+    _atomic_write(path, lines)
+    return len(df)
+
+
+def _fetch_batch(source, batch: list[str], start: str | None, retries: int, backoff: float, top_up: bool):
+    """
+    Fetch one batch with retry/backoff. Returns (got, errors, unchanged).
+    With top_up, start is the tickers' last stored date, and a ticker is
+    unchanged only when its answer contains that date and nothing later.
+    """
+    anchor = pd.Timestamp(start) if top_up else None
+    got, errors, unchanged = {}, {}, []
+    pending = list(batch)
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            result = source.fetch(pending, start)
+        except Exception as e:
+            result = {}
+            if len(pending) == 1:
+                errors[pending[0]] = f"{type(e).__name__}: {e}"
+            else:
+                # One bad symbol can sink a whole batch; split it up
+                for t in pending:
+                    try:
+                        result.update(source.fetch([t], start))
+                    except Exception as e1:
+                        errors[t] = f"{type(e1).__name__}: {e1}"
+        if anchor is not None:
+            same = [t for t in pending if t in result and result[t].index.max() == anchor]
+            unchanged += same
+            for t in same:
+                errors.pop(t, None)
+            pending = [t for t in pending if t not in same]
+
+        for t in pending:
+            if t in result:
+                got[t] = result[t]
+                errors.pop(t, None)
+            else:
+                errors.setdefault(t, "no data returned")
+        pending = [t for t in pending if t not in got]
+        if not pending:
+            break
+    return got, errors, unchanged
+
+
+def ingest(
+    tickers: list[str],
+    data_dir: Path = DATA_DIR,
+    source=None,
+    start: str = "2020-01-01",
+    incremental: bool = True,
+    batch_size: int = 20,
+    max_workers: int = 4,
+    retries: int = 2,
+    backoff: float = 1.0,
+    manifest_path: Path | None = None,
+) -> dict:
+    """
+    Download tickers into data_dir. With incremental=True, tickers that already
+    have a CSV are only asked for dates from their last row on (grouped by that
+    date so batches stay multi-symbol). Returns the manifest dict.
+    """
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    source = source or YahooSource()
+    # Strip only a literal .csv: Path.stem would turn "BRK.B" into "BRK"
+    tickers = list(dict.fromkeys((t[:-4] if t.lower().endswith(".csv") else t).upper() for t in tickers))
+    started = datetime.now(timezone.utc).isoformat()
+
+    # Group by request start date
+    groups: dict[tuple[str, bool], list[str]] = {}
+    today = pd.Timestamp.today().normalize()
+    unchanged = []
+    for t in tickers:
+        path = data_dir / f"{t}.csv"
+        last = _last_date(path) if incremental and path.exists() else None
+        if last is None:
+            groups.setdefault((start, False), []).append(t)
+        elif last >= today:
+            unchanged.append(t)
+        else:
+            since = last.date().isoformat()
+            groups.setdefault((since, True), []).append(t)
+
+    batches = [
+        (since, top_up, group[i:i + batch_size])
+        for (since, top_up), group in groups.items()
+        for i in range(0, len(group), batch_size)
+    ]
+
+    ok, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(_fetch_batch, source, batch, since, retries, backoff, top_up)
+            for since, top_up, batch in batches
+        ]
+        for fut in as_completed(futures):
+            got, errors, same = fut.result()
+            for t, df in got.items():
+                try:
+                    added = write_prices(data_dir / f"{t}.csv", df, replace=not incremental)
+                except Exception as e:
+                    failed[t] = f"{type(e).__name__}: {e}"
+                    continue
+                ok[t] = {"rows_added": added, "last_date": df.index.max().date().isoformat()}
+            failed.update(errors)
+            unchanged += same
+
+    manifest = {
+        "started": started,
+        "finished": datetime.now(timezone.utc).isoformat(),
+        "incremental": incremental,
+        "ok": dict(sorted(ok.items())),
+        "unchanged": sorted(unchanged),
+        "failed": dict(sorted(failed.items())),
+    }
+    manifest_path = Path(manifest_path) if manifest_path else data_dir / MANIFEST_NAME
+    tmp = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path)
+    return manifest
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Download/update price CSVs in the app's data folder.")
+    ap.add_argument("tickers", nargs="*", help="tickers (default: every CSV already in the data folder)")
+    ap.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    ap.add_argument("--start", default="2020-01-01", help="first date for tickers without a CSV")
+    ap.add_argument("--full", action="store_true", help="re-download instead of appending new dates")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--batch-size", type=int, default=20)
+    ap.add_argument("--retries", type=int, default=2)
+    ap.add_argument("--stub-dir", type=Path, help="serve prices from CSVs in this folder instead of Yahoo")
+    args = ap.parse_args(argv)
+
+    tickers = args.tickers or sorted(p.stem for p in args.data_dir.glob("*.csv"))
+    source = LocalSource(args.stub_dir) if args.stub_dir else None
+    manifest = ingest(
+        tickers, data_dir=args.data_dir, source=source, start=args.start,
+        incremental=not args.full, batch_size=args.batch_size,
+        max_workers=args.workers, retries=args.retries,
+    )
+    print(f"ok: {len(manifest['ok'])}  unchanged: {len(manifest['unchanged'])}  failed: {len(manifest['failed'])}")
+    for t, err in manifest["failed"].items():
+        print(f"  {t}: {err}")
+
+
+if __name__ == "__main__":
+    main()
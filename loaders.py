@@ -0,0 +1,87 @@
+# loaders.py
+from __future__ import annotations
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Fast readers for the two CSV layouts in fixed_stock_data:
+#   Nasdaq export: Date,Close/Last,Volume,Open,High,Low   (MM/DD/YYYY, newest first,
+#                  prices usually "$"-prefixed)
+#   Yahoo/yfinance: Date,Close,High,Low,Open,Volume       (YYYY-MM-DD, oldest first,
+#                  optionally followed by a ",AAPL,AAPL,..." ticker row)
+# The layout is detected from the header block only; then just the needed
+# columns are read as strings, "$" is stripped with a plain string op, and
+# dates are parsed with a fixed format instead of per-element inference.
+
+NASDAQ = "nasdaq"
+YAHOO = "yahoo"
+
+PRICE_FIELDS = ["Open", "High", "Low", "Close"]
+OHLCV = PRICE_FIELDS + ["Volume"]
+
+_DATE_FORMAT = {NASDAQ: "%m/%d/%Y", YAHOO: "ISO8601"}
+_CLOSE_COL = {NASDAQ: "Close/Last", YAHOO: "Close"}
+
+
+def sniff(path: Path) -> tuple[str, list[str], int]:
+    """(layout, header columns, rows to skip after the header) for a price CSV."""
+    with open(path, "r", encoding="utf-8") as f:
+        header = f.readline().strip().split(",")
+        second = f.readline()
+    if "Date" not in header:
+        raise ValueError(f"{Path(path).name} has no 'Date' column.")
+    if "Close/Last" in header:
+        layout = NASDAQ
+    elif "Close" in header:
+        layout = YAHOO
+    else:
+        raise ValueError(f"{Path(path).name} has neither 'Close' nor 'Close/Last'.")
+    # yfinance multi-index exports put a ticker row (empty date) under the header
+    skip = 1 if second.startswith(",") else 0
+    return layout, header, skip
+
+
+def _to_float(col: pd.Series) -> np.ndarray:
+    if col.dtype == object or pd.api.types.is_string_dtype(col.dtype):
+        col = col.str.replace("$", "", regex=False)
+    return pd.to_numeric(col, errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _read(path: Path, wanted: list[str]) -> tuple[pd.DatetimeIndex, dict[str, np.ndarray]]:
+    layout, header, skip = sniff(path)
+    rename = {_CLOSE_COL[layout]: "Close"}
+    source_cols = {rename.get(c, c): c for c in header}
+    usecols = ["Date"] + [source_cols[c] for c in wanted if c in source_cols]
+    # Prices with "$" must be read as text; clean numeric columns go straight to float
+    dtype = {c: str for c in usecols} if layout == NASDAQ else {"Date": str}
+    df = pd.read_csv(
+        path, usecols=usecols, dtype=dtype, skiprows=range(1, 1 + skip),
+        skip_blank_lines=True,
+    )
+
+    dates = pd.to_datetime(df["Date"], format=_DATE_FORMAT[layout], errors="coerce")
+    ok = dates.notna().to_numpy()
+    index = pd.DatetimeIndex(dates[ok], name="Date")
+    cols = {c: _to_float(df[source_cols[c]])[ok] for c in wanted if c in source_cols}
+
+    # Nasdaq files are newest first; everything downstream expects ascending dates
+    if not index.is_monotonic_increasing:
+        order = np.argsort(index.asi8, kind="stable")
+        index = index[order]
+        cols = {c: v[order] for c, v in cols.items()}
+    return index, cols
+
+
+def read_close(path: Path) -> pd.Series:
+    """Close prices (ascending dates, NaN rows dropped) from a Nasdaq or Yahoo CSV."""
+    index, cols = _read(path, ["Close"])
+    s = pd.Series(cols["Close"], index=index, name="Close")
+    return s[~np.isnan(cols["Close"])]
+
+
+def read_ohlcv(path: Path) -> pd.DataFrame:
+    """Open/High/Low/Close/Volume (whichever the file has) with ascending dates."""
+    index, cols = _read(path, OHLCV)
+    df = pd.DataFrame(cols, index=index)
+    return df.dropna(how="all")
@@ -0,0 +1,273 @@
+# metadata.py
+from __future__ import annotations
+import atexit
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+import diagnostics
+from profiles import YF_ALIAS
+
+# Local store for company metadata (sector, industry, market cap, beta, ...).
+#
+# Everything the app reads comes from memory: get() answers at once with
+# whatever is stored. Missing or stale tickers are queued for a refresh on a
+# bounded thread pool, so one slow lookup never blocks the page and a whole
+# universe is fetched WORKERS at a time. Fields expire on their own TTLs
+# (FIELD_TTL): names and sectors rarely change, market caps do. A refresh
+# fetches the ticker's whole record. The staleness check only looks at the
+# fields the caller asked for. The store is one JSON file, rewritten
+# atomically after refreshes.
+#
+# Providers have one method, fetch(ticker) -> {field: value} or None.
+# YahooInfoSource calls yfinance; StubInfoSource serves fixed records for
+# tests and offline runs.
+#   METADATA_OFFLINE=1      serve the store only, never fetch
+#   METADATA_WORKERS=n      concurrent lookups (default 8)
+
+ROOT = Path(__file__).resolve().parent
+STORE_PATH = ROOT / ".metadata_store" / "metadata.json"
+OFFLINE = os.environ.get("METADATA_OFFLINE", "") not in ("", "0")
+WORKERS = int(os.environ.get("METADATA_WORKERS", "8"))
+# A failed lookup is not retried for this long
+RETRY_SECONDS = 3600.0
+_FLUSH_SECONDS = 5.0
+
+DAY = 24 * 3600.0
+FIELD_TTL = {
+    "name": 30 * DAY,
+    "sector": 30 * DAY,
+    "industry": 30 * DAY,
+    "country": 30 * DAY,
+    "website": 30 * DAY,
+    "summary": 30 * DAY,
+    "currency": 30 * DAY,
+    "marketCap": DAY,
+    "trailingPE": DAY,
+    "forwardPE": DAY,
+    "dividendYield": DAY,
+    "beta": 7 * DAY,
+}
+FIELDS = list(FIELD_TTL)
+
+
+class YahooInfoSource:
+    """yfinance Ticker.get_info(), one ticker per call."""
+
+    def __init__(self, alias: dict | None = None):
+        self.alias = YF_ALIAS if alias is None else alias
+
+    def fetch(self, ticker: str) -> dict | None:
+        import yfinance as yf
+
+        tk = yf.Ticker(self.alias.get(ticker, ticker))
+        info = None
+        if hasattr(tk, "get_info"):
+            info = tk.get_info()
+        if not info and hasattr(tk, "info"):
+            info = tk.info
+        if not info:
+            return None
+        return {
+            "name": info.get("longName") or info.get("shortName") or ticker,
+            "sector": info.get("sector"),
+            "industry": info.get("industry"),
+            "country": info.get("country"),
+            "website": info.get("website"),
+            "summary": info.get("longBusinessSummary"),
+            "marketCap": info.get("marketCap"),
+            "trailingPE": info.get("trailingPE"),
+            "forwardPE": info.get("forwardPE"),
+            "dividendYield": info.get("dividendYield"),
+            "beta": info.get("beta"),
+            "currency": info.get("currency"),
+        }
+
+
+class StubInfoSource:
+    """
+    Serves fixed {ticker: {field: value}} records (a dict or a JSON file), for
+    tests and offline runs. Tickers in `fail` raise; `delay` seconds per call
+    stands in for network latency. Calls are recorded in .calls.
+    """
+
+    def __init__(self, records: dict | str | Path, fail: set[str] | None = None, delay: float = 0.0):
+        if not isinstance(records, dict):
+            records = json.loads(Path(records).read_text(encoding="utf-8"))
+        self.records = records
+        self.fail = set(fail or ())
+        self.delay = delay
+        self.calls: list[str] = []
+        self._lock = threading.Lock()
+
+    def fetch(self, ticker: str) -> dict | None:
+        with self._lock:
+            self.calls.append(ticker)
+        if self.delay:
+            time.sleep(self.delay)
+        if ticker in self.fail:
+            raise RuntimeError(f"stub failure for {ticker}")
+        record = self.records.get(ticker)
+        return None if record is None else dict(record)
+
+
+class MetadataStore:
+    def __init__(self, path: Path = STORE_PATH, source=None, workers: int = WORKERS, ttl: dict | None = None):
+        self.path = Path(path)
+        self.source = source
+        self.ttl = dict(FIELD_TTL if ttl is None else ttl)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="metadata")
+        self._lock = threading.Lock()
+        self._records: dict[str, dict] = self._load()  # ticker -> {"values": {...}, "fetched": {...}}
+        self._failed: dict[str, float] = {}
+        self._pending: dict[str, Future] = {}
+        self._dirty = False
+        self._flushed = time.monotonic()
+        # Lookups finished within _FLUSH_SECONDS of exit are still written
+        atexit.register(self.flush)
+
+    # ---- persistence ----------------------------------------------------------
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            return {t: {"values": dict(r["values"]), "fetched": dict(r["fetched"])}
+                    for t, r in data["tickers"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            text = json.dumps({"tickers": self._records})
+            self._dirty = False
+            self._flushed = time.monotonic()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    # ---- reads ------------------------------------------------------------------
+
+    def stale(self, tickers, fields=None, now: float | None = None) -> list[str]:
+        """Tickers with a requested field missing or older than its TTL."""
+        now = time.time() if now is None else now
+        fields = FIELDS if fields is None else list(fields)
+        out = []
+        with self._lock:
+            for t in tickers:
+                fetched = self._records.get(t, {}).get("fetched", {})
+                if any(now - fetched.get(f, -float("inf")) > self.ttl.get(f, DAY) for f in fields):
+                    out.append(t)
+        return out
+
+    def get(self, tickers, fields=None, refresh: bool = True) -> pd.DataFrame:
+        """
+        One row per ticker (columns `fields`, default all) from the store, at
+        once; unknown values are None. Stale or missing tickers are refreshed
+        in the background unless refresh=False.
+        """
+        tickers = list(tickers)
+        fields = FIELDS if fields is None else list(fields)
+        with self._lock:
+            rows = [[self._records.get(t, {}).get("values", {}).get(f) for f in fields] for t in tickers]
+        if refresh:
+            self.refresh(self.stale(tickers, fields), wait=False)
+        return pd.DataFrame(rows, index=pd.Index(tickers, name="Ticker"), columns=fields)
+
+    def lookup(self, ticker: str, wait: bool = True) -> dict | None:
+        """All stored fields of one ticker, refreshing first (and waiting) when stale."""
+        if self.stale([ticker]):
+            self.refresh([ticker], wait=wait)
+        with self._lock:
+            record = self._records.get(ticker)
+            return None if record is None else dict(record["values"])
+
+    # ---- refresh ----------------------------------------------------------------
+
+    def refresh(self, tickers, wait: bool = True) -> int:
+        """
+        Fetch `tickers` on the pool, skipping ones already in flight or that
+        failed within RETRY_SECONDS. With wait=True, returns once they are
+        stored. Returns the number of lookups started.
+        """
+        if self.source is None or OFFLINE:
+            return 0
+        now = time.monotonic()
+        started, futures = 0, []
+        with self._lock:
+            for t in dict.fromkeys(tickers):
+                fut = self._pending.get(t)
+                if fut is None:
+                    if now - self._failed.get(t, -RETRY_SECONDS) < RETRY_SECONDS:
+                        continue
+                    fut = self._pending[t] = self._pool.submit(self._fetch_one, t)
+                    started += 1
+                futures.append(fut)
+        if wait:
+            for fut in futures:
+                fut.result()
+            self.flush()
+        return started
+
+    def _fetch_one(self, ticker: str) -> None:
+        try:
+            with diagnostics.stage("metadata_fetch"):
+                values = self.source.fetch(ticker)
+            error = values is None
+        except Exception:
+            values, error = None, True
+        now = time.time()
+        with self._lock:
+            self._pending.pop(ticker, None)
+            if error:
+                self._failed[ticker] = time.monotonic()
+            else:
+                self._failed.pop(ticker, None)
+                record = self._records.setdefault(ticker, {"values": {}, "fetched": {}})
+                for f in FIELDS:
+                    value = values.get(f)
+                    # Keep the last known value when a lookup comes back without it
+                    if value is not None or f not in record["values"]:
+                        record["values"][f] = value
+                    record["fetched"][f] = now
+                self._dirty = True
+            # Whatever this lookup's outcome, the batch's earlier successes must reach disk
+            due = self._dirty and (not self._pending or time.monotonic() - self._flushed > _FLUSH_SECONDS)
+        if due:
+            self.flush()
+
+    def progress(self) -> dict:
+        with self._lock:
+            return {"tickers": len(self._records), "pending": len(self._pending), "failed": len(self._failed)}
+
+
+def _default_source():
+    import importlib.util
+
+    return YahooInfoSource() if importlib.util.find_spec("yfinance") is not None else None
+
+
+_store: MetadataStore | None = None
+_store_lock = threading.Lock()
+
+
+def store() -> MetadataStore:
+    """Process-wide store on STORE_PATH, fetching from Yahoo when yfinance is installed."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MetadataStore(source=None if OFFLINE else _default_source())
+        return _store
+
+
+diagnostics.register_gauges("metadata", lambda: store().progress())
@@ -0,0 +1,54 @@
+# panel.py
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+
+# Ragged price / return panels.
+#
+# Tickers share one date index but each keeps its own history: a column is
+# NaN before its first and after its last valid row. Validity is described
+# by those two row positions per column (valid_bounds), never by a stored
+# mask, so a column's data is a plain slice and adding or dropping a column
+# does not touch the others. Analytics that combine columns row by row (e.g.
+# portfolio_engine) work on runs of rows over which the set of valid columns
+# is constant (active_segments); there are only as many runs as listing and
+# delisting dates. A NaN inside a column's range (a missing day) is left to
+# each analytic; calculate_returns spans it.
+
+
+def valid_bounds(values) -> tuple[np.ndarray, np.ndarray]:
+    """(first, last) valid row per column; first = n_rows and last = -1 for empty columns."""
+    v = values.to_numpy() if isinstance(values, pd.DataFrame) else np.asarray(values)
+    n = v.shape[0]
+    ok = ~np.isnan(v)
+    has = ok.any(axis=0)
+    first = np.where(has, np.argmax(ok, axis=0), n)
+    last = np.where(has, n - 1 - np.argmax(ok[::-1], axis=0), -1)
+    return first.astype(np.int64), last.astype(np.int64)
+
+
+def valid_slice(panel: pd.DataFrame, column, bounds: tuple[np.ndarray, np.ndarray] | None = None) -> pd.Series:
+    """One column restricted to its first..last valid rows (a view)."""
+    j = panel.columns.get_loc(column)
+    first, last = valid_bounds(panel.iloc[:, [j]]) if bounds is None else (bounds[0][[j]], bounds[1][[j]])
+    return panel.iloc[int(first[0]):int(last[0]) + 1, j]
+
+
+def active_segments(first: np.ndarray, last: np.ndarray, starts: np.ndarray) -> list[tuple[int, int, np.ndarray]]:
+    """
+    Split rows into runs [lo, hi) with a constant set of active columns.
+    Row t counts column j as active when first[j] <= starts[t] <= last[j];
+    starts is non-decreasing (t itself, or the first row of t's rebalance
+    period so membership only changes at rebalances). Returns
+    [(lo, hi, active mask over columns)].
+    """
+    if not len(starts):
+        return []
+    events = np.unique(np.r_[first, last + 1])
+    seg = np.searchsorted(events, starts, side="right")
+    cuts = np.r_[np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]]), len(starts)]
+    out = []
+    for lo, hi in zip(cuts[:-1], cuts[1:]):
+        s = starts[lo]
+        out.append((int(lo), int(hi), (first <= s) & (last >= s)))
+    return out
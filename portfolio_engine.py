@@ -0,0 +1,250 @@
+# portfolio_engine.py
+from __future__ import annotations
+import functools
+import hashlib
+import threading
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+import diagnostics
+from panel import active_segments, valid_bounds
+
+# Returns for many portfolios at once.
+#
+# Portfolios are rows of a weight matrix W (portfolios x tickers), kept sparse
+# since each basket holds a handful of names out of the universe. With daily
+# rebalancing the portfolio returns are one product R @ W.T. With periodic
+# rebalancing the weights drift with prices between rebalance dates:
+# per period, holding values are W * cumprod(1 + R), so the portfolio value
+# path is cumprod(1 + R) @ W.T (still one product over the whole panel) and
+# returns are its period-relative changes.
+#
+# On a ragged panel (panel.py) a basket only holds the members listed at the
+# time: weights are renormalised over the active members, per run of rows
+# with the same active set (daily), or as of each rebalance date (periodic).
+# One product per run; a panel without listings/delistings is a single run.
+
+SCHEMES = ("equal", "inverse_vol", "value")
+REBALANCE = {"M": "M", "Q": "Q", "Y": "Y"}
+
+
+# Optional: scipy ships with statsmodels; fall back to dense weights without it.
+# Imported on first use (~0.1s), not with the app.
+@functools.cache
+def _sparse():
+    try:
+        from scipy import sparse
+    except Exception:
+        return None
+    return sparse
+
+
+def weight_matrix(portfolios: dict, columns, scheme: str = "equal", returns: pd.DataFrame | None = None,
+                  values: pd.Series | None = None):
+    """
+    Build a (portfolios x columns) weight matrix, rows summing to 1.
+    portfolios maps a name to a list of tickers (weighted by scheme) or to a
+    {ticker: weight} dict (custom weights, normalized). Tickers not in
+    columns are skipped.
+      - "equal": 1/n
+      - "inverse_vol": proportional to 1/std of `returns`
+      - "value": proportional to `values` (e.g. market caps)
+    Returns (matrix, names); the matrix is scipy.sparse CSR when available.
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown weighting scheme {scheme!r}; choose from {SCHEMES}.")
+    col = {c: i for i, c in enumerate(columns)}
+    if scheme == "inverse_vol":
+        if returns is None:
+            raise ValueError("inverse_vol weights need returns.")
+        with np.errstate(divide="ignore"):
+            raw = (1.0 / returns.std()).replace(np.inf, np.nan)
+    elif scheme == "value":
+        if values is None:
+            raise ValueError("value weights need values (e.g. market caps).")
+        raw = values
+    else:
+        raw = None
+
+    rows, cols, data, names = [], [], [], []
+    for name, members in portfolios.items():
+        if isinstance(members, dict):
+            pairs = [(t.upper(), float(w)) for t, w in members.items()]
+        else:
+            pairs = [(t.upper(), 1.0 if raw is None else raw.get(t.upper(), np.nan)) for t in members]
+        pairs = [(t, w) for t, w in pairs if t in col and pd.notna(w) and w != 0]
+        total = sum(w for _, w in pairs)
+        if not pairs or total == 0:
+            continue
+        r = len(names)
+        names.append(name)
+        for t, w in pairs:
+            rows.append(r)
+            cols.append(col[t])
+            data.append(w / total)
+
+    shape = (len(names), len(col))
+    sparse = _sparse()
+    if sparse is not None:
+        return sparse.csr_matrix((data, (rows, cols)), shape=shape), names
+    dense = np.zeros(shape)
+    np.add.at(dense, (rows, cols), data)
+    return dense, names
+
+
+def _matmul_t(values: np.ndarray, weights) -> np.ndarray:
+    """values (T x N) @ weights.T, for dense or sparse weights (P x N)."""
+    sparse = _sparse()
+    if sparse is not None and sparse.issparse(weights):
+        return np.asarray((weights @ values.T).T)
+    return values @ weights.T
+
+
+def _mask_columns(weights, active: np.ndarray):
+    """weights with the columns where active is False set to 0."""
+    sparse = _sparse()
+    if sparse is not None and sparse.issparse(weights):
+        return sparse.csr_matrix(weights.multiply(active[None, :].astype(weights.dtype)))
+    return weights * active[None, :]
+
+
+def _scale_rows(weights, factors: np.ndarray):
+    sparse = _sparse()
+    if sparse is not None and sparse.issparse(weights):
+        return sparse.csr_matrix(sparse.diags(factors) @ weights)
+    return weights * factors[:, None]
+
+
+def _weights_key(weights, names, rebalance) -> str:
+    h = hashlib.sha1()
+    sparse = _sparse()
+    if sparse is not None and sparse.issparse(weights):
+        w = weights.tocsr()
+        for part in (w.data, w.indices, w.indptr):
+            h.update(np.ascontiguousarray(part).tobytes())
+    else:
+        h.update(np.ascontiguousarray(weights).tobytes())
+    h.update(repr((list(names), weights.shape, rebalance)).encode())
+    return h.hexdigest()
+
+
+def _period_ids(index: pd.DatetimeIndex, rebalance) -> np.ndarray:
+    if isinstance(rebalance, int):
+        return np.arange(len(index)) // rebalance
+    periods = index.to_period(REBALANCE[rebalance])
+    return pd.factorize(periods)[0]
+
+
+class PortfolioEngine:
+    """
+    Portfolio returns over one return panel, cached by weight-matrix hash.
+    Safe to share between threads. on_resize, if set, is called after the
+    memo grows (cache.py re-measures the entry).
+    """
+
+    max_results = 64
+
+    def __init__(self, returns: pd.DataFrame):
+        self.returns = returns
+        self.columns = list(returns.columns)
+        # Missing returns count as flat days for the held weights. A float32
+        # panel (compact mode) stays float32 here and in the results.
+        dtype = np.float32 if (returns.dtypes == np.float32).all() and returns.shape[1] else np.float64
+        raw = returns.to_numpy(dtype=dtype)
+        self._first, self._last = valid_bounds(raw)
+        self._ragged = bool(len(raw)) and bool((self._first > 0).any() or (self._last < len(raw) - 1).any())
+        self._values = np.nan_to_num(raw)
+        self._growth: dict = {}
+        self._results: dict[str, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+        self.on_resize: Callable[[], None] | None = None
+
+    def weights(self, portfolios: dict, scheme: str = "equal", values: pd.Series | None = None):
+        return weight_matrix(portfolios, self.columns, scheme=scheme, returns=self.returns, values=values)
+
+    def _period_growth(self, rebalance) -> tuple[np.ndarray, np.ndarray]:
+        """cumprod(1 + R) restarted at every rebalance period, and the period start mask."""
+        with self._lock:
+            hit = self._growth.get(rebalance)
+        if hit is not None:
+            return hit
+        ids = _period_ids(self.returns.index, rebalance)
+        growth = pd.DataFrame(1.0 + self._values).groupby(ids).cumprod().to_numpy()
+        starts = np.r_[True, ids[1:] != ids[:-1]]
+        with self._lock:
+            hit = self._growth.setdefault(rebalance, (growth, starts))
+        self._resized()
+        return hit
+
+    def _resized(self) -> None:
+        if self.on_resize is not None:
+            self.on_resize()
+
+    @diagnostics.timed("portfolios")
+    def run(self, weights, names, rebalance=None) -> pd.DataFrame:
+        """
+        Returns (dates x portfolios) for weight matrix `weights` with row names.
+        rebalance: None for daily rebalancing to target weights, "M"/"Q"/"Y"
+        for calendar periods, or an int for every n trading days.
+        """
+        key = _weights_key(weights, names, rebalance)
+        with self._lock:
+            hit = self._results.get(key)
+        if hit is not None:
+            return hit
+
+        # Same dtype as the panel, so the product does not upcast a copy of it
+        weights = weights.astype(self._values.dtype)
+        if not self._ragged:
+            out = self._run_block(weights, rebalance, 0, len(self._values))
+        else:
+            out = np.full((len(self._values), len(names)), np.nan, dtype=self._values.dtype)
+            for lo, hi, active in active_segments(self._first, self._last, self._member_rows(rebalance)):
+                w = _mask_columns(weights, active)
+                total = np.asarray(w.sum(axis=1), dtype=w.dtype).ravel()
+                held = total > 0
+                if held.any():
+                    w = _scale_rows(w[held], (1.0 / total[held]).astype(self._values.dtype))
+                    out[lo:hi, held] = self._run_block(w, rebalance, lo, hi)
+
+        result = pd.DataFrame(out, index=self.returns.index, columns=list(names))
+        with self._lock:
+            while len(self._results) >= self.max_results:
+                self._results.pop(next(iter(self._results)), None)
+            self._results[key] = result
+        self._resized()
+        return result
+
+    def _run_block(self, weights, rebalance, lo: int, hi: int) -> np.ndarray:
+        """Returns over rows lo:hi for fixed weights (rows lo must start a rebalance period)."""
+        if rebalance is None:
+            return _matmul_t(self._values[lo:hi], weights)
+        growth, starts = self._period_growth(rebalance)
+        value = _matmul_t(growth[lo:hi], weights)
+        prev = np.vstack([np.ones((1, value.shape[1])), value[:-1]])
+        prev[starts[lo:hi]] = 1.0
+        return value / prev - 1.0
+
+    def _member_rows(self, rebalance) -> np.ndarray:
+        """Row at which each row's basket membership is fixed: itself, or its period's first row."""
+        n = len(self._values)
+        if rebalance is None:
+            return np.arange(n)
+        starts = self._period_growth(rebalance)[1]
+        return np.flatnonzero(starts)[np.cumsum(starts) - 1]
+
+    def portfolio_returns(self, portfolios: dict, scheme: str = "equal", rebalance=None,
+                          values: pd.Series | None = None) -> pd.DataFrame:
+        weights, names = self.weights(portfolios, scheme=scheme, values=values)
+        return self.run(weights, names, rebalance=rebalance)
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            growth, results = list(self._growth.values()), list(self._results.values())
+        total = self._values.nbytes
+        total += sum(g.nbytes for g, _ in growth)
+        total += sum(int(r.memory_usage(index=False).sum()) for r in results)
+        return int(total)
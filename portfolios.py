@@ -1,6 +1,25 @@
 # portfolios.py
+import numpy as np
 import pandas as pd
 
+from portfolio_engine import PortfolioEngine
+
+#STATIC RISKPORTFOLIOS
+risk_portfolios_static = {
+    1: ["JNJ", "PG", "KO", "WMT", "PEP"],
+    2: ["VZ", "XOM", "CVX", "SO", "NEE"],
+    3: ["MRK", "ABT", "D", "DUK", "LLY"],
+    4: ["UNH", "HD", "MA", "V", "LOW"],
+    5: ["AAPL", "MSFT", "GOOG", "AMZN", "META"],
+    6: ["JPM", "BA", "CAT", "AXP", "IBM"],
+    7: ["QCOM", "INTC", "ORCL", "UPS", "CSCO"],
+    8: ["TSLA", "NVDA", "SHOP", "RBLX", "SQ"],
+    9: ["ARKK", "PLTR", "CRWD", "DOCU", "AFRM"],
+    10: ["COIN", "AMC", "GME", "FUBO", "BBBY"],
+}
+mag7 = ["AAPL", "MSFT", "TSLA", "GOOG", "AMZN", "META", "NVDA"]
+universe = sorted(set(sum(risk_portfolios_static.values(), []) + mag7 + ["SP500"]))
+
 def calculate_equal_weighted_portfolio(returns_data: pd.DataFrame, tickers):
     tickers = [t.upper() for t in tickers]
     available = [t for t in tickers if t in returns_data.columns]
@@ -8,3 +27,23 @@ def calculate_equal_weighted_portfolio(returns_data: pd.DataFrame, tickers):
         raise ValueError(f"No selected tickers found. Requested: {tickers}")
     weights = pd.Series(1 / len(available), index=available)
     return returns_data[available].dot(weights)
+
+def bucket_returns(returns_data: pd.DataFrame, buckets: dict, scheme: str = "equal", rebalance=None) -> pd.DataFrame:
+    """Returns for many named baskets in one pass (see portfolio_engine.py); missing tickers skipped."""
+    return PortfolioEngine(returns_data).portfolio_returns(buckets, scheme=scheme, rebalance=rebalance)
+
+def volatility_buckets(returns_data: pd.DataFrame, n_buckets: int = 10, exclude=("SP500",)) -> dict:
+    """Deciles (1 = lowest) of tickers ranked by annualized realized volatility over returns_data."""
+    tickers = [t for t in returns_data.columns if t not in exclude]
+    vol_metric = returns_data[tickers].std(skipna=True) * np.sqrt(252)
+    vol_metric = vol_metric.dropna().sort_values()
+    if vol_metric.empty:
+        return {}
+    groups = np.array_split(vol_metric.index.to_numpy(), n_buckets)
+    return {i + 1: list(groups[i]) for i in range(n_buckets)}
+
+def all_buckets(returns_data: pd.DataFrame) -> dict:
+    """Static buckets and volatility deciles, named "Static k" / "Decile k"."""
+    buckets = {f"Static {k}": v for k, v in risk_portfolios_static.items()}
+    buckets.update({f"Decile {k}": v for k, v in volatility_buckets(returns_data).items()})
+    return buckets
@@ -0,0 +1,257 @@
+# price_store.py
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+# Compiled close-price panel built from the per-ticker CSVs.
+#
+# Layout on disk (all under one store directory):
+#   dates.npy     int64 nanosecond timestamps, sorted, union of all tickers
+#   close.npy     float64 (dates x tickers), Fortran order so every ticker is one
+#                 contiguous column; NaN where a ticker has no row for that date
+#   manifest.json tickers, source mtimes/sizes and first/last valid row per ticker
+#
+# close.npy is opened with mmap_mode="r", so slicing by date range (and by a
+# contiguous run of tickers) never copies data.
+#
+# sync() is called on every cached lookup (cache.data_version), so the full
+# scan (list + stat every CSV, under a global lock) runs only when the data
+# folder's own mtime changed (a CSV was added, removed or replaced, which is
+# how ingest.py writes) or RESCAN_SECONDS have passed (catches in-place edits).
+#   PRICE_STORE_RESCAN_SECONDS=s   max age of a scan (default 2; 0 = every call)
+
+MANIFEST = "manifest.json"
+DATES = "dates.npy"
+CLOSE = "close.npy"
+
+RESCAN_SECONDS = float(os.environ.get("PRICE_STORE_RESCAN_SECONDS", "2"))
+
+_lock = threading.Lock()
+_loaded: dict[Path, "PriceStore"] = {}
+_scanned: dict[Path, tuple[Path, int | None, float]] = {}  # store_dir -> (data_dir, its mtime, scan time)
+
+
+class PriceStore:
+    def __init__(self, store_dir: Path, manifest: dict):
+        self.store_dir = Path(store_dir)
+        self.manifest = manifest
+        self.tickers: list[str] = list(manifest["tickers"])
+        self.col = {t: i for i, t in enumerate(self.tickers)}
+        self.version = manifest["version"]
+        raw_dates = np.load(self.store_dir / DATES)
+        self.dates = pd.DatetimeIndex(raw_dates.astype("datetime64[ns]"), name="Date")
+        if self.tickers:
+            self.close = np.load(self.store_dir / CLOSE, mmap_mode="r")
+        else:
+            self.close = np.empty((len(self.dates), 0))
+        self.first = np.asarray(manifest["first"], dtype=np.int64)
+        self.last = np.asarray(manifest["last"], dtype=np.int64)
+        self.gaps = np.asarray(manifest["gaps"], dtype=bool)
+        self._versions: dict[tuple, int] = {}
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self.col
+
+    def row_bounds(self, start=None, end=None) -> tuple[int, int]:
+        """Half-open [lo, hi) row range covering start..end (inclusive)."""
+        lo = 0 if start is None else int(self.dates.searchsorted(pd.Timestamp(start), side="left"))
+        hi = len(self.dates) if end is None else int(self.dates.searchsorted(pd.Timestamp(end), side="right"))
+        return lo, max(lo, hi)
+
+    def column_block(self, tickers: list[str]) -> np.ndarray:
+        """Close prices for tickers, a view when they are adjacent in the store."""
+        idx = [self.col[t] for t in tickers]
+        if idx and idx == list(range(idx[0], idx[0] + len(idx))):
+            return self.close[:, idx[0]:idx[0] + len(idx)]
+        return self.close[:, idx]
+
+    def frame(self, tickers: list[str], start=None, end=None, how: str = "inner") -> pd.DataFrame:
+        """
+        Close-price DataFrame for tickers between start and end.
+        how="inner" keeps only dates where every ticker has a price (like
+        pd.concat(...).dropna()); how="ragged" keeps every date where any of
+        the tickers has one, each column NaN outside its own history (see
+        panel.py); how="outer" keeps the store's full date range.
+        """
+        lo, hi = self.row_bounds(start, end)
+        cols = [self.col[t] for t in tickers]
+        if cols and how == "inner":
+            lo = max(lo, int(self.first[cols].max()))
+            hi = min(hi, int(self.last[cols].min()) + 1)
+            hi = max(lo, hi)
+            gaps = bool(self.gaps[cols].any())
+        elif cols and how == "ragged":
+            lo = max(lo, int(self.first[cols].min()))
+            hi = max(lo, min(hi, int(self.last[cols].max()) + 1))
+            # Dates only other tickers in the store trade on
+            gaps = len(cols) < len(self.tickers)
+        else:
+            gaps = False
+
+        values = self.column_block(tickers)[lo:hi]
+        df = pd.DataFrame(values, index=self.dates[lo:hi], columns=list(tickers), copy=False)
+        if gaps:
+            df = df.dropna(how="all" if how == "ragged" else "any")
+        return df
+
+    def version_of(self, tickers) -> int:
+        """Changes only when one of these tickers' source CSVs changes (or appears/disappears)."""
+        key = tuple(tickers)
+        v = self._versions.get(key)
+        if v is None:
+            sources = self.manifest.get("sources", {})
+            v = hash(tuple((t, t in self.col, tuple(sources.get(t, ()))) for t in key))
+            self._versions[key] = v
+        return v
+
+
+def _source_files(data_dir: Path) -> dict[str, os.DirEntry]:
+    out = {}
+    if not os.path.isdir(data_dir):
+        return out
+    with os.scandir(data_dir) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.lower().endswith(".csv"):
+                out[Path(entry.name).stem.upper()] = entry
+    return out
+
+
+def _read_manifest(store_dir: Path) -> dict | None:
+    try:
+        with open(store_dir / MANIFEST, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _atomic_save(path: Path, arr: np.ndarray) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def _write_store(store_dir: Path, dates: np.ndarray, close: np.ndarray, manifest: dict) -> None:
+    store_dir.mkdir(parents=True, exist_ok=True)
+    # Arrays first, manifest last: readers key on the manifest version, so they
+    # never see a manifest that points at arrays which are not yet written.
+    _atomic_save(store_dir / DATES, dates)
+    _atomic_save(store_dir / CLOSE, np.asfortranarray(close))
+    tmp = store_dir / (MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, store_dir / MANIFEST)
+
+
+def _valid_bounds(close: np.ndarray) -> tuple[list[int], list[int], list[bool]]:
+    first, last, gaps = [], [], []
+    for j in range(close.shape[1]):
+        ok = np.flatnonzero(~np.isnan(close[:, j]))
+        if ok.size == 0:
+            first.append(close.shape[0])
+            last.append(-1)
+            gaps.append(False)
+            continue
+        first.append(int(ok[0]))
+        last.append(int(ok[-1]))
+        gaps.append(bool(ok.size != ok[-1] - ok[0] + 1))
+    return first, last, gaps
+
+
+def sync(data_dir: Path, store_dir: Path, reader: Callable[[Path], pd.Series]) -> PriceStore:
+    """
+    Bring the store in line with the CSVs in data_dir and return it.
+    Only CSVs whose mtime/size changed (or that are new) are parsed again;
+    unchanged tickers are carried over from the existing store. Returns the
+    loaded store without scanning while a recent scan still holds (see above).
+    """
+    data_dir, store_dir = Path(data_dir), Path(store_dir)
+    try:
+        folder_mtime = os.stat(data_dir).st_mtime_ns
+    except OSError:
+        folder_mtime = None
+    store, seen = _loaded.get(store_dir), _scanned.get(store_dir)
+    if (
+        store is not None and seen is not None and seen[:2] == (data_dir, folder_mtime)
+        and time.monotonic() - seen[2] < RESCAN_SECONDS
+    ):
+        return store
+    with _lock:
+        store = _scan(data_dir, store_dir, reader)
+        # Stamped with the mtime read before the scan: a change during it triggers the next one
+        _scanned[store_dir] = (data_dir, folder_mtime, time.monotonic())
+        return store
+
+
+def _scan(data_dir: Path, store_dir: Path, reader: Callable[[Path], pd.Series]) -> PriceStore:
+    files = _source_files(data_dir)
+    manifest = _read_manifest(store_dir)
+    stats = {t: e.stat() for t, e in files.items()}
+    sources = {t: [st.st_mtime_ns, st.st_size] for t, st in stats.items()}
+
+    if manifest is not None and manifest.get("sources") == sources:
+        store = _loaded.get(store_dir)
+        if store is None or store.version != manifest["version"]:
+            store = PriceStore(store_dir, manifest)
+            _loaded[store_dir] = store
+        return store
+
+    old = _loaded.get(store_dir)
+    if old is None and manifest is not None:
+        try:
+            old = PriceStore(store_dir, manifest)
+        except (OSError, ValueError, KeyError):
+            old = None
+    old_sources = manifest.get("sources", {}) if manifest else {}
+
+    series: dict[str, pd.Series] = {}
+    for t in sorted(files):
+        if old is not None and t in old and old_sources.get(t) == sources[t]:
+            j = old.col[t]
+            col = np.asarray(old.close[:, j])
+            keep = ~np.isnan(col)
+            series[t] = pd.Series(col[keep], index=old.dates[keep])
+            continue
+        try:
+            s = reader(Path(files[t].path))
+        except Exception:
+            continue
+        s = s[~s.index.duplicated(keep="last")]
+        series[t] = s.astype("float64")
+
+    tickers = list(series)
+    if tickers:
+        index = series[tickers[0]].index
+        for t in tickers[1:]:
+            index = index.union(series[t].index)
+        index = index.sort_values()
+    else:
+        index = pd.DatetimeIndex([])
+    close = np.full((len(index), len(tickers)), np.nan, order="F")
+    for j, t in enumerate(tickers):
+        s = series[t]
+        close[index.get_indexer(s.index), j] = s.to_numpy()
+
+    first, last, gaps = _valid_bounds(close)
+    new_manifest = {
+        "version": (manifest or {}).get("version", 0) + 1,
+        "tickers": tickers,
+        # All CSVs, including unreadable ones, so those are not re-parsed
+        # on every call until their file actually changes.
+        "sources": sources,
+        "first": first,
+        "last": last,
+        "gaps": gaps,
+    }
+    dates = index.as_unit("ns").asi8 if len(index) else np.empty(0, dtype=np.int64)
+    _write_store(store_dir, dates, close, new_manifest)
+    store = PriceStore(store_dir, new_manifest)
+    _loaded[store_dir] = store
+    return store
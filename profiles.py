@@ -1,52 +1,18 @@
 # profiles.py
 from __future__ import annotations
+import warnings
 import numpy as np
 import pandas as pd
 
+import diagnostics
+from horizons import preset_start
+
 YF_ALIAS = {
     "BRK.B": "BRK-B",
     "SP500": "^GSPC",
 }
 
-def _mask_by_horizon(index: pd.DatetimeIndex, horizon: str) -> pd.Series:
-    if index.empty:
-        return pd.Series([], dtype=bool)
-    end = index.max()
-    if horizon == "Max":
-        start = index.min()
-    elif horizon == "YTD":
-        start = pd.Timestamp(end.year, 1, 1)
-    elif horizon == "3M":
-        start = end - pd.DateOffset(months=3)
-    elif horizon == "6M":
-        start = end - pd.DateOffset(months=6)
-    elif horizon == "1Y":
-        start = end - pd.DateOffset(years=1)
-    elif horizon == "3Y":
-        start = end - pd.DateOffset(years=3)
-    else:
-        start = index.min()
-    return (index >= start) & (index <= end)
-
-def _horizon_return(series: pd.Series) -> float | float("nan"):
-    if series.size < 2:
-        return np.nan
-    return float(series.iloc[-1] / series.iloc[0] - 1.0)
-
-def _ann_vol(series: pd.Series) -> float | float("nan"):
-    r = series.pct_change().dropna()
-    if r.empty:
-        return np.nan
-    # Annualize with sqrt(252)
-    return float(r.std(ddof=0) * np.sqrt(252))
-
-def _max_drawdown(series: pd.Series) -> float | float("nan"):
-    s = series.dropna()
-    if s.empty:
-        return np.nan
-    roll_max = s.cummax()
-    dd = s / roll_max - 1.0
-    return float(dd.min())
+SUMMARY_COLUMNS = ["Last Price", "As of", "Return", "Ann. Vol", "Max DD"]
 
 def _fmt_pct(x):
     return "N/A" if pd.isna(x) else f"{x:.2%}"
@@ -54,6 +20,77 @@ def _fmt_pct(x):
 def _fmt_num(x):
     return "N/A" if pd.isna(x) else f"{x:,.2f}"
 
+@diagnostics.timed("summary_table")
+def summary_stats(prices: pd.DataFrame, horizon: str = "1Y") -> pd.DataFrame:
+    """
+    Numeric summary, one row per ticker, computed for all columns at once:
+      - Last Price, As of (Timestamp, NaT if the ticker has no data)
+      - Return, Ann. Vol, Max DD over the horizon ending at the ticker's last valid date:
+        last / first price - 1, population std of daily returns * sqrt(252),
+        and the deepest fall below the running peak
+    """
+    cols = SUMMARY_COLUMNS
+    index = pd.Index(prices.columns, name="Ticker")
+    n_rows, n_cols = prices.shape
+    if n_cols == 0:
+        return pd.DataFrame(columns=cols, index=index)
+
+    values = prices.to_numpy(dtype=np.float64, copy=False)
+    valid = ~np.isnan(values)
+    has_data = valid.any(axis=0)
+    # Last valid row per column (0 for empty columns; masked out below)
+    last = np.where(has_data, n_rows - 1 - np.argmax(valid[::-1], axis=0), 0)
+    dates = prices.index
+
+    # Horizon start row per column: one searchsorted per distinct end date
+    # (usually a single one, since the panel is aligned)
+    lo = np.zeros(n_cols, dtype=np.int64)
+    for end_row in np.unique(last[has_data]):
+        start = preset_start(dates[end_row], horizon)
+        if start is not None:
+            lo[last == end_row] = dates.searchsorted(start, side="left")
+
+    # Work on the rows from the earliest window start onwards (a view)
+    base = int(lo[has_data].min()) if has_data.any() else n_rows
+    block = values[base:]
+    rows = np.arange(base, n_rows)[:, None]
+    in_win = valid[base:] & (rows >= lo) & (rows <= last)
+    count = in_win.sum(axis=0)
+    enough = count >= 2
+
+    win = np.where(in_win, block, np.nan)
+    first_row = np.argmax(in_win, axis=0)
+    first_px = win[first_row, np.arange(n_cols)]
+    last_px = values[last, np.arange(n_cols)]
+
+    # Returns between consecutive valid prices inside the window
+    filled = pd.DataFrame(win).ffill().to_numpy()
+    prev = np.vstack([np.full((1, n_cols), np.nan), filled[:-1]])
+    rets = np.where(in_win, block / prev - 1.0, np.nan)
+    with warnings.catch_warnings():
+        # All-NaN columns (no data / < 2 points) are expected and masked below
+        warnings.simplefilter("ignore", RuntimeWarning)
+        ann_vol = np.nanstd(rets, axis=0) * np.sqrt(252) if rets.size else np.full(n_cols, np.nan)
+        roll_max = np.fmax.accumulate(win, axis=0)
+        max_dd = np.nanmin(win / roll_max - 1.0, axis=0) if win.size else np.full(n_cols, np.nan)
+
+    out = pd.DataFrame(index=index)
+    out["Last Price"] = np.where(has_data, last_px, np.nan)
+    out["As of"] = pd.DatetimeIndex(np.where(has_data, dates[last].to_numpy(), np.datetime64("NaT")))
+    out["Return"] = np.where(enough, last_px / first_px - 1.0, np.nan)
+    out["Ann. Vol"] = np.where(enough, ann_vol, np.nan)
+    out["Max DD"] = np.where(enough, max_dd, np.nan)
+    return out
+
+def format_summary_table(stats: pd.DataFrame) -> pd.DataFrame:
+    """Display strings for a summary_stats() table (kept separate so the numbers can be cached/sorted)."""
+    df_fmt = stats.copy()
+    df_fmt["Last Price"] = stats["Last Price"].apply(_fmt_num)
+    df_fmt["As of"] = [("N/A" if pd.isna(d) else d.date().isoformat()) for d in stats["As of"]]
+    for col in ["Return", "Ann. Vol", "Max DD"]:
+        df_fmt[col] = stats[col].apply(_fmt_pct)
+    return df_fmt
+
 def build_summary_table(prices: pd.DataFrame, horizon: str = "1Y") -> pd.DataFrame:
     """
     Returns a table with one row per ticker for the chosen horizon:
@@ -62,71 +99,31 @@ def build_summary_table(prices: pd.DataFrame, horizon: str = "1Y") -> pd.DataFra
       - Annualized Volatility (horizon)
       - Max Drawdown (horizon)
     """
-    rows = []
-    for t in prices.columns:
-        s_full = prices[t].dropna()
-        if s_full.empty:
-            rows.append({"Ticker": t, "Last Price": np.nan, "As of": "N/A",
-                         "Return": np.nan, "Ann. Vol": np.nan, "Max DD": np.nan})
-            continue
-
-        mask = _mask_by_horizon(s_full.index, horizon)
-        s = s_full.loc[mask]
-        if s.size < 2:
-            rows.append({"Ticker": t, "Last Price": float(s_full.iloc[-1]), "As of": s_full.index[-1].date().isoformat(),
-                         "Return": np.nan, "Ann. Vol": np.nan, "Max DD": np.nan})
-            continue
-
-        last_price = float(s.iloc[-1])
-        as_of = s.index[-1].date().isoformat()
-        row = {
-            "Ticker": t,
-            "Last Price": last_price,
-            "As of": as_of,
-            "Return": _horizon_return(s),
-            "Ann. Vol": _ann_vol(s),
-            "Max DD": _max_drawdown(s),
-        }
-        rows.append(row)
-
-    df = pd.DataFrame(rows).set_index("Ticker")
-    # Pretty display
-    df_fmt = df.copy()
-    df_fmt["Last Price"] = df["Last Price"].apply(_fmt_num)
-    for col in ["Return", "Ann. Vol", "Max DD"]:
-        df_fmt[col] = df[col].apply(_fmt_pct)
-    return df_fmt
+    return format_summary_table(summary_stats(prices, horizon))
+
+def _fmt_cap(x):
+    if pd.isna(x):
+        return "N/A"
+    for div, unit in ((1e12, "T"), (1e9, "B"), (1e6, "M")):
+        if abs(x) >= div:
+            return f"{x / div:,.2f}{unit}"
+    return f"{x:,.0f}"
+
+def format_company_table(info: pd.DataFrame) -> pd.DataFrame:
+    """Display strings for a metadata.MetadataStore.get() table (name/sector/industry/marketCap/beta)."""
+    out = pd.DataFrame(index=info.index)
+    out["Name"] = info["name"].fillna("N/A")
+    out["Sector"] = info["sector"].fillna("N/A")
+    out["Industry"] = info["industry"].fillna("N/A")
+    out["Market Cap"] = pd.to_numeric(info["marketCap"], errors="coerce").apply(_fmt_cap)
+    out["Beta"] = pd.to_numeric(info["beta"], errors="coerce").apply(_fmt_num)
+    return out
 
 def fetch_company_info(ticker: str) -> dict | None:
-    try:
-        import yfinance as yf
-    except Exception:
-        return None
-
-    symbol = YF_ALIAS.get(ticker, ticker)
-    try:
-        tk = yf.Ticker(symbol)
-        info = None
-        if hasattr(tk, "get_info"):
-            info = tk.get_info()
-        if not info and hasattr(tk, "info"):
-            info = tk.info
-        if not info:
-            return None
-
-        return {
-            "name": info.get("longName") or info.get("shortName") or ticker,
-            "sector": info.get("sector"),
-            "industry": info.get("industry"),
-            "country": info.get("country"),
-            "website": info.get("website"),
-            "summary": info.get("longBusinessSummary"),
-            "marketCap": info.get("marketCap"),
-            "trailingPE": info.get("trailingPE"),
-            "forwardPE": info.get("forwardPE"),
-            "dividendYield": info.get("dividendYield"),
-            "beta": info.get("beta"),
-            "currency": info.get("currency"),
-        }
-    except Exception:
-        return None
+    """
+    Company metadata for one ticker (see metadata.FIELDS), from the local
+    metadata store; looked up first when missing or stale. None if unknown.
+    """
+    import metadata  # imports this module (YF_ALIAS)
+
+    return metadata.store().lookup(ticker)
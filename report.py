@@ -0,0 +1,173 @@
+# report.py
+from __future__ import annotations
+import argparse
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from analysis import calculate_returns, calculate_volatility, calculate_cumulative_return
+from factor_regression import factor_loadings
+from horizons import TIME_RANGE_PRESETS, VOL_WINDOWS, HorizonIndex
+from portfolio_engine import PortfolioEngine
+from portfolios import all_buckets, universe
+from profiles import summary_stats
+from utils import closing_prices, ff3_factors
+
+# Headless batch report: every time preset x rolling-vol window x bucket
+# (static risk portfolios and volatility deciles), no Streamlit involved.
+#
+# The close panel is loaded once in the parent and copied into one
+# shared-memory block. Workers map it in their initializer and wrap it in a
+# DataFrame without copying. Tasks are just (preset, window) pairs. Each
+# task computes all buckets at once with PortfolioEngine, so no price data
+# is pickled per task.
+#   python report.py --out reports [--workers 4] [--format parquet|csv|both]
+
+_panel: pd.DataFrame | None = None
+_factors: pd.DataFrame | None = None
+_shm: shared_memory.SharedMemory | None = None
+
+
+def _attach(shm_name: str, shape, index_ns: np.ndarray, columns: list[str], factors) -> None:
+    global _panel, _factors, _shm
+    _shm = shared_memory.SharedMemory(name=shm_name)
+    values = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+    values.flags.writeable = False
+    index = pd.DatetimeIndex(index_ns.astype("datetime64[ns]"), name="Date")
+    _panel = pd.DataFrame(values, index=index, columns=columns, copy=False)
+    _factors = factors
+
+
+def _detach() -> None:
+    global _panel, _shm
+    _panel = None
+    if _shm is not None:
+        _shm.close()
+        _shm = None
+
+
+def bucket_report(preset: str, window: int, scheme: str = "equal", rebalance=None) -> pd.DataFrame:
+    """One row per bucket for (preset, window), from the attached panel."""
+    prices = HorizonIndex(_panel.index).slice(_panel, preset)
+    returns = calculate_returns(prices)
+    if len(returns) < 2:
+        return pd.DataFrame()
+    buckets = all_buckets(returns)
+    bucket_ret = PortfolioEngine(returns).portfolio_returns(buckets, scheme=scheme, rebalance=rebalance)
+
+    # Growth of 1 from the day before the first return, so summary_stats sees the full window
+    growth = calculate_cumulative_return(bucket_ret)
+    start = pd.DataFrame(1.0, index=prices.index[:1], columns=growth.columns)
+    stats = summary_stats(pd.concat([start, growth]), "Max")[["Return", "Ann. Vol", "Max DD"]]
+    vol = calculate_volatility(bucket_ret, window=window)
+    stats["Rolling Vol (mean)"] = vol.mean()
+    stats["Rolling Vol (last)"] = vol.ffill().iloc[-1]
+    if _factors is not None:
+        loadings = factor_loadings(bucket_ret, _factors)
+        stats = stats.join(loadings[["Alpha", "Mkt-RF", "SMB", "HML", "R2"]])
+
+    stats.insert(0, "Tickers", [", ".join(buckets[b]) for b in stats.index])
+    stats.insert(0, "Days", len(returns))
+    stats.insert(0, "End", returns.index[-1])
+    stats.insert(0, "Start", returns.index[0])
+    stats.insert(0, "Window", window)
+    stats.insert(0, "Preset", preset)
+    return stats.rename_axis("Bucket").reset_index()
+
+
+def _task(args) -> pd.DataFrame:
+    return bucket_report(*args)
+
+
+def run_grid(prices: pd.DataFrame, factors: pd.DataFrame | None, presets=TIME_RANGE_PRESETS,
+             windows=VOL_WINDOWS, scheme: str = "equal", rebalance=None, workers: int = 4) -> pd.DataFrame:
+    """Bucket metrics for every preset x window, fanned out over a process pool sharing `prices`."""
+    tasks = [(p, int(w), scheme, rebalance) for p in presets for w in windows]
+    values = np.ascontiguousarray(prices.to_numpy(dtype=np.float64))
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    try:
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+        init = (shm.name, values.shape, prices.index.as_unit("ns").asi8, list(prices.columns), factors)
+        if workers <= 1:
+            _attach(*init)
+            parts = [_task(t) for t in tasks]
+        else:
+            # Not plain fork: the parent may hold threads (downloads, factor refresh)
+            ctx = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+                                              else "spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_attach, initargs=init) as pool:
+                parts = list(pool.map(_task, tasks))
+    finally:
+        _detach()
+        shm.close()
+        shm.unlink()
+    parts = [p for p in parts if not p.empty]
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+
+def summary_report(prices: pd.DataFrame, presets=TIME_RANGE_PRESETS) -> pd.DataFrame:
+    """profiles.summary_stats for every preset, stacked with a Preset column."""
+    parts = [summary_stats(prices, p).reset_index().assign(Preset=p) for p in presets]
+    return pd.concat(parts, ignore_index=True)
+
+
+def write_table(df: pd.DataFrame, path: Path, fmt: str) -> list[Path]:
+    """Write df as path.parquet and/or path.csv; Parquet falls back to CSV without an engine."""
+    written = []
+    if fmt in ("parquet", "both"):
+        try:
+            df.to_parquet(path.with_suffix(".parquet"), index=False)
+            written.append(path.with_suffix(".parquet"))
+        except ImportError:
+            print("No Parquet engine (pyarrow/fastparquet) installed; writing CSV instead.", file=sys.stderr)
+            fmt = "csv"
+    if fmt in ("csv", "both"):
+        df.to_csv(path.with_suffix(".csv"), index=False)
+        written.append(path.with_suffix(".csv"))
+    return written
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Batch report for every time preset, vol window and bucket.")
+    ap.add_argument("--out", type=Path, default=Path("reports"))
+    ap.add_argument("--format", choices=["parquet", "csv", "both"], default="parquet")
+    ap.add_argument("--workers", type=int, default=4, help="processes (1 = run in this process)")
+    ap.add_argument("--start", default="2020-01-01", help="first date of the loaded panel")
+    ap.add_argument("--scheme", choices=["equal", "inverse_vol"], default="equal")
+    ap.add_argument("--rebalance", choices=["M", "Q", "Y"], default=None, help="default: daily")
+    ap.add_argument("--no-ff3", action="store_true", help="skip the Fama-French regressions")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    prices = closing_prices(universe, start_date=args.start)
+    if prices.empty:
+        print("No price data loaded.", file=sys.stderr)
+        return 1
+    factors = None
+    if not args.no_ff3:
+        try:
+            factors = ff3_factors(start_date=args.start)
+        except Exception as e:
+            print(f"Fama-French factors unavailable ({e}); skipping regressions.", file=sys.stderr)
+
+    buckets = run_grid(prices, factors, scheme=args.scheme, rebalance=args.rebalance, workers=args.workers)
+    summary = summary_report(prices)
+    args.out.mkdir(parents=True, exist_ok=True)
+    written = write_table(buckets, args.out / "buckets", args.format)
+    written += write_table(summary, args.out / "summary", args.format)
+    print(f"{len(buckets)} bucket rows, {len(summary)} summary rows in {time.perf_counter() - t0:.1f}s")
+    for p in written:
+        print(f"  {p}")
+    return 0
+
+
+if __name__ == "__main__":
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        multiprocessing.set_forkserver_preload(["report"])
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# risk_sim.py
+from __future__ import annotations
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from portfolio_engine import PortfolioEngine
+from portfolios import risk_portfolios_static
+
+# Forward-looking risk for many buckets at once by simulation.
+#
+# Buckets are fixed-weight (daily rebalanced) baskets, so a bucket's return
+# is W @ r for the ticker returns r. Resampling days of the ticker panel and
+# then applying W is the same as resampling days of the bucket return
+# history R @ W.T. Likewise a normal/t model of the tickers with covariance
+# S gives buckets with covariance W S W.T. So paths are drawn directly in
+# bucket space (days x buckets), which keeps the cross-bucket dependence at
+# a fraction of the cost.
+#
+# Paths are generated in batches of BATCH paths. Each batch has its own
+# random stream spawned from the seed, so a seeded run gives the same
+# numbers whatever the memory cap (which only decides how many batches go
+# through NumPy at once). Only two numbers per path and bucket are kept
+# (horizon return and max drawdown).
+#
+# On a ragged panel buckets cover different spans of days. Buckets with the
+# same valid days are simulated together (keeping their joint dependence),
+# each group from its own history and random stream, so a short bucket does
+# not cut the history of the others; a bucket with fewer than 2 days is N/A.
+
+METHODS = ("bootstrap", "normal", "student_t")
+BATCH = 1024
+SIM_MAX_MB = float(os.environ.get("RISK_SIM_MAX_MB", "256"))
+# Arrays of paths x horizon x buckets alive at once while a chunk is processed
+_TEMPORARIES = 4
+
+
+def _draw(rng: np.random.Generator, history: np.ndarray, n: int, horizon: int, method: str,
+          block: int, df: float, mu: np.ndarray, chol: np.ndarray | None) -> np.ndarray:
+    """n paths of daily bucket returns, shape (n, horizon, buckets)."""
+    if method == "bootstrap":
+        t = len(history)
+        size = min(block, t)
+        n_blocks = -(-horizon // size)
+        starts = rng.integers(0, t - size + 1, size=(n, n_blocks))
+        idx = (starts[:, :, None] + np.arange(size)).reshape(n, -1)[:, :horizon]
+        return history[idx]
+    z = rng.standard_normal((n, horizon, len(mu))) @ chol.T
+    if method == "student_t":
+        # Multivariate t scaled to the same covariance: sqrt((df - 2) / chi2)
+        w = np.sqrt((df - 2.0) / rng.chisquare(df, size=(n, horizon, 1)))
+        z *= w
+    return mu + z
+
+
+def _path_stats(paths: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Horizon return and max drawdown (<= 0) per path and bucket."""
+    growth = np.cumprod(1.0 + np.maximum(paths, -1.0), axis=1)
+    peak = np.maximum.accumulate(np.maximum(growth, 1.0), axis=1)
+    max_dd = (growth / peak - 1.0).min(axis=1)
+    return growth[:, -1, :] - 1.0, np.minimum(max_dd, 0.0)
+
+
+def _simulate(history: np.ndarray, horizon: int, n_paths: int, method: str, block: int, df: float,
+              seed, max_mb: float) -> tuple[np.ndarray, np.ndarray]:
+    """(horizon return, max drawdown) per path for each column of a complete history."""
+    mu = history.mean(axis=0)
+    chol = None
+    if method != "bootstrap":
+        cov = np.atleast_2d(np.cov(history, rowvar=False))
+        # Tiny ridge so a singular covariance (duplicate buckets) still factors
+        chol = np.linalg.cholesky(cov + np.eye(history.shape[1]) * 1e-12 * max(np.trace(cov), 1e-12))
+
+    per_batch = BATCH * horizon * history.shape[1] * 8 * _TEMPORARIES
+    batches_per_chunk = max(1, int(max_mb * 2**20 // per_batch))
+    n_batches = -(-n_paths // BATCH)
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    streams = root.spawn(n_batches)
+
+    final = np.empty((n_batches * BATCH, history.shape[1]))
+    max_dd = np.empty_like(final)
+    for c in range(0, n_batches, batches_per_chunk):
+        parts = [
+            _draw(np.random.default_rng(streams[b]), history, BATCH, horizon, method, block, df, mu, chol)
+            for b in range(c, min(c + batches_per_chunk, n_batches))
+        ]
+        lo = c * BATCH
+        r, dd = _path_stats(np.concatenate(parts) if len(parts) > 1 else parts[0])
+        final[lo:lo + len(r)] = r
+        max_dd[lo:lo + len(r)] = dd
+    return final[:n_paths], max_dd[:n_paths]
+
+
+def simulate_returns(bucket_returns: pd.DataFrame, horizon: int = 21, n_paths: int = 20_000,
+                     method: str = "bootstrap", block: int = 5, df: float = 5.0, seed: int | None = None,
+                     levels=(0.95, 0.99), max_mb: float = SIM_MAX_MB) -> tuple[pd.DataFrame, dict]:
+    """
+    Simulate `n_paths` paths of `horizon` days for every column (bucket) of
+    bucket_returns (daily returns; NaN = no return that day). Each bucket is
+    resampled from its own days, jointly with the buckets that share them:
+      - "bootstrap": moving-block bootstrap of whole days, blocks of `block`
+      - "normal":    multivariate normal with the sample mean and covariance
+      - "student_t": multivariate t with `df` degrees of freedom, same covariance
+    Returns (summary, draws). summary has one row per bucket: VaR/CVaR at
+    each level (positive = loss over the horizon), mean and std of the
+    horizon return, P(loss) and the drawdown distribution; all NaN for a
+    bucket with fewer than 2 days. draws maps "return" and "max_dd" to
+    (paths x buckets) DataFrames.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown simulation method {method!r}; choose from {METHODS}.")
+    if method == "student_t" and df <= 2:
+        raise ValueError("student_t needs df > 2 for a finite covariance.")
+    names = list(bucket_returns.columns)
+    values = bucket_returns.to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+
+    # Buckets grouped by their set of valid days, in column order
+    groups: dict[bytes, list[int]] = {}
+    for j in range(len(names)):
+        if valid[:, j].sum() >= 2:
+            groups.setdefault(np.packbits(valid[:, j]).tobytes(), []).append(j)
+    if not groups:
+        raise ValueError("Need at least 2 days of bucket returns to simulate.")
+    # A single group (every bucket on the same days) keeps the plain seed
+    seeds = [seed] if len(groups) == 1 else np.random.SeedSequence(seed).spawn(len(groups))
+
+    final = np.full((n_paths, len(names)), np.nan)
+    max_dd = np.full_like(final, np.nan)
+    for cols, group_seed in zip(groups.values(), seeds):
+        history = values[valid[:, cols[0]]][:, cols]
+        final[:, cols], max_dd[:, cols] = _simulate(history, horizon, n_paths, method, block, df, group_seed,
+                                                    max_mb)
+
+    out = pd.DataFrame(index=pd.Index(names, name="Bucket"))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns of N/A buckets
+        for level in levels:
+            q = np.quantile(final, 1.0 - level, axis=0)
+            tail = np.where(final <= q, final, np.nan)
+            out[f"VaR {level:.0%}"] = -q
+            out[f"CVaR {level:.0%}"] = -np.nanmean(tail, axis=0)
+        out["Mean"] = final.mean(axis=0)
+        out["Std"] = final.std(axis=0, ddof=1)
+        out["P(loss)"] = np.where(np.isnan(final[0]), np.nan, (final < 0).mean(axis=0))
+        out["Max DD (median)"] = np.median(max_dd, axis=0)
+        out[f"Max DD ({levels[0]:.0%})"] = np.quantile(max_dd, 1.0 - levels[0], axis=0)
+        out["Max DD (mean)"] = max_dd.mean(axis=0)
+    draws = {
+        "return": pd.DataFrame(final, columns=names),
+        "max_dd": pd.DataFrame(max_dd, columns=names),
+    }
+    return out, draws
+
+
+def simulate_buckets(returns: pd.DataFrame, buckets: dict | None = None, scheme: str = "equal",
+                     **kwargs) -> tuple[pd.DataFrame, dict]:
+    """
+    simulate_returns for baskets of tickers (default: risk_portfolios_static,
+    keyed by risk score) built from a ticker return panel such as
+    analysis.calculate_returns output.
+    """
+    buckets = risk_portfolios_static if buckets is None else buckets
+    history = PortfolioEngine(returns).portfolio_returns(buckets, scheme=scheme)
+    return simulate_returns(history, **kwargs)
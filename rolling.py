@@ -0,0 +1,274 @@
+# rolling.py
+from __future__ import annotations
+import copy
+
+import numpy as np
+import pandas as pd
+
+# Rolling-moments engine for return panels.
+#
+# History: one pass of cumulative sums of x and x^2 per column gives the
+# rolling variance for every window at once (values are shifted by a per-column
+# constant first, which leaves the variance unchanged but avoids cancellation).
+# Updates: a ring buffer of the last max(window) rows plus running sums per
+# window, so append() costs O(1) per column per window and never touches
+# older history. Running sums are re-derived from the buffer every
+# `resync_every` appends to keep float drift bounded.
+# Columns are independent, so with_columns() carries the unchanged ones over
+# to a new column set and only builds the added ones.
+#
+# Like DataFrame.rolling(window).std(): sample std (ddof=1), NaN until a full
+# window of non-NaN values is available.
+# EWMA is RiskMetrics style, sigma2_t = lam * sigma2_{t-1} + (1 - lam) * r_t^2.
+# Like ewm(adjust=False), a missing return carries sigma2 over unchanged, and
+# the next return after a gap of g days weights the old value by lam^(g+1)
+# (renormalised); the gap length per column is part of the state.
+
+# Gaps longer than this leave lam^gap below float precision; they are capped
+# when seeding a vectorized pass
+_EWMA_MAX_GAP = 2048
+
+
+class RollingMoments:
+    def __init__(self, columns, windows=(5, 21, 63), ewma_lambda: float | None = None, resync_every: int = 256):
+        self.columns = pd.Index(columns)
+        self.windows = tuple(sorted({int(w) for w in windows}))
+        if not self.windows or self.windows[0] < 2:
+            raise ValueError("Rolling windows must be >= 2.")
+        self.ewma_lambda = ewma_lambda
+        self.resync_every = resync_every
+
+        n = len(self.columns)
+        self._shift = np.zeros(n)
+        self._buf = np.full((self.windows[-1], n), np.nan)  # ring of the last rows
+        self._head = 0  # next slot to write; oldest row sits here once the ring is full
+        self._filled = 0
+        self._s1 = {w: np.zeros(n) for w in self.windows}
+        self._s2 = {w: np.zeros(n) for w in self.windows}
+        self._bad = {w: np.zeros(n, dtype=np.int64) for w in self.windows}
+        self._ewma_var = np.full(n, np.nan)
+        self._ewma_gap = np.zeros(n, dtype=np.int64)  # missing days since the last return, per column
+        self._since_resync = 0
+
+        self._index: list[pd.DatetimeIndex] = []
+        self._std: dict[int, list[np.ndarray]] = {w: [] for w in self.windows}
+        self._ewma: list[np.ndarray] = []
+        self._frames: dict = {}
+
+    # ---- building from history -------------------------------------------
+
+    @classmethod
+    def from_returns(cls, returns: pd.DataFrame, windows=(5, 21, 63), ewma_lambda: float | None = None,
+                     resync_every: int = 256) -> "RollingMoments":
+        eng = cls(returns.columns, windows, ewma_lambda, resync_every)
+        x = returns.to_numpy(dtype=np.float64)
+        if len(x):
+            first = np.argmax(~np.isnan(x), axis=0)
+            eng._shift = np.nan_to_num(x[first, np.arange(x.shape[1])])
+        eng._extend(returns.index, x)
+        return eng
+
+    def _extend(self, index: pd.Index, x: np.ndarray) -> None:
+        """Vectorized history pass over new rows x, continuing from the current state."""
+        if len(x) == 0:
+            return
+        n_new, n = x.shape
+        w_max = self.windows[-1]
+        # Prepend the buffered tail so windows spanning old and new rows work
+        ordered = self._ordered()
+        tail = ordered[w_max - self._filled:] if self._filled else np.empty((0, n))
+        full = np.vstack([tail, x - self._shift])
+        bad = np.isnan(full)
+        z = np.where(bad, 0.0, full)
+        zero = np.zeros((1, n))
+        c1 = np.vstack([zero, np.cumsum(z, axis=0)])
+        c2 = np.vstack([zero, np.cumsum(z * z, axis=0)])
+        cb = np.vstack([zero, np.cumsum(bad, axis=0)])
+
+        off = len(tail)
+        rows = np.arange(off, off + n_new) + 1  # cumulative position after each new row
+        for w in self.windows:
+            lo = rows - w
+            ok = lo >= 0
+            lo_c = np.maximum(lo, 0)
+            s1 = c1[rows] - c1[lo_c]
+            s2 = c2[rows] - c2[lo_c]
+            nb = cb[rows] - cb[lo_c]
+            with np.errstate(invalid="ignore"):
+                var = (s2 - s1 * s1 / w) / (w - 1)
+            std = np.sqrt(np.maximum(var, 0.0))
+            std[~ok[:, None] | (nb > 0)] = np.nan
+            self._std[w].append(std)
+
+        if self.ewma_lambda is not None:
+            lam = self.ewma_lambda
+            # Seed the recursion with the carried state, followed by its
+            # trailing gap so pandas weights it as if it had seen the gap
+            gap = np.minimum(self._ewma_gap, _EWMA_MAX_GAP)
+            g = int(gap.max()) if n else 0
+            seed = np.full((g + 1, n), np.nan)
+            seed[g - gap, np.arange(n)] = self._ewma_var
+            ev = pd.DataFrame(np.vstack([seed, x * x])).ewm(alpha=1 - lam, adjust=False).mean().to_numpy()[g + 1:]
+            obs = ~np.isnan(x)
+            since = np.where(obs.any(axis=0), np.argmax(obs[::-1], axis=0), self._ewma_gap + n_new)
+            self._ewma_var = ev[-1].copy()
+            self._ewma_gap = np.where(np.isnan(self._ewma_var), 0, since)
+            self._ewma.append(np.sqrt(ev))
+
+        self._index.append(pd.DatetimeIndex(index))
+        keep = full[-w_max:]
+        self._buf = np.vstack([np.full((w_max - len(keep), n), np.nan), keep])
+        self._head = 0
+        self._filled = min(w_max, self._filled + n_new)
+        self._resync()
+        self._frames.clear()
+
+    def _ordered(self) -> np.ndarray:
+        """Ring contents, oldest row first."""
+        return np.roll(self._buf, -self._head, axis=0)
+
+    def _resync(self) -> None:
+        ordered = self._ordered()
+        for w in self.windows:
+            win = ordered[-w:]
+            bad = np.isnan(win)
+            z = np.where(bad, 0.0, win)
+            self._s1[w] = z.sum(axis=0)
+            self._s2[w] = (z * z).sum(axis=0)
+            # Unfilled buffer slots count as missing, so short histories stay NaN
+            self._bad[w] = bad.sum(axis=0)
+        self._since_resync = 0
+
+    # ---- O(1) updates -------------------------------------------------------
+
+    def append(self, date, row) -> None:
+        """Add one day of returns (Series/array aligned to columns)."""
+        if isinstance(row, pd.Series):
+            row = row.reindex(self.columns)
+        x = np.asarray(row, dtype=np.float64) - self._shift
+        new_bad = np.isnan(x)
+        z_new = np.where(new_bad, 0.0, x)
+
+        w_max = self.windows[-1]
+        for w in self.windows:
+            old = self._buf[(self._head - w) % w_max]
+            old_bad = np.isnan(old)
+            z_old = np.where(old_bad, 0.0, old)
+            self._s1[w] += z_new - z_old
+            self._s2[w] += z_new * z_new - z_old * z_old
+            self._bad[w] += new_bad.astype(np.int64) - old_bad.astype(np.int64)
+            with np.errstate(invalid="ignore"):
+                var = (self._s2[w] - self._s1[w] ** 2 / w) / (w - 1)
+            std = np.sqrt(np.maximum(var, 0.0))
+            std[self._bad[w] > 0] = np.nan
+            self._std[w].append(std[None, :])
+
+        if self.ewma_lambda is not None:
+            r2 = (x + self._shift) ** 2
+            lam = self.ewma_lambda
+            prev = self._ewma_var
+            old = lam ** (np.minimum(self._ewma_gap, _EWMA_MAX_GAP) + 1.0)
+            with np.errstate(invalid="ignore"):
+                mixed = (old * prev + (1 - lam) * r2) / (old + (1 - lam))
+            # No return today: keep the variance and count the gap
+            self._ewma_var = np.where(new_bad, prev, np.where(np.isnan(prev), r2, mixed))
+            self._ewma_gap = np.where(new_bad & ~np.isnan(prev), self._ewma_gap + 1, 0)
+            self._ewma.append(np.sqrt(self._ewma_var)[None, :])
+
+        self._buf[self._head] = x
+        self._head = (self._head + 1) % w_max
+        self._filled = min(w_max, self._filled + 1)
+        self._index.append(pd.DatetimeIndex([pd.Timestamp(date)]))
+        self._since_resync += 1
+        if self._since_resync >= self.resync_every:
+            self._resync()
+        self._frames.clear()
+
+    def extend(self, returns: pd.DataFrame) -> None:
+        """Add several new days at once (vectorized; same result as repeated append)."""
+        self._extend(returns.index, returns.reindex(columns=self.columns).to_numpy(dtype=np.float64))
+
+    def with_columns(self, returns: pd.DataFrame, reuse) -> "RollingMoments":
+        """
+        Engine over the same days for returns.columns. Columns in `reuse`
+        (columns of this engine whose returns are unchanged) are taken from
+        this one; the others are built from `returns` in one vectorized pass.
+        """
+        if not returns.index.equals(self.index):
+            raise ValueError("with_columns() needs returns over the engine's days.")
+        columns = pd.Index(returns.columns)
+        reuse = set(reuse).intersection(self.columns)
+        keep = [i for i, c in enumerate(columns) if c in reuse]
+        add = [i for i, c in enumerate(columns) if c not in reuse]
+        old = self.columns.get_indexer(columns[keep])
+        built = RollingMoments.from_returns(returns.iloc[:, add], self.windows, self.ewma_lambda,
+                                            self.resync_every)
+        new = RollingMoments(columns, self.windows, self.ewma_lambda, self.resync_every)
+
+        def join(mine: np.ndarray, theirs: np.ndarray) -> np.ndarray:
+            out = np.empty(mine.shape[:-1] + (len(columns),), dtype=mine.dtype)
+            out[..., keep] = mine[..., old]
+            out[..., add] = theirs
+            return out
+
+        new._shift = join(self._shift, built._shift)
+        new._buf = join(self._ordered(), built._ordered())
+        new._filled = self._filled
+        new._ewma_var = join(self._ewma_var, built._ewma_var)
+        new._ewma_gap = join(self._ewma_gap, built._ewma_gap)
+        new._index = [self.index]
+        empty = np.empty((0, len(self.columns)))
+        for w in self.windows:
+            new._std[w] = [join(np.vstack(self._std[w]) if self._std[w] else empty, built.volatility(w).to_numpy())]
+        if self.ewma_lambda is not None:
+            new._ewma = [join(np.vstack(self._ewma) if self._ewma else empty, built.ewma_volatility().to_numpy())]
+        new._resync()
+        return new
+
+    # ---- results -----------------------------------------------------------
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        if "index" not in self._frames:
+            idx = self._index[0].append(self._index[1:]) if self._index else pd.DatetimeIndex([])
+            self._frames["index"] = idx
+        return self._frames["index"]
+
+    def volatility(self, window: int) -> pd.DataFrame:
+        """Rolling std for one of the engine's windows, full history."""
+        if window not in self._std:
+            raise KeyError(f"Window {window} not tracked; engine has {self.windows}.")
+        key = ("std", window)
+        if key not in self._frames:
+            parts = self._std[window]
+            values = np.vstack(parts) if parts else np.empty((0, len(self.columns)))
+            self._frames[key] = pd.DataFrame(values, index=self.index, columns=self.columns)
+        return self._frames[key]
+
+    def ewma_volatility(self) -> pd.DataFrame:
+        if self.ewma_lambda is None:
+            raise ValueError("Engine was built without ewma_lambda.")
+        if "ewma" not in self._frames:
+            values = np.vstack(self._ewma) if self._ewma else np.empty((0, len(self.columns)))
+            self._frames["ewma"] = pd.DataFrame(values, index=self.index, columns=self.columns)
+        return self._frames["ewma"]
+
+    @property
+    def nbytes(self) -> int:
+        parts = [a for v in self._std.values() for a in v] + self._ewma
+        return int(sum(a.nbytes for a in parts) + self._buf.nbytes)
+
+    def copy(self) -> "RollingMoments":
+        """Independent engine sharing the (read-only) history arrays."""
+        new = copy.copy(self)
+        new._buf = self._buf.copy()
+        new._s1 = {w: v.copy() for w, v in self._s1.items()}
+        new._s2 = {w: v.copy() for w, v in self._s2.items()}
+        new._bad = {w: v.copy() for w, v in self._bad.items()}
+        new._ewma_var = self._ewma_var.copy()
+        new._ewma_gap = self._ewma_gap.copy()
+        new._index = list(self._index)
+        new._std = {w: list(v) for w, v in self._std.items()}
+        new._ewma = list(self._ewma)
+        new._frames = {}
+        return new
@@ -0,0 +1,371 @@
+# server.py
+from __future__ import annotations
+import argparse
+import functools
+import importlib.util
+import json
+import os
+import sys
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pandas as pd
+
+import diagnostics
+import factors
+import warmup
+from cache import (
+    COMPACT, cache_stats, cached_closing_prices, cached_covariance, cached_cumulative_return,
+    cached_factor_loadings, cached_ff3_factors, cached_portfolio_engine, cached_prices_range, cached_returns,
+    cached_risk_simulation, cached_summary_stats, cached_volatility, cached_walk_forward,
+    cached_walk_forward_simulation, data_version,
+)
+from portfolios import all_buckets, risk_portfolios_static, universe, volatility_buckets
+
+# Local analytics service: one process holds the price panel and the
+# pipeline cache (cache.py) for every client, instead of one copy per
+# Streamlit server or script. Requests are GETs on /<endpoint>?<params>;
+# each answers one DataFrame, as an Arrow IPC stream when the client sends
+# "Accept: application/vnd.apache.arrow.stream" and pyarrow is installed,
+# else as JSON (column lists, exact floats). Concurrent identical requests
+# (same endpoint, params and format) are computed and encoded once and the
+# bytes handed to all of them; the cache then serves later repeats.
+#
+# Common params: tickers (comma list, default the app universe), start / end
+# (ISO dates, default the whole panel), start_date (load start, as in
+# cache.py), columns (comma list: answer only these columns). Baskets are
+# baskets=<JSON list of [name, [tickers]]> or buckets=static|deciles|all.
+# Bad params give 400 with {"error": ...}; client.py raises ValueError for it.
+# /health, /stats and /version answer JSON. Every endpoint answer carries
+# the data version it was computed at (X-Data-Version; the same string as
+# /version), which bumps when a price CSV or the FF3 factors change; client.py
+# keeps decoded answers per version.
+#   python server.py [--host 127.0.0.1] [--port 8765]
+#   ANALYTICS_HOST / ANALYTICS_PORT   defaults for --host / --port
+#   ANALYTICS_LOG=1                   log every request to stderr
+# The app uses the service instead of its own cache with
+# ANALYTICS_SERVER=http://127.0.0.1:8765 (see client.py).
+
+HOST = os.environ.get("ANALYTICS_HOST", "127.0.0.1")
+PORT = int(os.environ.get("ANALYTICS_PORT", "8765"))
+LOG = os.environ.get("ANALYTICS_LOG", "") not in ("", "0")
+ARROW = "application/vnd.apache.arrow.stream"
+JSON = "application/json"
+VERSION_HEADER = "X-Data-Version"
+# The app's default simulation view, warmed with the rest of the grid
+WARM_SIM_ARGS = dict(method="bootstrap", horizon=21, n_paths=20_000, seed=0)
+
+
+@functools.cache
+def _have_pyarrow() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+class Coalescer:
+    """Runs one call per key at a time; callers arriving meanwhile wait for it and share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: dict = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def run(self, key, fn):
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            try:
+                fut.set_result(fn())
+            except BaseException as e:
+                fut.set_exception(e)
+                with self._lock:
+                    self.errors += 1
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+        return fut.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced, "errors": self.errors,
+                    "inflight": len(self._inflight)}
+
+
+_coalescer = Coalescer()
+diagnostics.register_gauges("api", _coalescer.stats)
+
+
+# ---- encoding ---------------------------------------------------------------
+
+def encode_arrow(df: pd.DataFrame) -> bytes:
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _iso(values) -> list:
+    return [None if pd.isna(t) else t.isoformat() for t in values]
+
+
+def encode_json(df: pd.DataFrame) -> bytes:
+    dates = isinstance(df.index, pd.DatetimeIndex)
+    date_columns = [j for j in range(df.shape[1]) if pd.api.types.is_datetime64_any_dtype(df.iloc[:, j])]
+    body = {
+        "index": _iso(df.index) if dates else df.index.tolist(),
+        "index_name": df.index.name,
+        "dates": dates,
+        "columns": df.columns.tolist(),
+        "data": [_iso(df.iloc[:, j]) if j in date_columns else df.iloc[:, j].tolist() for j in range(df.shape[1])],
+        "date_columns": date_columns,
+        "attrs": df.attrs,
+    }
+    return json.dumps(body, default=str).encode("utf-8")
+
+
+# ---- params -----------------------------------------------------------------
+
+class Query:
+    def __init__(self, query: str):
+        self.params = dict(parse_qsl(query, keep_blank_values=True))
+
+    def get(self, name: str, default=None):
+        value = self.params.get(name, "")
+        return default if value == "" else value
+
+    def int(self, name: str, default: int) -> int:
+        try:
+            return int(self.get(name, default))
+        except ValueError:
+            raise ValueError(f"{name} must be an integer.") from None
+
+    def tickers(self) -> tuple:
+        value = self.get("tickers")
+        return tuple(universe) if value is None else tuple(t for t in value.split(",") if t)
+
+    def date(self, name: str):
+        value = self.get(name)
+        return None if value is None else pd.Timestamp(value)
+
+    def range(self) -> dict:
+        return dict(start=self.date("start"), end=self.date("end"), start_date=self.get("start_date", "2020-01-01"))
+
+    def columns(self) -> list | None:
+        if "columns" not in self.params:
+            return None
+        return [c for c in self.params["columns"].split(",") if c]
+
+    def rebalance(self):
+        return self.get("rebalance")
+
+    def baskets(self, returns: pd.DataFrame | None = None) -> dict | None:
+        """{name: tickers} from baskets=<JSON> or buckets=static|deciles|all; None if neither is given."""
+        if self.get("baskets") is not None:
+            pairs = json.loads(self.params["baskets"])
+            return {name: list(members) for name, members in pairs}
+        kind = self.get("buckets")
+        if kind is None:
+            return None
+        if kind == "static":
+            return dict(risk_portfolios_static)
+        if kind in ("deciles", "all"):
+            returns = cached_returns(self.tickers(), **self.range()) if returns is None else returns
+            return volatility_buckets(returns) if kind == "deciles" else all_buckets(returns)
+        raise ValueError(f"Unknown buckets {kind!r}; choose static, deciles or all.")
+
+
+# ---- endpoints ----------------------------------------------------------------
+
+def _prices(q: Query) -> pd.DataFrame:
+    r = q.range()
+    if r["start"] is None and r["end"] is None:
+        return cached_closing_prices(q.tickers(), r["start_date"])
+    return cached_prices_range(q.tickers(), **r)
+
+
+def _cumulative(q: Query) -> pd.DataFrame:
+    # Outside compact mode the whole panel is one cache entry; slice it instead
+    return cached_cumulative_return(q.tickers(), **q.range(), columns=q.columns() if COMPACT else None)
+
+
+def _volatility(q: Query) -> pd.DataFrame:
+    return cached_volatility(q.tickers(), **q.range(), window=q.int("window", 5),
+                             columns=q.columns() if COMPACT else None)
+
+
+def _portfolios(q: Query) -> pd.DataFrame:
+    engine = cached_portfolio_engine(q.tickers(), **q.range())
+    baskets = q.baskets(engine.returns)
+    return engine.portfolio_returns(all_buckets(engine.returns) if baskets is None else baskets,
+                                    scheme=q.get("scheme", "equal"), rebalance=q.rebalance())
+
+
+def _walk_forward(q: Query) -> pd.DataFrame:
+    part = q.get("part", "returns")
+    if part not in ("returns", "membership"):
+        raise ValueError("part must be returns or membership.")
+    wf_returns, membership = cached_walk_forward(
+        q.tickers(), lookback=q.int("lookback", 252), rerank=q.get("rerank", "M"), scheme=q.get("scheme", "equal"),
+        rebalance=q.rebalance(), start_date=q.get("start_date", "2020-01-01"))
+    return wf_returns if part == "returns" else membership
+
+
+def _sim_args(q: Query) -> dict:
+    return dict(scheme=q.get("scheme", "equal"), method=q.get("method", "bootstrap"), horizon=q.int("horizon", 21),
+                n_paths=q.int("n_paths", 20_000), seed=q.int("seed", 0))
+
+
+def _risk(q: Query) -> pd.DataFrame:
+    return cached_risk_simulation(q.tickers(), **q.range(), buckets=q.baskets(), **_sim_args(q))[0]
+
+
+def _risk_walk_forward(q: Query) -> pd.DataFrame:
+    return cached_walk_forward_simulation(q.tickers(), **q.range(), lookback=q.int("lookback", 252),
+                                          rerank=q.get("rerank", "M"), rebalance=q.rebalance(), **_sim_args(q))[0]
+
+
+def _correlation(q: Query) -> pd.DataFrame:
+    engine = cached_covariance(q.tickers(), **q.range(), method=q.get("method", "sample"))
+    cols = q.columns()
+    return engine.correlation(None if cols is None else [c for c in cols if c in engine.columns])
+
+
+def _shrinkage(q: Query) -> pd.DataFrame:
+    intensity, mu = cached_covariance(q.tickers(), **q.range(), method="ledoit_wolf").shrinkage()
+    return pd.DataFrame({"intensity": [intensity], "mu": [mu]})
+
+
+ENDPOINTS = {
+    "prices": _prices,
+    "returns": lambda q: cached_returns(q.tickers(), **q.range()),
+    "cumulative": _cumulative,
+    "volatility": _volatility,
+    "portfolios": _portfolios,
+    "walk_forward": _walk_forward,
+    "risk": _risk,
+    "risk_walk_forward": _risk_walk_forward,
+    "correlation": _correlation,
+    "shrinkage": _shrinkage,
+    "summary": lambda q: cached_summary_stats(q.tickers(), horizon=q.get("horizon", "1Y"),
+                                              start_date=q.get("start_date", "2020-01-01")),
+    "ff3": lambda q: cached_ff3_factors(q.get("start_date", "2020-01-01")),
+    "ff3_loadings": lambda q: cached_factor_loadings(q.tickers(), **q.range(), scheme=q.get("scheme", "equal"),
+                                                     rebalance=q.rebalance()),
+}
+
+
+def respond(name: str, query: str, arrow: bool) -> bytes:
+    """Encoded answer of one endpoint; concurrent identical calls share one computation."""
+    fn = ENDPOINTS[name]
+
+    def build() -> bytes:
+        q = Query(query)
+        with diagnostics.stage(f"api_{name}"):
+            df = fn(q)
+            cols = q.columns()
+            if cols is not None:
+                df = df[[c for c in cols if c in df.columns]]
+            return encode_arrow(df) if arrow else encode_json(df)
+
+    key = (name, tuple(sorted(parse_qsl(query, keep_blank_values=True))), arrow)
+    return _coalescer.run(key, build)
+
+
+def version() -> str:
+    """Data version every endpoint's answer depends on: the price store and the FF3 factors."""
+    return f"{data_version()}-{factors.version('ff3')}"
+
+
+def stats() -> dict:
+    return {"api": _coalescer.stats(), "cache": cache_stats(), "warmup": warmup.progress(),
+            "threads": threading.active_count()}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        name = url.path.strip("/")
+        if name == "health":
+            return self._send(200, json.dumps({"ok": True}).encode(), JSON)
+        if name == "stats":
+            return self._send(200, json.dumps(stats()).encode(), JSON)
+        if name == "version":
+            return self._send(200, json.dumps({"version": version()}).encode(), JSON)
+        if name not in ENDPOINTS:
+            return self._error(404, f"Unknown endpoint {name!r}; one of {sorted(ENDPOINTS)}.")
+        arrow = ARROW in self.headers.get("Accept", "") and _have_pyarrow()
+        try:
+            # Taken before computing: a change meanwhile can only make the answer newer than its tag
+            tag = version()
+            body = respond(name, url.query, arrow)
+        except (ValueError, KeyError, TypeError) as e:
+            return self._error(400, str(e))
+        except Exception as e:
+            return self._error(500, f"{type(e).__name__}: {e}")
+        self._send(200, body, ARROW if arrow else JSON, {VERSION_HEADER: tag})
+
+    def _error(self, status: int, message: str) -> None:
+        self._send(status, json.dumps({"error": message}).encode(), JSON)
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if LOG:
+            super().log_message(format, *args)
+
+
+class AnalyticsServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(host: str = HOST, port: int = PORT) -> AnalyticsServer:
+    """Bound server (port 0 picks a free one: see .server_address); call serve_forever()."""
+    return AnalyticsServer((host, port), Handler)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--no-warmup", action="store_true", help="skip the background cache warm-up")
+    args = ap.parse_args(argv)
+
+    prices = cached_closing_prices(universe)
+    if not args.no_warmup:
+        warmup.ensure_started(universe, sim_args=WARM_SIM_ARGS)
+    server = make_server(args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Serving {prices.shape[1]} tickers x {prices.shape[0]} days on http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
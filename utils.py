@@ -1,119 +1,109 @@
 # utils.py
 from __future__ import annotations
+import functools
+import importlib.util
 import os
 from pathlib import Path
-import io, zipfile
 import pandas as pd
-import requests
 
-# Optional: install yfinance once in the teacher's env (see requirements.txt)
-try:
-    import yfinance as yf
-except Exception:  # still let the app run; we'll just skip auto-downloads
-    yf = None
+import diagnostics
+import factors
+import loaders
+import price_store
+from profiles import YF_ALIAS
 
-# Resolve data dir relative to this file (not CWD), so it works anywhere
+# Optional: install yfinance once in the teacher's env (see requirements.txt).
+# It is not imported here: ingest.py loads it only when a CSV is actually
+# missing (it costs ~0.2s of every cold start otherwise). Without it, or with
+# PRICE_DOWNLOADS=0, the app just skips auto-downloads.
+DOWNLOADS = os.environ.get("PRICE_DOWNLOADS", "1") not in ("", "0")
+
+# Resolve data dir relative to this file (not CWD), so it works anywhere.
+# Created by the first download (ingest.py); a missing folder is an empty store.
 ROOT = Path(__file__).resolve().parent
 DATA_DIR = ROOT / "fixed_stock_data"
-DATA_DIR.mkdir(exist_ok=True)
+# Compiled columnar copy of DATA_DIR (see price_store.py); rebuilt on CSV changes
+STORE_DIR = ROOT / ".price_store"
 
-# Some symbols need remapping on Yahoo
-YAHOO_ALIAS = {
-    "BRK.B": "BRK-B",
-}
+# Some symbols need remapping on Yahoo; one map for prices and metadata
+YAHOO_ALIAS = YF_ALIAS
 
 def _csv_path(ticker: str) -> Path:
     return DATA_DIR / f"{ticker}.csv"
 
-def _ensure_local_csv(ticker: str, start="2020-01-01") -> bool:
+@functools.cache
+def _have_yfinance() -> bool:
+    return importlib.util.find_spec("yfinance") is not None
+
+def _ensure_local_csvs(tickers: list[str], start="2020-01-01") -> list[str]:
     """
-    Ensure we have <DATA_DIR>/<TICKER>.csv. If missing and yfinance is available,
-    download it. Return True if file exists after this call.
+    Ensure we have <DATA_DIR>/<TICKER>.csv for each ticker. Missing ones are
+    fetched in one concurrent, batched ingest run (see ingest.py) when yfinance
+    is available. Returns the tickers whose file exists after this call.
     """
-    path = _csv_path(ticker)
-    if path.exists():
-        return True
-    if yf is None:
-        return False
-
-    yahoo_symbol = YAHOO_ALIAS.get(ticker, ticker)
-    try:
-        df = yf.download(yahoo_symbol, start=start)
-        if df is None or df.empty:
-            return False
-        # Normalize to a simple CSV the app can read
-        out = df.reset_index()[["Date", "Close"]]
-        out.to_csv(path, index=False)
-        return True
-    except Exception:
-        return False
-
-def _read_close_series(csv_path: Path, start_date="2020-01-01") -> pd.Series:
-    df = pd.read_csv(csv_path)
-
-    if "Date" not in df.columns:
-        raise ValueError(f"{csv_path.name} has no 'Date' column.")
-
-    df["Date"] = pd.to_datetime(df["Date"])
-    df = df.set_index("Date").sort_index()
-
-    # Handle Nasdaq exports ("Close/Last") and Yahoo ("Close")
-    col = "Close/Last" if "Close/Last" in df.columns else "Close" if "Close" in df.columns else None
-    if col is None:
-        raise ValueError(f"{csv_path.name} has neither 'Close' nor 'Close/Last'.")
-
-    s = pd.to_numeric(df[col].replace({r"\$": ""}, regex=True), errors="coerce").dropna()
+    missing = [t for t in tickers if not _csv_path(t).exists()]
+    if missing and DOWNLOADS and _have_yfinance():
+        from ingest import ingest
+        try:
+            ingest(missing, start=start, incremental=False)
+        except Exception:
+            pass
+    return [t for t in tickers if _csv_path(t).exists()]
+
+def _ensure_local_csv(ticker: str, start="2020-01-01") -> bool:
+    """Single-ticker form of _ensure_local_csvs; True if the file exists after this call."""
+    return bool(_ensure_local_csvs([ticker], start=start))
+
+def _read_close_series(csv_path: Path, start_date: str | None = "2020-01-01") -> pd.Series:
+    # Nasdaq ("Close/Last", $-prefixed) and Yahoo ("Close") layouts, see loaders.py
+    s = loaders.read_close(csv_path)
+    if start_date is None:
+        return s
     return s.loc[s.index >= pd.to_datetime(start_date)]
 
-def closing_prices(stocks: list[str], start_date="2020-01-01") -> pd.DataFrame:
+def _read_full_close_series(csv_path: Path) -> pd.Series:
+    return _read_close_series(csv_path, start_date=None)
+
+def price_store_snapshot() -> price_store.PriceStore:
+    """Sync the compiled store with DATA_DIR (re-parsing only changed CSVs) and return it."""
+    return price_store.sync(DATA_DIR, STORE_DIR, _read_full_close_series)
+
+def closing_prices(stocks: list[str], start_date="2020-01-01", how: str = "ragged") -> pd.DataFrame:
     """
     stocks: list like ["AAPL.csv", "MSFT.csv", "JNJ.csv"] or ["AAPL", "MSFT", ...]
     Returns: DataFrame with tickers as columns and Close prices as values.
+    Each ticker keeps its full history (NaN before its first / after its last
+    price, see panel.py), so a short or delisted ticker no longer truncates
+    the others; how="inner" gives the old common-dates panel.
     Auto-downloads missing CSVs into fixed_stock_data when possible.
     """
-    series = {}
-    missing = []
-
+    tickers = []
     for item in stocks:
         # Accept 'AAPL.csv' or 'AAPL'
         ticker = Path(item).stem.upper()
+        if ticker not in tickers:
+            tickers.append(ticker)
 
-        # Ensure the CSV exists (download if needed)
-        ok = _ensure_local_csv(ticker, start=start_date)
-        csv_path = _csv_path(ticker)
+    # Ensure the CSVs exist (download if needed); the store picks new files up
+    with diagnostics.stage("download"):
+        _ensure_local_csvs(tickers, start=start_date)
 
-        if not ok and not csv_path.exists():
-            missing.append(ticker)
-            continue
-
-        try:
-            s = _read_close_series(csv_path, start_date=start_date)
-            series[ticker] = s
-        except Exception:
-            missing.append(ticker)
+    with diagnostics.stage("csv_sync"):
+        store = price_store_snapshot()
+    found = [t for t in tickers if t in store]
+    missing = [t for t in tickers if t not in store]
 
-    if not series:
+    if not found:
         return pd.DataFrame()
 
-    prices = pd.concat(series, axis=1).dropna()
-    prices.columns = list(series.keys())
+    # Close panel sliced straight out of the memory-mapped store
+    with diagnostics.stage("align"):
+        prices = store.frame(found, start=start_date, how=how)
 
     # Attach info for UI (callers can check .attrs.get("missing"))
     prices.attrs["missing"] = sorted(set(missing))
     return prices
 
 def ff3_factors(start_date="2020-01-01") -> pd.DataFrame:
-    url = "https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/F-F_Research_Data_Factors_daily_CSV.zip"
-    r = requests.get(url, timeout=60)
-    with zipfile.ZipFile(io.BytesIO(r.content)) as z:
-        with z.open(z.namelist()[0]) as f:
-            data = pd.read_csv(f, skiprows=3)
-
-    data = data.dropna()
-    data.columns = ["Date", "Mkt-RF", "SMB", "HML", "RF"]
-    data = data[data["Date"].astype(str).str.strip().str.isnumeric()]
-    data["Date"] = pd.to_datetime(data["Date"])
-    data = data.set_index("Date").sort_index()
-    for c in ["Mkt-RF", "SMB", "HML", "RF"]:
-        data[c] = data[c].astype(float) / 100.0
-    return data.loc[data.index >= pd.to_datetime(start_date)]
+    """Daily Fama-French 3 factors (Mkt-RF, SMB, HML, RF) from the local factor store."""
+    return factors.load_factors("ff3", start_date=start_date)
@@ -1,39 +1,143 @@
 # visuals.py
-import matplotlib.pyplot as plt
+import hashlib
+import io
+
+import numpy as np
+import pandas as pd
 import streamlit as st
 
-def plot_profit(profit_data, tickers, title="Cumulative Return"):
-    if not tickers:
-        st.warning("No portfolios selected to plot.")
-        return
-    fig, ax = plt.subplots(figsize=(12, 6))
-    profit_data[tickers].plot(ax=ax)
-    ax.set_title(title)
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Growth (Starting = 1.0)")
-    ax.grid(True)
-    st.pyplot(fig)
+import diagnostics
+from cache import cached
 
-def plot_volatility(volatility_data, tickers, title="Rolling Volatility"):
-    if not tickers:
-        st.warning("No portfolios selected to plot.")
-        return
-    fig, ax = plt.subplots(figsize=(12, 6))
-    volatility_data[tickers].plot(ax=ax)
+# Charts are drawn from series decimated to about one point per horizontal
+# pixel (LTTB for smooth lines, min/max per bucket for spiky daily returns),
+# rendered once to PNG on a pyplot-free Figure (nothing to close or leak) and
+# cached on (data hash, tickers, title). With interactive=True a Vega-Lite
+# spec over the same decimated data is sent instead of a PNG.
+
+FIG_SIZE = (12, 6)
+DPI = 100
+MAX_POINTS = FIG_SIZE[0] * DPI
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of n_out points that keep the visual shape."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo = edges[i + 1]
+        nxt_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Min and max of each of n_out/2 buckets, in time order (keeps every spike)."""
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    buckets = np.arange(n) * max(1, n_out // 2) // n
+    s = pd.Series(y)
+    grouped = s.groupby(buckets)
+    keep = np.union1d(grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy())
+    return np.union1d(keep, [0, n - 1])
+
+
+@diagnostics.timed("downsample")
+def downsample(data: pd.DataFrame, tickers, n_points: int = MAX_POINTS, method: str = "lttb") -> dict:
+    """{ticker: Series} with at most ~n_points points each, NaNs dropped."""
+    out = {}
+    for t in tickers:
+        s = data[t].dropna()
+        if len(s) > n_points:
+            y = s.to_numpy(dtype=np.float64)
+            if method == "minmax":
+                idx = minmax_indices(y, n_points)
+            else:
+                idx = lttb_indices(s.index.asi8.astype(np.float64), y, n_points)
+            s = s.iloc[idx]
+        out[t] = s
+    return out
+
+
+def _data_key(data: pd.DataFrame, tickers) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(data.index.asi8).tobytes())
+    h.update(np.ascontiguousarray(data[list(tickers)].to_numpy(dtype=np.float64)).tobytes())
+    return h.hexdigest()
+
+
+@diagnostics.timed("render_png")
+def _render_png(series: dict, title: str, ylabel: str) -> bytes:
+    # matplotlib is imported on the first PNG chart, not with the app (~0.5s)
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=FIG_SIZE, dpi=DPI)
+    ax = fig.subplots()
+    for t, s in series.items():
+        ax.plot(s.index, s.to_numpy(), label=t)
     ax.set_title(title)
     ax.set_xlabel("Date")
-    ax.set_ylabel("Volatility (Std. Dev.)")
+    ax.set_ylabel(ylabel)
     ax.grid(True)
-    st.pyplot(fig)
+    if series:
+        ax.legend()
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
 
-def plot_returns(returns_data, tickers, title="Daily Returns"):
+
+@diagnostics.timed("chart_spec")
+def chart_spec(series: dict, title: str, ylabel: str) -> tuple[pd.DataFrame, dict]:
+    """Long-form data + Vega-Lite spec for an interactive line chart."""
+    long = pd.concat(
+        [pd.DataFrame({"Date": s.index, "Value": s.to_numpy(), "Ticker": t}) for t, s in series.items()],
+        ignore_index=True,
+    ) if series else pd.DataFrame(columns=["Date", "Value", "Ticker"])
+    spec = {
+        "title": title,
+        "mark": {"type": "line", "tooltip": True},
+        "encoding": {
+            "x": {"field": "Date", "type": "temporal"},
+            "y": {"field": "Value", "type": "quantitative", "title": ylabel},
+            "color": {"field": "Ticker", "type": "nominal"},
+        },
+        "params": [{"name": "zoom", "select": "interval", "bind": "scales"}],
+    }
+    return long, spec
+
+
+def _plot(kind: str, data, tickers, title: str, ylabel: str, method: str, interactive: bool):
     if not tickers:
         st.warning("No portfolios selected to plot.")
         return
-    fig, ax = plt.subplots(figsize=(12, 6))
-    returns_data[tickers].plot(ax=ax)
-    ax.set_title(title)
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Daily Return")
-    ax.grid(True)
-    st.pyplot(fig)
+    tickers = list(tickers)
+    key = (kind, _data_key(data, tickers), tuple(tickers), title, interactive)
+    if interactive:
+        long, spec = cached(key, lambda: chart_spec(downsample(data, tickers, method=method), title, ylabel))
+        st.vega_lite_chart(long, spec, use_container_width=True)
+    else:
+        png = cached(key, lambda: _render_png(downsample(data, tickers, method=method), title, ylabel))
+        st.image(png)
+
+
+def plot_profit(profit_data, tickers, title="Cumulative Return", interactive=False):
+    _plot("profit", profit_data, tickers, title, "Growth (Starting = 1.0)", "lttb", interactive)
+
+
+def plot_volatility(volatility_data, tickers, title="Rolling Volatility", interactive=False):
+    _plot("volatility", volatility_data, tickers, title, "Volatility (Std. Dev.)", "lttb", interactive)
+
+
+def plot_returns(returns_data, tickers, title="Daily Returns", interactive=False):
+    _plot("returns", returns_data, tickers, title, "Daily Return", "minmax", interactive)
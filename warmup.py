@@ -0,0 +1,231 @@
+# warmup.py
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import diagnostics
+import factors
+from cache import (
+    COMPACT, cached_cumulative_return, cached_factor_loadings, cached_ff3_factors,
+    cached_horizon_index, cached_portfolio_engine, cached_prices_range, cached_returns,
+    cached_risk_simulation, cached_summary_stats, cached_volatility, data_version,
+)
+from horizons import TIME_RANGE_PRESETS, VOL_WINDOWS
+from portfolios import risk_portfolios_static
+
+# Background warm-up of the pipeline cache.
+#
+# The grid is every time preset x rolling-vol window x risk score. Each
+# combination is one task that touches everything the app's default view of
+# it needs: prices, returns, cumulative return, the vol window, the risk
+# portfolio, FF3 loadings, the summary table and the risk simulation. Shared
+# pieces are cache hits after the first task that builds them. Tasks run on a
+# small thread pool, most-used combinations first. Usage is counted per
+# combination by the app and kept in USAGE_FILE across restarts.
+#
+# ensure_started() is cheap and idempotent. It starts a pass once per process
+# and again whenever the price store or factor data version changes (a data
+# refresh). The versions are looked up at most every CHECK_SECONDS; calls in
+# between return at once. Tasks of a superseded pass are skipped.
+#   PIPELINE_WARMUP=0               disable
+#   PIPELINE_WARMUP_WORKERS=n       threads (default 1, so reruns keep the GIL most of the time)
+#   PIPELINE_WARMUP_CHECK_SECONDS=s data refresh check interval (default 10)
+
+ENABLED = os.environ.get("PIPELINE_WARMUP", "1") not in ("", "0")
+WORKERS = int(os.environ.get("PIPELINE_WARMUP_WORKERS", "1"))
+CHECK_SECONDS = float(os.environ.get("PIPELINE_WARMUP_CHECK_SECONDS", "10"))
+USAGE_FILE = Path(__file__).resolve().parent / ".warmup_usage.json"
+_USAGE_FLUSH_SECONDS = 30.0
+
+RISK_SCORES = tuple(sorted(risk_portfolios_static))
+
+
+def warm_combo(tickers, preset: str, window: int, risk_score: int, sim_args: dict | None = None,
+               start_date="2020-01-01") -> bool:
+    """Fill the cache for one (preset, window, risk score) view; False if the preset has no data."""
+    horizons = cached_horizon_index(tickers, start_date)
+    lo, hi = horizons.bounds(preset)
+    if hi - lo < 2:
+        return False
+    start, end = horizons.index[lo], horizons.index[hi - 1]
+    cached_prices_range(tickers, start, end, start_date)
+    returns = cached_returns(tickers, start, end, start_date)
+    # The app's default chart columns: nothing but the risk portfolio
+    lazy = [] if COMPACT else None
+    cached_cumulative_return(tickers, start, end, start_date, columns=lazy)
+    cached_volatility(tickers, start, end, window=window, start_date=start_date, columns=lazy)
+    selected = [t for t in risk_portfolios_static[risk_score] if t in returns.columns]
+    if selected:
+        cached_portfolio_engine(tickers, start, end, start_date).portfolio_returns({"RiskPortfolio": selected})
+    cached_ff3_factors(start_date)
+    cached_factor_loadings(tickers, start, end, start_date)
+    cached_summary_stats(tickers, horizon=preset, start_date=start_date)
+    if sim_args is not None:
+        cached_risk_simulation(tickers, start, end, start_date, **sim_args)
+    return True
+
+
+class WarmupScheduler:
+    def __init__(self, max_workers: int = WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="warmup")
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._version = None
+        self._checked = float("-inf")
+        self._state: dict = {"state": "idle", "total": 0, "done": 0, "failed": 0, "skipped": 0}
+        self._ready: set = set()
+        self._usage: dict[str, int] = self._load_usage()
+        self._usage_dirty = False
+        self._usage_flushed = time.monotonic()
+
+    # ---- usage -------------------------------------------------------------
+
+    @staticmethod
+    def _load_usage() -> dict[str, int]:
+        try:
+            return {k: int(v) for k, v in json.loads(USAGE_FILE.read_text(encoding="utf-8")).items()}
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def record_use(self, preset: str, window: int, risk_score: int) -> None:
+        key = f"{preset}|{int(window)}|{int(risk_score)}"
+        with self._lock:
+            self._usage[key] = self._usage.get(key, 0) + 1
+            self._usage_dirty = True
+            due = time.monotonic() - self._usage_flushed > _USAGE_FLUSH_SECONDS
+        if due:
+            self.flush_usage()
+
+    def flush_usage(self) -> None:
+        with self._lock:
+            if not self._usage_dirty:
+                return
+            text = json.dumps(self._usage)
+            self._usage_dirty = False
+            self._usage_flushed = time.monotonic()
+        try:
+            tmp = USAGE_FILE.with_name(USAGE_FILE.name + ".tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, USAGE_FILE)
+        except OSError:
+            pass
+
+    def _order(self, defaults: tuple) -> list[tuple]:
+        d_preset, d_window, d_risk = defaults
+        grid = [(p, w, r) for p in TIME_RANGE_PRESETS for w in VOL_WINDOWS for r in RISK_SCORES]
+        with self._lock:
+            usage = dict(self._usage)
+        return sorted(grid, key=lambda c: (
+            -usage.get(f"{c[0]}|{c[1]}|{c[2]}", 0), c[0] != d_preset, c[1] != d_window, abs(c[2] - d_risk),
+        ))
+
+    # ---- passes ------------------------------------------------------------
+
+    def ensure_started(self, tickers, defaults: tuple = ("Max", 5, 5), sim_args: dict | None = None,
+                       start_date="2020-01-01") -> bool:
+        """Start a warm-up pass unless one already ran for the current data version. True if started."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < CHECK_SECONDS:
+                return False
+            self._checked = now
+        tickers = tuple(tickers)
+        version = (data_version(tickers), factors.version("ff3"))
+        with self._lock:
+            if version == self._version:
+                return False
+            self._version = version
+            self._generation += 1
+            generation = self._generation
+            self._ready = set()
+        combos = self._order(defaults)
+        with self._lock:
+            self._state = {
+                "state": "running", "version": list(version), "total": len(combos), "done": 0, "failed": 0,
+                "skipped": 0, "started_at": time.time(), "finished_at": None, "errors": [],
+            }
+        for combo in combos:
+            self._pool.submit(self._run, generation, tickers, combo, sim_args, start_date)
+        return True
+
+    def _run(self, generation: int, tickers, combo: tuple, sim_args, start_date) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+        try:
+            ok = warm_combo(tickers, *combo, sim_args=sim_args, start_date=start_date)
+            error = None
+        except Exception as e:
+            ok, error = False, f"{combo}: {e!r}"
+        with self._lock:
+            if generation != self._generation:
+                return
+            s = self._state
+            if error is not None:
+                s["failed"] += 1
+                s["errors"] = (s["errors"] + [error])[-10:]
+            elif ok:
+                s["done"] += 1
+                self._ready.add(combo)
+            else:
+                s["skipped"] += 1
+            if s["done"] + s["failed"] + s["skipped"] >= s["total"]:
+                s["state"] = "done"
+                s["finished_at"] = time.time()
+
+    def progress(self) -> dict:
+        with self._lock:
+            out = dict(self._state)
+        finished = out.get("done", 0) + out.get("failed", 0) + out.get("skipped", 0)
+        out["fraction"] = finished / out["total"] if out.get("total") else 0.0
+        if out.get("started_at"):
+            out["elapsed"] = (out["finished_at"] or time.time()) - out["started_at"]
+        return out
+
+    def ready(self, preset: str, window: int, risk_score: int) -> bool:
+        with self._lock:
+            return (preset, int(window), int(risk_score)) in self._ready
+
+
+_scheduler: WarmupScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def scheduler() -> WarmupScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = WarmupScheduler()
+        return _scheduler
+
+
+def _gauges() -> dict:
+    p = progress()
+    return {k: p[k] for k in ("total", "done", "failed", "skipped", "fraction") if k in p}
+
+
+diagnostics.register_gauges("warmup", _gauges)
+
+
+def ensure_started(tickers, defaults: tuple = ("Max", 5, 5), sim_args: dict | None = None,
+                   start_date="2020-01-01") -> bool:
+    if not ENABLED:
+        return False
+    return scheduler().ensure_started(tickers, defaults, sim_args, start_date)
+
+
+def record_use(preset: str, window: int, risk_score: int) -> None:
+    if ENABLED:
+        scheduler().record_use(preset, window, risk_score)
+
+
+def progress() -> dict:
+    return scheduler().progress() if ENABLED else {"state": "disabled"}
+
+
+def ready(preset: str, window: int, risk_score: int) -> bool:
+    return ENABLED and scheduler().ready(preset, window, risk_score)